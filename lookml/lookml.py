@@ -1,7 +1,10 @@
-import re, os, shutil
+import re, os, shutil, bisect
 import lookml.config as conf
 import lkml
 import time, copy
+import lookml.modules.cache as cache
+import lookml.modules.references as references
+import lookml.modules.resolver as resolver
 from string import Template
 from lookml.modules.project import *
 import lkml, github
@@ -26,6 +29,24 @@ def tidy(string):
     return re.sub(r'\s{10,}', r'\n  ', string)
     # return string
 
+def tidyChunks(chunks):
+    '''
+    streaming version of tidy. Whitespace at the end of each chunk is held back until the next one arrives, so a run of
+    whitespace spanning chunks is trimmed exactly as tidy would trim the joined string
+
+    :return: generator of tidied chunks
+    :rtype: generator of str
+    '''
+    pending = ''
+    for chunk in chunks:
+        chunk = pending + chunk
+        body = chunk.rstrip()
+        pending = chunk[len(body):]
+        if body:
+            yield tidy(body)
+    if pending:
+        yield tidy(pending)
+
 def lookCase(string):
     return removeSpace(snakeCase(string))
 
@@ -40,21 +61,172 @@ def stringify(collection,delim=conf.NEWLINEINDENT, prefix=True, postfix=False):
     # return delim + delim.join([str(item) for item in collection])
     return  (delim if prefix else '') + delim.join([str(item) for item in collection]) + (delim if postfix else '')
 
+def stringifyChunks(collection,delim=conf.NEWLINEINDENT, prefix=True, postfix=False, raw=False):
+    '''
+        same output as stringify, but yields the delimiters and each item's chunks instead of joining them
+        raw=True takes the items' text before whitespace normalization, for a container which normalizes the whole once
+    '''
+    if prefix:
+        yield delim
+    for i, item in enumerate(collection):
+        if i:
+            yield delim
+        if raw and hasattr(item, '_rawChunks'):
+            yield from item._rawChunks()
+        elif hasattr(item, 'chunks'):
+            yield from item.chunks()
+        else:
+            yield str(item)
+    if postfix:
+        yield delim
+
+class renderPlan:
+    '''
+        A template from conf.TEMPLATES compiled once into its literal text and placeholders, so rendering an object is a 
+        single format call rather than building and scanning a new string.Template every time
+    '''
+    def __init__(self, template):
+        self.template = template
+        self.parts = []
+        formatString = []
+        last = 0
+        for match in Template.pattern.finditer(template):
+            self.literal(template[last:match.start()], formatString)
+            last = match.end()
+            if match.group('escaped') is not None:
+                self.literal(Template.delimiter, formatString)
+                continue
+            name = match.group('named') or match.group('braced')
+            if name is None:
+                raise ValueError('Invalid placeholder in template: ' + template)
+            self.parts.append((True, name))
+            formatString.append('{' + name + '}')
+        self.literal(template[last:], formatString)
+        self.formatString = ''.join(formatString)
+
+    def literal(self, text, formatString):
+        if text:
+            self.parts.append((False, text))
+            formatString.append(text.replace('{', '{{').replace('}', '}}'))
+
+    def render(self, mapping):
+        ''' same result as Template(template).substitute(mapping) '''
+        return self.formatString.format_map(mapping)
+
+    def chunks(self, mapping):
+        '''
+            renders a piece at a time. mapping values can be strings or iterables of string chunks, 
+            which are passed through without being joined
+        '''
+        for isPlaceholder, text in self.parts:
+            if not isPlaceholder:
+                yield text
+            else:
+                value = mapping[text]
+                if isinstance(value, str):
+                    yield value
+                else:
+                    yield from value
+
+_renderPlans = {}
+
+def getRenderPlan(token):
+    '''
+    returns the compiled plan for a template name in conf.TEMPLATES. Plans are built on first use and rebuilt 
+    only if the template in conf.TEMPLATES is changed
+    '''
+    template = getattr(conf.TEMPLATES, token)
+    plan = _renderPlans.get(token)
+    if plan is None or plan.template is not template:
+        plan = _renderPlans[token] = renderPlan(template)
+    return plan
+
+#one group per reference form, only the group of the form that matched is set so match.lastindex finds it
+_referenceRe = re.compile(r'\$\{([a-z\._0-9]*)\}|\{\%\s{1,3}condition\s([a-z\._0-9]*)\s\%\}|\{\%\s{1,3}parameter\s([a-z\._0-9]*)\s\%\}|\{\{\s{0,10}([a-z\._0-9]*)\s{0,10}\}\}| \_filters\[\s{0,10}\'([a-z\._0-9]*)\'\]')
+
+def findReferences(strings, offsets=False):
+    '''
+    finds the lookml references in one string or many at once (i.e. every sql value of a view).
+    The strings are scanned in a single pass, joined on a character no reference form can span
+
+    :param strings: sql, html etc.
+    :param offsets: also return where each reference starts (in the joined text when several strings are passed)
+    :type strings: str or iterable of str
+    :type offsets: bool
+    :return: (raw, field, fully_qualified_reference) for every reference in order, i.e. ('${exact.field_reference}', 'exact.field_reference', True),
+        with the start offset appended when offsets is True
+    :rtype: list of tuples
+    '''
+    text = strings if isinstance(strings, str) else '\0'.join(strings)
+    found = []
+    for match in _referenceRe.finditer(text):
+        field = match.group(match.lastindex)
+        #Check if a fully qualified reference was used
+        fq = '.' in field
+        #Replace the liquid value references
+        if field.endswith('._value'):
+            field = field.replace('._value','')
+        found.append((match.group(0), field, fq, match.start()) if offsets else (match.group(0), field, fq))
+    return found
+
 def parseReferences(inputString):
     '''
     Uses regular expresssions to preduce an iterator of the lookml references in a string.
     result has the shape {'raw':'${exact.field_reference}','field':'exact.field_reference', fully_qualified_reference:True}
     '''
-    for match in re.findall(r'(\$\{([a-z\._0-9]*)\}|\{\%\s{1,3}condition\s([a-z\._0-9]*)\s\%\}|\{\%\s{1,3}parameter\s([a-z\._0-9]*)\s\%\}|\{\{\s{0,10}([a-z\._0-9]*)\s{0,10}\}\}| \_filters\[\s{0,10}\'([a-z\._0-9]*)\'\])',inputString):
-        #Collapse the results from findall
-        result = ''.join(match[1:])
-        #Replace the liquid value references
-        if result.endswith('._value'):
-            result = result.replace('._value','')
-        #Check if a fully qualified reference was used
-        fq = True if '.' in ''.join(match[1:]) else False
+    for raw, field, fq in findReferences(inputString):
+        yield {'raw':raw,'field':field, 'fully_qualified_reference': fq }
 
-        yield {'raw':match[0],'field':result, 'fully_qualified_reference': fq }
+def renameReferences(inputString, old, new, view=None):
+    '''
+    rewrites the references to one field in a string, in every form parseReferences finds (${}, liquid, condition, _filters),
+    keeping the way each one was written (qualified or not, liquid attributes like ._value).
+    Given bare view names instead, every reference qualified with the old view is moved to the new one
+
+    :param inputString: sql, html etc.
+    :param old: the field's current name, fully qualified i.e. 'order_items.sale_price' (or a view name)
+    :param new: its new name, fully qualified (or a view name)
+    :param view: the view the string belongs to, unqualified references are to fields in it
+    :type inputString: str
+    :type old: str
+    :type new: str
+    :type view: str
+    :return: the rewritten string
+    :rtype: str
+    '''
+    oldView, renamingField, oldField = old.partition('.')
+    newView, _, newField = new.partition('.')
+    def swap(match):
+        group = match.lastindex
+        if not match.group(group):
+            return match.group(0)
+        reference, dot, attribute = match.group(group).partition('._')
+        if not renamingField:
+            qualifier, qualified, name = reference.partition('.')
+            if not qualified or qualifier != oldView:
+                return match.group(0)
+            replacement = newView + '.' + name
+        elif reference == old:
+            replacement = new
+        elif reference == oldField and view == oldView:
+            replacement = newField if newView == view else new
+        else:
+            return match.group(0)
+        start, end = match.start(group) - match.start(0), match.end(group) - match.start(0)
+        return match.group(0)[:start] + replacement + dot + attribute + match.group(0)[end:]
+    return _referenceRe.sub(swap, inputString)
+
+def _load_lkml(path, parseCache=None):
+    '''
+    parses the lkml file at path and returns the raw json_data. Kept at module level (and picklable) so it can be
+    handed to worker processes when a project is loaded in parallel. If a parse cache is passed the file is 
+    looked up by its git blob sha and only parsed on a miss
+    '''
+    if parseCache is None:
+        with open(path, 'r') as tmp:
+            return lkml.load(tmp)
+    with open(path, 'rb') as tmp:
+        return parseCache.load(tmp.read())
 
 class File:
     '''
@@ -65,6 +237,7 @@ class File:
     class view_collection:
         '''
             A container for views which allows us to use .operator syntax 
+            Views are held as raw lkml and only become View objects when accessed or iterated
         '''
         def __init__(self,viewlist):
             self.views = {}
@@ -72,15 +245,21 @@ class File:
                 self.add(view)
 
         def __getattr__(self,key):
-            return self.views[key]
+            view = self.views[key]
+            #raw lkml is only built into a View the first time it's touched
+            if isinstance(view,dict):
+                view = View(view)
+                self.views[key] = view
+            return view
 
         def __getitem__(self,key):
             return self.__getattr__(key)
 
         def add(self, v):
             if isinstance(v,dict):
-                v = View(v)
-            self.views.update({v.name:v})
+                self.views.update({v['name']:v})
+            else:
+                self.views.update({v.name:v})
             return self
 
         def remove(self, v):
@@ -90,7 +269,7 @@ class File:
             return self
 
         def __iter__(self):
-            self.iterPointer = iter(self.views.values())
+            self.iterPointer = (self.__getattr__(key) for key in list(self.views.keys()))
             return self
 
         def __next__(self):
@@ -101,6 +280,7 @@ class File:
     class explore_collection:
         '''
             A container for explores which allows us to use .operator syntax 
+            Explores are held as raw lkml and only become Explore objects when accessed or iterated
         '''
         def __init__(self,explorelist):
             self.explores = {}
@@ -108,15 +288,21 @@ class File:
                 self.add(explore)
 
         def __getattr__(self,key):
-            return self.explores[key]
+            explore = self.explores[key]
+            #raw lkml is only built into a Explore the first time it's touched
+            if isinstance(explore,dict):
+                explore = Explore(explore)
+                self.explores[key] = explore
+            return explore
 
         def __getitem__(self,key):
             return self.__getattr__(key)
 
         def add(self, e):
             if isinstance(e,dict):
-                e = Explore(e)
-            self.explores.update({e.name:e})
+                self.explores.update({e['name']:e})
+            else:
+                self.explores.update({e.name:e})
             return self
 
         def remove(self, e):
@@ -126,7 +312,7 @@ class File:
             return self
 
         def __iter__(self):
-            self.iterPointer = iter(self.explores.values())
+            self.iterPointer = (self.__getattr__(key) for key in list(self.explores.keys()))
             return self
 
         def __next__(self):
@@ -134,7 +320,13 @@ class File:
                 return next(self.iterPointer)
             except:
                 raise StopIteration
-    def __init__(self, f):
+    def __init__(self, f, json_data=None, lazy=False):
+        '''
+        :param f: a View, an Explore, a path on disk or a github ContentFile
+        :param json_data: optional, already parsed lkml for a path (i.e. parsed in a worker process), skips the parse step
+        :param lazy: if True a path or github file only sets its name, path and sha. Reading and parsing happen the first time
+            views, explores or properties are accessed
+        '''
         def githubBootstrap():
             #custom initialization for github_api type
             #Set Basic Attributes
@@ -142,9 +334,6 @@ class File:
             self.sha = f._rawData['sha']
             self.base_name = self.name.replace(".model.lkml", "").replace(".explore.lkml", "").replace(".view.lkml", "")
             self.path = f._rawData['path']
-            #Parse Step: Github content is returned base64 encoded
-            data = base64.b64decode(f.content).decode('ascii')
-            self.json_data = lkml.load(data)
 
         def filepathBootstrap():
             #custom initialization for path type
@@ -159,9 +348,6 @@ class File:
                 self.base_name = '.'.join(self.name_components[:-2])
             self.path = os.path.relpath(f)
             self.sha = ''
-            #Parse Step: file is provided 
-            with open(self.path, 'r') as tmp:
-                self.json_data = lkml.load(tmp)
 
         def viewBootstrap():
             #custom initialization for path type
@@ -170,9 +356,6 @@ class File:
             self.base_name = f.name
             self.path = self.name
             self.sha = ''
-            #load as json_Data for compatibility with the rest of the class
-            #TODO: revist if this is needed to convert back and forth or if another more direct method would be preferable
-            self.json_data = lkml.load(str(f))
 
         def exploreBootstrap():
             #custom initialization for path type
@@ -181,9 +364,6 @@ class File:
             self.base_name = f.name
             self.path = self.name
             self.sha = ''
-            #load as json_Data for compatibility with the rest of the class
-            #TODO: revist if this is needed to convert back and forth or if another more direct method would be preferable
-            self.json_data = lkml.load(str(f))
 
         #Step 1 -- Data Type introspection
         if isinstance(f, github.ContentFile.ContentFile):
@@ -204,24 +384,73 @@ class File:
             self.filetype = self.name.split('.')[-2]
         else:
             raise Exception("Unsupported filename " + self.name)
-            
-        if 'views' in self.json_data.keys():
-            self.vws = self.view_collection(self.json_data['views'])
-            self.json_data.pop('views')
+
+        #Step 3 -- parse and bind the content, lazy files wait for the first access (see __getattr__)
+        self._source = f
+        self._pending_json_data = json_data
+        if not lazy or self.f_type in ('view', 'explore'):
+            self._load()
+
+    def _parse(self):
+        ''' returns the json_data for the file's source '''
+        f = self._source
+        if self._pending_json_data is not None:
+            return self._pending_json_data
+        elif self.f_type == 'github_api':
+            #Github content is returned base64 encoded, the parse cache is keyed on the sha github already gives us
+            parseCache = cache.active()
+            json_data = parseCache.get(self.sha) if parseCache else None
+            if json_data is None:
+                data = base64.b64decode(f.content).decode('ascii')
+                json_data = lkml.load(data)
+                if parseCache:
+                    parseCache.put(self.sha, json_data)
+            return json_data
+        elif self.f_type == 'path':
+            return _load_lkml(f, cache.active())
         else:
+            #a View or Explore is attached as is (see _load), there is nothing to parse
+            return {}
+
+    def _load(self):
+        ''' parses the source and binds its views, explores and properties, only ever runs once '''
+        self.json_data = self._parse()
+        f = self._source
+        del self._source
+        del self._pending_json_data
+
+        #Objects are bound directly, rendering them to lkml and parsing it back would only build a copy
+        if self.f_type == 'view':
+            self.vws = self.view_collection([f])
+            self.exps = self.explore_collection({})
+        elif self.f_type == 'explore':
             self.vws = self.view_collection({})
-        if 'explores' in self.json_data.keys():
-            self.exps = self.explore_collection(self.json_data['explores'])
-            self.json_data.pop('explores')
+            self.exps = self.explore_collection([f])
         else:
-            self.exps = self.explore_collection({})
+            if 'views' in self.json_data.keys():
+                self.vws = self.view_collection(self.json_data['views'])
+                self.json_data.pop('views')
+            else:
+                self.vws = self.view_collection({})
+            if 'explores' in self.json_data.keys():
+                self.exps = self.explore_collection(self.json_data['explores'])
+                self.json_data.pop('explores')
+            else:
+                self.exps = self.explore_collection({})
 
         self.properties = Properties(self.json_data)
         self.props = self.properties.props()
 
+    def isLoaded(self):
+        ''' False for a lazy file which hasn't been read and parsed yet '''
+        return '_source' not in self.__dict__
+
     def __getattr__(self, key):
         if key in self.__dict__.keys():
             return self.__dict__[key]
+        elif key in ('json_data', 'vws', 'exps', 'properties', 'props') and '_source' in self.__dict__:
+            self._load()
+            return self.__dict__[key]
         elif key == 'views':
             return self.vws
         elif key == 'explores':
@@ -240,13 +469,21 @@ class File:
             return self.exps
 
     def __str__(self):
-        return splice(
-             conf.NEWLINE.join([str(p) for p in self.properties.getProperties()])
-            ,conf.NEWLINE
-            ,conf.NEWLINE.join([ str(e) for e in self.explores] ) if self.exps else ''
-            ,conf.NEWLINE
-            ,conf.NEWLINE.join([ str(v) for v in self.views]) if self.vws else ''
-        )
+        return ''.join(self.chunks())
+
+    def chunks(self):
+        '''
+        renders the file a piece at a time (each property, then each field / join of the explores and views)
+        so the whole file never has to be held as one string
+
+        :return: generator of lkml text
+        :rtype: generator of str
+        '''
+        yield from stringifyChunks(self.properties.getProperties(), delim=conf.NEWLINE, prefix=False)
+        yield conf.NEWLINE
+        yield from stringifyChunks(self.explores, delim=conf.NEWLINE, prefix=False)
+        yield conf.NEWLINE
+        yield from stringifyChunks(self.views, delim=conf.NEWLINE, prefix=False)
 
     def setSha(self,sha):
         self.sha = sha
@@ -260,20 +497,41 @@ class File:
         self.exps.add(e)
         return self
 
-    def _bind_lkml(self, lkmldictraw):
-        lkmldict = copy.deepcopy(lkmldictraw)
-        if 'views' in lkmldict.keys():
-            for view in lkmldict['views']:
-                self.vws.add(View(view))
-            lkmldict.pop('views')
+    def getFieldsByTag(self, tag):
+        '''
+        returns the fields with a tag in all of this file's views
+
+        :param tag: the tag
+        :type tag: str
+        :return: tagged fields
+        :rtype: generator of Fields
+        '''
+        for view in self.views:
+            yield from view.getFieldsByTag(tag)
 
-        if 'explores' in lkmldict.keys():
-            for explore in lkmldict['explores']:
-                self.exps.add(Explore(explore))
-            lkmldict.pop('explores')
+    def where(self, **criteria):
+        '''
+        returns the fields in all of this file's views whose properties have all the values given (see View.where)
 
+        :param criteria: property name = value pairs
+        :type criteria: str
+        :return: matching fields
+        :rtype: generator of Fields
+        '''
+        for view in self.views:
+            yield from view.where(**criteria)
+
+    def _bind_lkml(self, lkmldict):
+        #lkmldict is only read, never modified
         for k,v in lkmldict.items():
-            self.setProperty(k,v) 
+            if k == 'views':
+                for view in v:
+                    self.vws.add(View(view))
+            elif k == 'explores':
+                for explore in v:
+                    self.exps.add(Explore(explore))
+            else:
+                self.setProperty(k,v) 
 
     def __add__(self, other):
         if isinstance(other, View):
@@ -297,21 +555,22 @@ class File:
         return self
 
     def write(self,overWriteExisting=True):
-        ''' Checks to see if the file exists before writing'''
-        print("Writing to: %s" % (self.path) )
-        if overWriteExisting:
-            with open(self.path, 'w') as opened_file:
-                try:
-                    opened_file.write(self.__str__())
-                except:
-                    pass
-        else:
+        '''
+        Checks to see if the file exists before writing, the file is streamed to disk as it renders.
+        The text goes to a temporary file next to the target which replaces it once complete, so a failure
+        while rendering raises and leaves any existing file as it was
+        '''
+        if overWriteExisting or not os.path.exists(self.path):
+            partial = self.path + '.partial'
             try:
-                fh = open(self.path, 'r')
-                fh.close()
-            except FileNotFoundError:
-                with open(self.path, 'w') as opened_file:
-                    opened_file.write(self.__str__())
+                with open(partial, 'w') as opened_file:
+                    for chunk in self.chunks():
+                        opened_file.write(chunk)
+                os.replace(partial, self.path)
+            finally:
+                #only left behind when the render or the write failed
+                if os.path.exists(partial):
+                    os.remove(partial)
 
 class base(object):
     class _model:
@@ -326,6 +585,9 @@ class base(object):
         pass
 		# 
 
+    #the attributes every lookml object has are slots, so fields carry no instance __dict__ (views, explores etc. still get one)
+    __slots__ = ('identifier', 'properties', 'message', 'token', 'indentLevel', 'valueiterator')
+
     #CU (much more at once?
     def __add__(self, other):
         self._bind_lkml(lkml.load(other))
@@ -348,14 +610,15 @@ class base(object):
             self.setName(input)
         elif isinstance(input,dict):
             self._bind_lkml(input)
-        self.templateMap = {}
         
     def _bind_lkml(self, lkmldict):
-            # self.setName(lkmldict.pop('name'))
-            if 'name' in lkmldict.keys():
-                self.setName(lkmldict.pop('name'))
+            #lkmldict is only read, never modified, but its lists and dicts are not copied: the properties keep them
+            #and edit them in place from then on. The parse cache hands out a structure of its own on every load
             for k,v in lkmldict.items():
-                self.setProperty(k,v) 
+                if k == 'name':
+                    self.setName(v)
+                else:
+                    self.setProperty(k,v) 
 
     def setName(self, name):
         '''
@@ -403,7 +666,7 @@ class base(object):
 
     def unSetProperty(self, name):
         ''''''
-        self.properties.__del__(name)
+        self.properties.__delete__(name)
         return self
 
     def getProperties(self):
@@ -439,14 +702,68 @@ class base(object):
             raise StopIteration
 
     def __str__(self):
-        self.templateMap = {
+        text = self._render()
+        return tidy(text) if conf.TIDY_OUTPUT else text
+
+    def _render(self):
+        '''
+        the lkml text before whitespace is normalized. A view normalizes the text of all its fields in one pass,
+        so fields are only tidied by __str__ when they are rendered on their own
+        '''
+        #the map is local, keeping it on the instance would hold a copy of the rendered text for every field after a write
+        props = [ conf.INDENT + str(p) for p in self.getProperties()]
+        templateMap = {
              'message': self.getMessage()
             ,'identifier': self.identifier
-            # ,'props': stringify([ conf.INDENT + str(p) for p in self.getProperties() if len(self) == 2])
-            ,'props': stringify([ conf.INDENT + str(p) for p in self.getProperties()], prefix=(len(self) > 2))
+            ,'props': stringify(props, prefix=(len(props) > 2))
             ,'token': self.token
         }
-        return tidy(Template(getattr(conf.TEMPLATES,self.token)).substitute(**self.templateMap))
+        return getRenderPlan(self.token).render(templateMap)
+
+    def chunks(self):
+        yield self.__str__()
+
+    def _rawChunks(self):
+        yield self._render()
+
+class _sortedFields:
+    '''
+        The fields of one type in a view, kept sorted by identifier as fields are added, removed and renamed,
+        so iterating or rendering them never needs a scan of the whole view or a sort
+    '''
+    def __init__(self):
+        self.keys = []
+        self.fields = []
+
+    def add(self, field):
+        i = bisect.bisect_right(self.keys, field.identifier)
+        self.keys.insert(i, field.identifier)
+        self.fields.insert(i, field)
+
+    def remove(self, field, identifier=None):
+        i = self.index(field, field.identifier if identifier is None else identifier)
+        if i is not None:
+            del self.keys[i]
+            del self.fields[i]
+
+    def rename(self, field, old):
+        self.remove(field, old)
+        self.add(field)
+
+    def index(self, field, identifier):
+        i = bisect.bisect_left(self.keys, identifier)
+        while i < len(self.keys) and self.keys[i] == identifier:
+            if self.fields[i] is field:
+                return i
+            i += 1
+        return None
+
+    def __iter__(self):
+        #iterates a copy, so the view can be changed while looping over its fields
+        return iter(list(self.fields))
+
+    def __len__(self):
+        return len(self.fields)
 
 class View(base):
     '''
@@ -461,6 +778,19 @@ class View(base):
     '''
     def __init__(self, input):
         self._fields = {}
+        self._fieldsByType = {fieldType: _sortedFields() for fieldType in (Dimension, DimensionGroup, Measure, Filter, Parameter)}
+        #(property name, value) -> the fields with that value, for every property with a single string value
+        self._propertyIndex = {}
+        #tag -> the fields with that tag, and each tagged field's tags as of the last update
+        self._tagIndex = {}
+        self._fieldTags = {}
+        #dependency graph: referenced name -> the fields referencing it, and each field -> the names it references.
+        #fields of this view are keyed by bare name, fields of other views by view.field
+        self._dependents = {}
+        self._dependencies = {}
+        #expanded sql of the fields, built on first use and dropped whenever a field's sql / type or the view's table changes (see expandedSql)
+        self._sqlExpander = None
+        self._sqlTable = None
         self.primaryKey = ''
         self.message = ''
         self.children = {}
@@ -470,68 +800,51 @@ class View(base):
 
 
     def __str__(self):
-        self.templateMap = {
+        return ''.join(self.chunks())
+
+    def chunks(self):
+        '''
+        renders the view a piece at a time: the header and properties, then each field, sets and any extended children.
+        Whitespace is normalized in a single pass over the stream, fields and children are not tidied on their own first
+
+        :return: generator of lkml text
+        :rtype: generator of str
+        '''
+        return tidyChunks(self._rawChunks()) if conf.TIDY_OUTPUT else self._rawChunks()
+
+    def _rawChunks(self):
+        ''' the chunks of the view before whitespace normalization '''
+        sections = {
              'message':self.getMessage()
             ,'token':self.token 
             ,'identifier':self.identifier
             ,'props': stringify([str(p) for p in self.getProperties() if p.name != "sets"]) 
-            ,'parameters':stringify(sortMe(self.parameters()))
-            ,'filters': stringify(sortMe(self.filters()))
-            ,'dimensions': stringify(sortMe(self.dims()))
-            ,'dimensionGroups': stringify(sortMe(self.dimensionGroups()))
-            ,'measures': stringify(sortMe(self.measures()))
+            ,'parameters':stringifyChunks(self.parameters(), raw=True)
+            ,'filters': stringifyChunks(self.filters(), raw=True)
+            ,'dimensions': stringifyChunks(self.dims(), raw=True)
+            ,'dimensionGroups': stringifyChunks(self.dimensionGroups(), raw=True)
+            ,'measures': stringifyChunks(self.measures(), raw=True)
             ,'sets': stringify([str(p) for p in self.getProperties() if p.name == "sets"]) 
-            ,'children': stringify(self.children.values()) if self.children else ''
+            ,'children': stringifyChunks(self.children.values(), raw=True) if self.children else ''
         } 
-        return tidy(Template(getattr(conf.TEMPLATES,self.token)).substitute(**self.templateMap))
+        return getRenderPlan(self.token).chunks(sections)
 
     def _bind_lkml(self,jsonDict):
-        t = 'measures'
-        if t in jsonDict.keys():
-            for field in jsonDict[t]:
-                self + Measure(field)
-                
-            jsonDict.pop(t)
-        else:
-            pass
-
-        t = 'dimensions'
-        if t in jsonDict.keys():
-            for field in jsonDict[t]:
-                self + Dimension(field)
-                
-            jsonDict.pop(t)
-        else:
-            pass
-        
-        t = 'filters'
-        if t in jsonDict.keys():
-            for field in jsonDict[t]:
-                self + Filter(field)
-            
-            jsonDict.pop(t)
-        else:
-            pass
-
-        t = 'dimension_groups'
-        if t in jsonDict.keys():
-            for field in jsonDict[t]:
-                self + DimensionGroup(field)
-            
-            jsonDict.pop(t)
-        else:
-            pass
-
-        t = 'parameters'
-        if t in jsonDict.keys():
-            for field in jsonDict[t]:
-                self + Parameter(field)
-
-            jsonDict.pop(t)
-        else:
-            pass
-
-        super()._bind_lkml(jsonDict)
+        #jsonDict is only read, never modified
+        #named first so references to this view's own fields are recognised as its fields are added
+        if 'name' in jsonDict:
+            self.setName(jsonDict['name'])
+        for t, fieldType in (
+                 ('measures', Measure)
+                ,('dimensions', Dimension)
+                ,('filters', Filter)
+                ,('dimension_groups', DimensionGroup)
+                ,('parameters', Parameter)
+            ):
+            for field in jsonDict.get(t, ()):
+                self + fieldType(field)
+
+        super()._bind_lkml({k: v for k, v in jsonDict.items() if k not in ('measures','dimensions','filters','dimension_groups','parameters')})
 
 
     def getFieldsSorted(self):
@@ -648,16 +961,14 @@ class View(base):
 
     def getFieldsByTag(self,tag):
         '''
-        :param arg1: description
-        :param arg2: description
-        :type arg1: type description
-        :type arg1: type description
-        :return: return description
-        :rtype: the return type description
+        returns the fields with a tag, looked up in an index kept current by addTag / removeTag and tag assignment
+
+        :param tag: the tag
+        :type tag: str
+        :return: the tagged fields sorted by name
+        :rtype: generator of Fields
         '''
-        for field in self.fields():
-            if tag in field.tags:
-                yield field
+        return iter(sortMe(self._tagIndex.get(tag, ())))
 
     def fields(self):
         '''
@@ -690,16 +1001,16 @@ class View(base):
 
     def getFieldsByType(self, t):
         '''
-        represents a view onject in LookML
+        returns the fields of a type (i.e. 'number' or 'sum') in the order they are declared in the view.
+        Membership comes from the property index (see where), so no field's type is rendered to compare it
 
-        :param arg1: description
-        :param arg2: description
-        :type arg1: type description
-        :type arg1: type description
-        :return: return description
-        :rtype: the return type description
+        :param t: the type
+        :type t: str
+        :return: the fields of that type
+        :rtype: generator of Fields
         '''
-        return filter(lambda field: str(field.type) == 'type: '+ t, list(self._fields.values()))
+        matches = self._propertyIndex.get(('type', t), set())
+        return (field for field in self._fields.values() if field in matches)
 
     def sumAllNumDimensions(self):
         '''
@@ -774,7 +1085,13 @@ class View(base):
         '''
         # '''Takes a field object as an argument and adds it to the view, if the field is a dimension and primary key it will be set as the view primary key'''
         # uses the 'setView' method on field which returns self so that field can fully qualify itself and so that field can be a member of view
+        replaced = self._fields.get(field.identifier)
+        if replaced is not None:
+            self._fieldsOfType(replaced, lambda bucket: bucket.remove(replaced))
+            self._indexField(replaced, remove=True)
         self._fields.update({field.identifier: field.setView(self)})
+        self._fieldsOfType(field, lambda bucket: bucket.add(field))
+        self._indexField(field)
         # If a primary key is added it will overwrite the existing primary key....
         if isinstance(field, Dimension):
             if field.isPrimaryKey():
@@ -794,21 +1111,168 @@ class View(base):
         '''
         # '''Removes a field, either by object or by string of identifier, safely checks and de-refs primary key'''
         def pk(k):
-            if k.isPrimaryKey():
+            if isinstance(k,Dimension) and k.isPrimaryKey():
                 self.unSetPrimaryKey()
+        def pop(key):
+            removed = self._fields.pop(key, None)
+            if removed is not None:
+                self._fieldsOfType(removed, lambda bucket: bucket.remove(removed))
+                self._indexField(removed, remove=True)
+            return removed
         if isinstance(field,Field):
             if isinstance(field,Dimension):
                 pk(field)
             pk(self.field(field.identifier))
-            return self._fields.pop(field.identifier, None)
+            return pop(field.identifier)
         elif isinstance(field,str):
             dimToDel = self.field(field)
             if isinstance(dimToDel,Dimension):
                 pk(dimToDel)
-            return self._fields.pop(field, None)
+            return pop(field)
         else:
             raise Exception('Not a string or Field instance provided')
 
+    def _fieldsOfType(self, field, action):
+        ''' applies action to the sorted bucket the field belongs in (if it is one of the 5 field types) '''
+        for fieldType, bucket in self._fieldsByType.items():
+            if isinstance(field, fieldType):
+                return action(bucket)
+
+    def _fieldRenamed(self, field, old):
+        ''' called by Field.setName so the field keeps its place in the sort order '''
+        self._fieldsOfType(field, lambda bucket: bucket.rename(field, old))
+        self._sqlExpander = None
+
+    def _indexField(self, field, remove=False):
+        for name, value in field.properties.schema.items():
+            if isinstance(value, str):
+                if remove:
+                    self._propertyChanged(field, name, value, None)
+                else:
+                    self._propertyChanged(field, name, None, value)
+        self._retag(field, remove=remove)
+        self._link(field, remove=remove)
+
+    def _link(self, field, remove=False):
+        ''' replaces the dependency graph edges out of a field with the references in its current sql / html '''
+        self._sqlExpander = None
+        for key in self._dependencies.pop(field, ()):
+            entry = self._dependents[key]
+            entry.discard(field)
+            if not entry:
+                del self._dependents[key]
+        if remove:
+            return
+        own = self.identifier + '.'
+        keys = set()
+        texts = [value for name, value in field.properties.schema.items() if isinstance(value, str) and (name.startswith('sql') or name == 'html')]
+        for target in references.expressionReferences(self.identifier, texts):
+            keys.add(target[len(own):] if target.startswith(own) else target)
+        if keys:
+            self._dependencies[field] = keys
+            for key in keys:
+                self._dependents.setdefault(key, set()).add(field)
+
+    def dependentsOf(self, name):
+        '''
+        the fields of this view whose sql / html reference a field directly
+
+        :param name: a field of this view by name, or a field of another view as view.field
+        :type name: str
+        :return: the referencing fields sorted by name
+        :rtype: list of Fields
+        '''
+        return sortMe(self._dependents.get(name, ()))
+
+    def expandedSql(self, name):
+        '''
+        the sql of a field with its ${field} / ${TABLE} references expanded recursively (see resolver.sqlExpander).
+        References to other views are left as written, project.expandedSql expands across views.
+        Expansions are memoized, shared subexpressions are expanded once, until the sql or type of a field,
+        or the view's sql_table_name / derived_table, changes
+
+        :param name: a field of this view, a dimension_group timeframe such as created_date works
+        :type name: str
+        :return: the expanded sql
+        :rtype: str
+        '''
+        table = resolver.tableSql(self.properties.schema, self.identifier)
+        if self._sqlExpander is None or table != self._sqlTable:
+            self._sqlTable = table
+            self._sqlExpander = resolver.sqlExpander(self._sqlLookup, lambda view: table)
+        return self._sqlExpander.expand(self.identifier, name)
+
+    def _sqlLookup(self, view, name):
+        if view != self.identifier:
+            return None
+        field = self._fields.get(name)
+        if field is None:
+            #a timeframe of a dimension_group
+            field = next((group for group in self._fieldsByType[DimensionGroup] if name.startswith(group.identifier + '_')), None)
+            if field is None:
+                return None
+        return field.token + 's', field.properties.schema, field.identifier
+
+    def dependenciesOf(self, field):
+        '''
+        the names a field references directly, bare names for this view's fields and view.field for others
+
+        :param field: a field of this view
+        :type field: Field
+        :return: referenced names
+        :rtype: set of str
+        '''
+        return set(self._dependencies.get(field, ()))
+
+    def _retag(self, field, remove=False):
+        ''' brings the tag index up to date with the field's current tags '''
+        new = set() if remove else set(field.properties.schema.get('tags', []))
+        old = self._fieldTags.pop(field, set())
+        for tag in old - new:
+            entry = self._tagIndex[tag]
+            entry.discard(field)
+            if not entry:
+                del self._tagIndex[tag]
+        for tag in new - old:
+            self._tagIndex.setdefault(tag, set()).add(field)
+        if new:
+            self._fieldTags[field] = new
+
+    def _propertyChanged(self, field, name, old, new):
+        ''' moves a field between property index entries when one of its properties changes '''
+        if isinstance(old, str):
+            entry = self._propertyIndex.get((name, old))
+            if entry is not None:
+                entry.discard(field)
+                if not entry:
+                    del self._propertyIndex[(name, old)]
+        if isinstance(new, str):
+            self._propertyIndex.setdefault((name, new), set()).add(field)
+        if name == 'tags':
+            self._retag(field)
+        elif name.startswith('sql') or name == 'html':
+            self._link(field)
+        elif name == 'type':
+            #a measure's aggregate comes from its type
+            self._sqlExpander = None
+
+    def where(self, **criteria):
+        '''
+        returns the fields whose properties have all the values given, answered from an index kept current as fields
+        and their properties change. Only properties with a single string value can be matched
+        example: view.where(type='sum', hidden='yes')
+
+        :param criteria: property name = value pairs
+        :type criteria: str
+        :return: matching fields sorted by name
+        :rtype: generator of Fields
+        '''
+        if not criteria:
+            return self.fields()
+        matches = [self._propertyIndex.get(key, set()) for key in criteria.items()]
+        smallest = min(matches, key=len)
+        return iter(sortMe(field for field in smallest if all(field in match for match in matches)))
+
     def addFields(self, fields):
         '''
         Add multiple fields to a view. An iterable collection of field objects will be passed to the add field function. Helpful for adding many fields at once
@@ -894,8 +1358,8 @@ class View(base):
         :return: return description
         :rtype: the return type description
         '''
-        # '''returns iterable of Dimension Fields'''
-        return filter(lambda dim: isinstance(dim, Dimension), self._fields.values())
+        # '''returns iterable of Dimension Fields, sorted by name'''
+        return iter(self._fieldsByType[Dimension])
 
     def dimensionGroups(self):
         '''a description of the function
@@ -906,20 +1370,20 @@ class View(base):
         :return: return description
         :rtype: the return type description
         '''
-        # '''returns iterable of DimensionGroup Fields'''
-        return filter(lambda dim: isinstance(dim, DimensionGroup), self._fields.values())
+        # '''returns iterable of DimensionGroup Fields, sorted by name'''
+        return iter(self._fieldsByType[DimensionGroup])
 
     def measures(self):
-        '''returns iterable of Measure Fields'''
-        return filter(lambda meas: isinstance(meas, Measure), self._fields.values())
+        '''returns iterable of Measure Fields, sorted by name'''
+        return iter(self._fieldsByType[Measure])
 
     def filters(self):
-        '''returns iterable of Filter Fields'''
-        return filter(lambda fil: isinstance(fil, Filter), self._fields.values())
+        '''returns iterable of Filter Fields, sorted by name'''
+        return iter(self._fieldsByType[Filter])
 
     def parameters(self):
-        '''returns iterable of Paramter Fields'''
-        return filter(lambda par: isinstance(par, Parameter), self._fields.values())
+        '''returns iterable of Paramter Fields, sorted by name'''
+        return iter(self._fieldsByType[Parameter])
 
     def addDimension(self,dbColumn, type='string'):
         ''' 
@@ -1128,27 +1592,37 @@ class Explore(base):
 
             
     def _bind_lkml(self,jsonDict):
-        if 'name' in jsonDict.keys():
-            self.setName(jsonDict.pop('name'))
-        if 'joins' in jsonDict.keys():
-            for join in jsonDict['joins']:
-                self + Join(join)        
-            jsonDict.pop('joins')
+        #jsonDict is only read, never modified
         for k,v in jsonDict.items():
-            self.setProperty(k,v)
+            if k == 'name':
+                self.setName(v)
+            elif k == 'joins':
+                for join in v:
+                    self + Join(join)
+            else:
+                self.setProperty(k,v)
 
     def __len__(self):
         return len(self.joins)
 
     def __str__(self):
-        self.templateMap = {
+        return ''.join(self.chunks())
+
+    def chunks(self):
+        '''
+        renders the explore a piece at a time, its properties then each join
+
+        :return: generator of lkml text
+        :rtype: generator of str
+        '''
+        sections = {
              'message': self.getMessage()
             ,'identifier':self.identifier
             ,'props': stringify([str(p) for p in self.getProperties()])
-            ,'joins': stringify([str(j) for j in self.getJoins()])
+            ,'joins': stringifyChunks(self.getJoins())
             ,'token': self.token
         }
-        return Template(getattr(conf.TEMPLATES,self.token)).substitute(**self.templateMap)
+        return getRenderPlan(self.token).chunks(sections)
 
     def __add__(self,other):
         if isinstance(other,View) or isinstance(other,Join):
@@ -1226,21 +1700,14 @@ class Explore(base):
 class Property(object):
     ''' A basic property / key value pair. 
     If the value is a dict it will recusively instantiate properties within itself '''
+    __slots__ = ('name', 'num', 'value')
+
     def __init__(self, name, value):
         self.name = name
         self.num = 0
         if isinstance(value, str):
             self.value = value
-        # lkml.keys.PLURAL_KEYS
-        # ('view', 'measure', 'dimension', 'dimension_group', 'filter', 'access_filter', 
-        # 'bind_filter', 'map_layer', 'parameter', 'set', 'column', 'derived_column', 'include', 
-        # 'explore', 'link', 'when', 'allowed_value', 'named_value_format', 'join', 'datagroup', 'access_grant', 
-        # 'sql_step', 'action', 'param', 'form_param', 'option', 'user_attribute_param', 'assert', 'test')
-        elif name in ('links','filters','tags','suggestions', 
-        'actions', 'sets', 'options', 'form_params', 'access_grants','params',
-        'allowed_values', 'named_value_formats', 'datagroups', 'map_layers', 'columns', 
-        'derived_columns', 'explore_source', 'includes', 'access_filters'):
-        # elif name+'s' in lkml.keys.PLURAL_KEYS:
+        elif _keyRules.get(name, _defaultKeyRule).special:
             self.value = Properties(value, multiValueSpecialHandling=name)
 
         elif isinstance(value, dict) or isinstance(value, list):
@@ -1278,13 +1745,15 @@ class Property(object):
     def __sub__(self,other):
         # if isinstance(self.value, Properties) and self.value.multiValueSpecialHandling in ('tags','suggestions'):
         if isinstance(self.value, Properties):
-            self.value.schema.remove(other)
+            self.value.__delete__(other)
         else:
             pass
 
     def __iter__(self):
-        self.num = 0
-        return self
+        #the same Property is handed out on every access, so each loop gets its own iterator (nested loops over one property)
+        if isinstance(self.value, Properties):
+            return iter(self.value.schema)
+        return iter(self.value)
 
     def __next__(self):
         num = self.num
@@ -1292,33 +1761,51 @@ class Property(object):
             return next(self.value)
 
     def __str__(self):
-        #TODO: multiinstance / plural
-        #TODO: multivalue / list
-            #TODO: brackets
-            #TODO: braces
-        #TODO: quoted
-        #TODO: plain
-        #TODO: SQL / HTML Block ;;
-
-        #TODO
-        def quote_pair():
-            return splice(self.name, ': "', str(self.value), '"')
-        def expression_block():
-            return splice(self.name, ': ', str(self.value), ' ;;')
-        def brackets():
-            return splice(self.name, ': [', str(self.value), ']')
-        def svbrackets():
-            return splice(self.name, ': [', ''.join(self.value.schema), ']')
-        def braces():
-            return splice(self.name, ': {', str(self.value), '}')
-        def default():
-            return splice(self.name , ': ' , str(self.value))
-        def list_member_training_comma():
-            return splice(str(self.value),',')
-        def simple():
-            return str(self.value)
+        #the output format is looked up by name in _keyRules, built once from the lkml key sets and lookml.config
+        return _keyRules.get(self.name, _defaultKeyRule).format(self)
+
+def _quote_pair(p):
+    return splice(p.name, ': "', str(p.value), '"')
+def _expression_block(p):
+    return splice(p.name, ': ', str(p.value), ' ;;')
+def _svbrackets(p):
+    return splice(p.name, ': [', ''.join(p.value.schema), ']')
+def _default(p):
+    return splice(p.name , ': ' , str(p.value))
+def _list_member(p):
+    if isinstance(p.value,str):
+        return splice(str(p.value),',')
+    return str(p.value)
+def _simple(p):
+    return str(p.value)
+def _explore_source(p):
+    #rendered from a shallow view of the schema without its name, the schema itself is left alone
+    schema = p.value.schema
+    body = Properties({k: v for k, v in schema.items() if k != 'name'}, multiValueSpecialHandling=p.value.multiValueSpecialHandling)
+    return splice(p.name , ': ' + schema['name'] + ' ', str(body))
+def _include(p):
+    return splice('include: "',str(p.value),'"')
+def _field(p):
+    return (' '*4 + _default(p))
+
+class _keyRule:
+    '''
+        How a property name is handled
+        format: renders a Property of this name
+        nonunique: the name can appear many times, its value is a list of instances (conf.NONUNIQUE_PROPERTIES)
+        special: plural construct whose value is wrapped as Properties(value, multiValueSpecialHandling=name)
+    '''
+    __slots__ = ('format', 'nonunique', 'special')
+    def __init__(self, format=_default, nonunique=False, special=False):
+        self.format = format
+        self.nonunique = nonunique
+        self.special = special
 
-        
+def _buildKeyRules():
+    '''
+    precomputes the rule for every property name pylookml knows about. Formats are assigned from the lowest to the highest 
+    priority so that a name in several key sets gets the same format the original if / elif chain gave it
+    '''
     # lkml.keys.PLURAL_KEYS
     # ('view', 'measure', 'dimension', 'dimension_group', 'filter', 'access_filter', 
     # 'bind_filter', 'map_layer', 'parameter', 'set', 'column', 'derived_column', 'include', 
@@ -1336,52 +1823,39 @@ class Property(object):
     # ('expression_custom_filter', 'expression', 'html', 'sql_trigger_value', 'sql_table_name', 'sql_distinct_key', 
     # 'sql_start', 'sql_always_having', 'sql_always_where', 'sql_trigger', 'sql_foreign_key', 'sql_where', 'sql_end', 
     # 'sql_create', 'sql_latitude', 'sql_longitude', 'sql_step', 'sql_on', 'sql')
-            
-            # replace with expression block
-            # if self.name.startswith('sql') or self.name == 'html':
-            #     return splice(self.name, ': ', str(self.value), ' ;;')
-        if self.name in (
-                'links','filters','actions','options', 
-                'form_params','sets', 'access_grants',
-                'params', 'allowed_values', 'named_value_formats', 
-                'datagroups', 'map_layers', 'derived_columns','columns','access_filters'):
-                return simple()
-
-        elif self.name == 'explore_source':
-            shadow = copy.deepcopy(self.value)
-            return splice(self.name , ': ' + shadow.schema.pop('name') + ' ', str(shadow))
-
-        elif self.name in ('tags'):
-            return default()
-        
-        elif self.name in lkml.keys.EXPR_BLOCK_KEYS:
-            return expression_block()
-
-        elif self.name in lkml.keys.QUOTED_LITERAL_KEYS:
-            return quote_pair()
-
+    formats = (
+         (('field',), _field)
+        ,(('list_member_quoted',), _simple)
+        ,(('list_member',), _list_member)
+        ,(conf.MULTIVALUE_PROPERTIES, _default)
+        ,(('includes',), _include)
         #single Value brackets
-        elif self.name in ('extends', 'alias'):
-            return svbrackets()
-
-        elif self.name == "includes":
-            return splice('include: "',str(self.value),'"')
-
-        elif self.name in conf.MULTIVALUE_PROPERTIES:
-            return default()
-
-        elif self.name == ('list_member') and isinstance(self.value,str):
-            return list_member_training_comma()
-
-        elif self.name == 'list_member':
-            return simple()
-
-        elif self.name == 'list_member_quoted':
-            return simple()
-        elif self.name == 'field':
-            return (' '*4 + default())
-        else:
-            return default()
+        ,(('extends', 'alias'), _svbrackets)
+        ,(lkml.keys.QUOTED_LITERAL_KEYS, _quote_pair)
+        ,(lkml.keys.EXPR_BLOCK_KEYS, _expression_block)
+        ,(('tags',), _default)
+        ,(('explore_source',), _explore_source)
+        ,(('links','filters','actions','options', 
+            'form_params','sets', 'access_grants',
+            'params', 'allowed_values', 'named_value_formats', 
+            'datagroups', 'map_layers', 'derived_columns','columns','access_filters'), _simple)
+    )
+    special = ('links','filters','tags','suggestions', 
+        'actions', 'sets', 'options', 'form_params', 'access_grants','params',
+        'allowed_values', 'named_value_formats', 'datagroups', 'map_layers', 'columns', 
+        'derived_columns', 'explore_source', 'includes', 'access_filters')
+    rules = {}
+    for names, format in formats:
+        for name in names:
+            rules[name] = _keyRule(format=format)
+    for name in special:
+        rules.setdefault(name, _keyRule()).special = True
+    for name in conf.NONUNIQUE_PROPERTIES:
+        rules.setdefault(name, _keyRule()).nonunique = True
+    return rules
+
+_keyRules = _buildKeyRules()
+_defaultKeyRule = _keyRule()
 
 class Properties(object):
     '''
@@ -1391,21 +1865,23 @@ class Properties(object):
     Things that should be their own class:
     data_groups, named_value_format, sets
     '''
+    __slots__ = ('schema', 'num', 'valueiterator', 'multiValueSpecialHandling', '_wrappers', 'owner')
+
     def __init__(self, schema, multiValueSpecialHandling=False):
         self.schema = schema
         self.num = 0
-        self.valueiterator = iter(self.schema)
         self.multiValueSpecialHandling = multiValueSpecialHandling
+        #an object with a _propertyChanged(name, old, new) method (i.e. a Field) told about every add / delete
+        self.owner = None
 
     def __str__(self):
 
         def process_plural_named_constructs():
             singular = self.multiValueSpecialHandling[:-1]
             buildString = ""
-            schemaDeepCopy = copy.deepcopy(self.schema)
-            for fset in schemaDeepCopy:
-                buildString += conf.NEWLINEINDENT + conf.INDENT + singular + ': ' + fset.pop('name') + ' '
-                buildString += str(Property('list_member',fset))
+            for fset in self.schema:
+                buildString += conf.NEWLINEINDENT + conf.INDENT + singular + ': ' + fset['name'] + ' '
+                buildString += str(Property('list_member',{k: v for k, v in fset.items() if k != 'name'}))
             return buildString
 
         def process_plural_unnamed_constructs():
@@ -1416,10 +1892,9 @@ class Properties(object):
             return splice( singular , singular.join([str(p) for p in self.getProperties()]))
 
         def render(template,delim=' '):
-            self.templateMap = {
+            return getRenderPlan(template).render({
                 'data': stringify([str(p) for p in self.getProperties()], delim=delim, prefix=False)
-            }
-            return Template(getattr(conf.TEMPLATES,template)).substitute(self.templateMap)
+            })
 
         if isinstance(self.schema, dict):
             return render('array', delim=conf.NEWLINEINDENT)
@@ -1457,11 +1932,11 @@ class Properties(object):
             TDOD: Add property subtyping
         '''        
         if isinstance(self.schema, dict):
-            if key == 'sql':
+            if key in self.schema:
+                return self._wrap(key, key, self.schema[key])
+            else:
                 # return sql_prop(identifier, self.schema.get(identifier, []))
-                return Property(key, self.schema.get(key, []))
-            else:    
-                return Property(key, self.schema.get(key, []))
+                return Property(key, [])
         elif isinstance(self.schema, list):
             if key == 'sql':
                 # return sql_prop(identifier, self.schema.get(identifier, []))
@@ -1469,28 +1944,50 @@ class Properties(object):
             else:    
                 return Property(key, self.schema.get(key, [])) 
 
+    def _wrap(self, cacheKey, name, raw):
+        '''
+        returns the Property for a raw schema value, reusing the one built last time while the schema still holds
+        that same value object. In place changes (i.e. appending a tag) show through the existing wrapper,
+        assigning a new value builds a new one.
+        '''
+        try:
+            wrappers = self._wrappers
+        except AttributeError:
+            #only allocated for Properties that are actually read
+            wrappers = self._wrappers = {}
+        cached = wrappers.get(cacheKey)
+        if cached is not None and cached[0] is raw:
+            return cached[1]
+        prop = Property(name, raw)
+        if self.owner is not None and isinstance(raw, list) and isinstance(prop.value, Properties) and prop.value.multiValueSpecialHandling:
+            #in place edits of a list like tags (i.e. field.tags - 'x') are reported as a change to that property
+            prop.value.owner = self.owner
+        wrappers[cacheKey] = (raw, prop)
+        return prop
+
     def getProperties(self):
         if isinstance(self.schema, dict):
             for k, v in self.schema.items():
-                if k in conf.NONUNIQUE_PROPERTIES:
-                    for n in v:
-                        yield Property(k, n)
+                if _keyRules.get(k, _defaultKeyRule).nonunique:
+                    for i, n in enumerate(v):
+                        yield self._wrap((k, i), k, n)
                 else:
-                    yield Property(k, v)
+                    yield self._wrap(k, k, v)
         elif isinstance(self.schema, list):
-            for item in self.schema:
-                if self.multiValueSpecialHandling in ('suggestions','tags','allowed_values'):
-                    yield Property('list_member_quoted',item)
-                else:
-                    yield Property('list_member',item)
+            member = 'list_member_quoted' if self.multiValueSpecialHandling in ('suggestions','tags','allowed_values') else 'list_member'
+            for i, item in enumerate(self.schema):
+                yield self._wrap(i, member, item)
 
     def __iter__(self):
-        self.valueiterator = iter(self.schema)
-        return self
+        return iter(self.schema)
 
     def __next__(self):
         try:
             return next(self.valueiterator)
+        except AttributeError:
+            #the iterator is only created when first needed rather than for every Properties instance
+            self.valueiterator = iter(self.schema)
+            return self.__next__()
         except:
             raise StopIteration
 
@@ -1509,7 +2006,18 @@ class Properties(object):
             pass
 
     def addProperty(self, name, value):
-        if name in conf.NONUNIQUE_PROPERTIES:
+        if self.owner is None:
+            self._addProperty(name, value)
+        elif isinstance(self.schema, dict):
+            old = self.schema.get(name)
+            self._addProperty(name, value)
+            self.owner._propertyChanged(name, old, self.schema.get(name))
+        else:
+            self._addProperty(name, value)
+            self.owner._propertyChanged(self.multiValueSpecialHandling, None, None)
+
+    def _addProperty(self, name, value):
+        if _keyRules.get(name, _defaultKeyRule).nonunique:
             index = self.schema.get(name,[])
             index.append(value)
             self.schema.update(
@@ -1523,9 +2031,14 @@ class Properties(object):
 
     def __delete__(self, identifier):
         if isinstance(self.schema,dict):
-            self.schema.pop(identifier, None)
+            old = self.schema.pop(identifier, None)
+            if self.owner is not None and old is not None:
+                self.owner._propertyChanged(identifier, old, None)
         elif isinstance(self.schema,list):
-            self.schema.remove(identifier, None)
+            if identifier in self.schema:
+                self.schema.remove(identifier)
+                if self.owner is not None:
+                    self.owner._propertyChanged(self.multiValueSpecialHandling, None, None)
 
     def isMember(self, property):
         if isinstance(self.schema,dict):
@@ -1553,37 +2066,127 @@ class Properties(object):
 
 class Field(base):
     ''' Base class for fields in LookML, only derived/child types should be instantiated '''
+    #__dict__ is only allocated if something sets an attribute that is not a slot, so that still works
+    __slots__ = ('db_column', 'view', '__dict__')
+
     def __init__(self, input):
         self.db_column = ''
+        self.view = None
         super(Field, self).__init__(input)
-        self.templateMap = {
+        self.properties.owner = self
 
-        }
+    def setName(self, name):
+        '''
+        sets the name, and keeps the field's view sorted if it belongs to one
+        '''
+        old = self.identifier
+        super(Field, self).setName(name)
+        if self.view is not None and old != name:
+            self.view._fieldRenamed(self, old)
+        return self
+
+    def expandedSql(self):
+        '''
+        this field's sql with its ${field} / ${TABLE} references expanded recursively within its view, see View.expandedSql
+
+        :return: the expanded sql
+        :rtype: str
+        '''
+        if self.view is None:
+            return resolver.sqlExpander(lambda view, name: (self.token + 's', self.properties.schema, name) if name == self.identifier else None).expand('', self.identifier)
+        return self.view.expandedSql(self.identifier)
 
     def children(self):
-        if self.view:
-            for dependent in self.view.search('sql',[self.__refsre__,self.__refre__]):
+        '''
+        the fields in this field's view which reference it directly, from the view's dependency graph
+        '''
+        if self.view is not None:
+            for dependent in self.view.dependentsOf(self.identifier):
                 yield dependent
 
+    def parents(self):
+        '''
+        the fields in this field's view which it references directly
+        '''
+        if self.view is not None:
+            for name in sorted(self.view.dependenciesOf(self)):
+                if name in self.view._fields:
+                    yield self.view._fields[name]
+
+    def _walk(self, step):
+        #breadth first from this field, each field is visited once even if the references form a cycle
+        seen, frontier, found = {self}, [self], []
+        while frontier:
+            nextFrontier = []
+            for field in frontier:
+                for other in step(field):
+                    if other not in seen:
+                        seen.add(other)
+                        found.append(other)
+                        nextFrontier.append(other)
+            frontier = nextFrontier
+        return found
+
+    def descendants(self, views=()):
+        '''
+        every field which depends on this one, directly or through other fields
+
+        :param views: other views to follow references from (i.e. all the views of a project), by default only this field's view
+        :type views: iterable of View
+        :return: the dependent fields, nearest first
+        :rtype: list of Fields
+        '''
+        views = list(views)
+        def step(field):
+            yield from field.children()
+            for view in views:
+                if view is not field.view:
+                    yield from view.dependentsOf(field.__refr__)
+        return self._walk(step)
+
+    def ancestors(self, views=()):
+        '''
+        every field this one depends on, directly or through other fields
+
+        :param views: other views to follow references into (i.e. all the views of a project), by default only this field's view
+        :type views: iterable of View
+        :return: the fields depended on, nearest first
+        :rtype: list of Fields
+        '''
+        byName = {view.identifier: view for view in views}
+        def step(field):
+            yield from field.parents()
+            if field.view is not None:
+                for name in sorted(field.view.dependenciesOf(field)):
+                    viewName, dot, fieldName = name.partition('.')
+                    if dot and viewName in byName and fieldName in byName[viewName]._fields:
+                        yield byName[viewName]._fields[fieldName]
+        return self._walk(step)
+
     def setName_safe(self, newName):
         '''
-            Change the name of the field and references to it in sql (does not yet perform the same for HTML / Links / Drill Fields / Sets / Actions etc)
+            Change the name of the field and the references to it in the sql / html of the fields of its view.
+            The fields to change come from the view's dependency graph, so renaming is proportional to the number of
+            dependents rather than the size of the view
         '''
-        #TODO: complete checking all places for dependencies. 
-        old = copy.deepcopy(self.name)
-        oldrefsre = copy.deepcopy(self.__refsre__)
-        oldrefre = copy.deepcopy(self.__refre__)
+        old = self.identifier
+        oldRef = self.__refr__
         self.setName(newName)
-        for f in self.view.search('sql',[oldrefsre,oldrefre]):
-            f.sql = re.sub(oldrefsre, self.__refs__, str(f.sql.value))
-            f.sql = re.sub(oldrefre, self.__ref__, str(f.sql.value))
+        for f in self.view.dependentsOf(old):
+            for name, value in list(f.properties.schema.items()):
+                if isinstance(value, str) and (name.startswith('sql') or name == 'html'):
+                    rewritten = renameReferences(value, oldRef, self.__refr__, view=self.view.identifier)
+                    if rewritten != value:
+                        f.setProperty(name, rewritten)
         self.view.removeField(old)
         self.view + self
         return self
 
     def __getattr__(self, key):
-
-        if key == 'name':
+        #python internals (copy, pickle) probe for dunder methods, those are never properties
+        if key.startswith('__') and key.endswith('__') and not key.startswith('__ref'):
+            raise AttributeError(key)
+        elif key == 'name':
             return self.identifier
         elif key == 'pk':
             return self.getPrimaryKey()
@@ -1636,16 +2239,14 @@ class Field(base):
 
     def addTag(self,tag):
         if self.properties.isMember('tags'):
-            if tag not in self.tags:
-                # self.tags.value.schema['tags'].append(tag)
-                self.tags.value.schema.append(tag)
-            #Else it's already a member
+            #a no-op if it's already a member
+            self.tags.value.addProperty('tags', tag)
         else:
             self.setProperty('tags',[tag])
 
     def removeTag(self,tag):
         if self.properties.isMember('tags'):
-            self.tags.value.schema.remove(tag)
+            self.tags.value.__delete__(tag)
         else:
             pass
 
@@ -1655,6 +2256,11 @@ class Field(base):
         self.view = view
         return self  # satisfies a need to linkback (look where setView is called)
 
+    def _propertyChanged(self, name, old, new):
+        ''' called by the field's Properties on every add / delete, keeps the view's indexes current '''
+        if self.view is not None:
+            self.view._propertyChanged(self, name, old, new)
+
     def setSql(self, sql):
         self.setProperty('sql', sql)
         return self
@@ -1680,6 +2286,8 @@ class Field(base):
         self.sql = "NVL(" + str(self.sql.value) + "," + value_if_null + ")"
 
 class Dimension(Field):
+    __slots__ = ()
+
     def __init__(self, input):
         super(Dimension, self).__init__(input)
         self.token = 'dimension'
@@ -1695,7 +2303,7 @@ class Dimension(Field):
         self.db_column = dbColumn
         self.setProperty('sql', splice('${TABLE}.' , conf.DB_FIELD_DELIMITER_START , self.db_column , conf.DB_FIELD_DELIMITER_END))
         if changeIdentifier:
-            self.identifier =lookCase(self.db_column)
+            self.setName(lookCase(self.db_column))
         return self
 
     def setAllLabels(self, group: None, item: None, label: None):
@@ -1732,6 +2340,8 @@ class Dimension(Field):
         return self
 
 class DimensionGroup(Field):
+    __slots__ = ()
+
     def __init__(self, input):
         super(DimensionGroup, self).__init__(input)
         if not self.properties.isMember('timeframes'):
@@ -1747,20 +2357,26 @@ class DimensionGroup(Field):
         self.db_column = dbColumn
         self.setProperty('sql', splice('${TABLE}.' , conf.DB_FIELD_DELIMITER_START , self.db_column , conf.DB_FIELD_DELIMITER_END))
         if changeIdentifier:
-            self.identifier = lookCase(self.db_column)
+            self.setName(lookCase(self.db_column))
         return self
     
 class Measure(Field):
+    __slots__ = ()
+
     def __init__(self, input):
         super(Measure, self).__init__(input)
         self.token = 'measure'
 
 class Filter(Field):
+    __slots__ = ()
+
     def __init__(self, input):
         super(Filter, self).__init__(input)
         self.token = 'filter'
 
 class Parameter(Field):
+    __slots__ = ()
+
     def __init__(self, input):
         super(Parameter, self).__init__(input)
         self.token = 'parameter'
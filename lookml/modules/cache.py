@@ -0,0 +1,127 @@
+import os, json, hashlib, io
+import lkml
+import lookml.config as conf
+
+def blobSha(data):
+    '''
+    computes the git blob sha1 of some content, the same value github returns as a file's sha
+
+    :param data: file content
+    :type data: bytes
+    :return: hex digest
+    :rtype: str
+    '''
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+class parseCache:
+    '''
+        A persistent, content addressed cache of parsed lkml. Entries are the json_data lkml.load returns,
+        stored one file per git blob sha. Reading an entry bumps its modified time, and when the directory grows
+        past maxBytes the least recently used entries are evicted first.
+        Safe to share between processes, writes are atomic and a missing entry is just a miss.
+    '''
+    def __init__(self, directory, maxBytes=conf.PARSE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.size = None
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+
+    def __getstate__(self):
+        #only the settings travel to worker processes, the size is recounted there
+        return {'directory': self.directory, 'maxBytes': self.maxBytes, 'size': None}
+
+    def entry(self, sha):
+        return os.path.join(self.directory, sha + '.json')
+
+    def get(self, sha):
+        '''
+        returns the cached json_data for a sha or None on a miss. Every call reads the entry again, so each caller
+        gets a structure of its own which objects bound from it can edit without reaching the cache
+        '''
+        try:
+            with open(self.entry(sha), 'r') as tmp:
+                json_data = json.load(tmp)
+            os.utime(self.entry(sha))
+            return json_data
+        except (OSError, ValueError):
+            return None
+
+    def put(self, sha, json_data):
+        ''' stores json_data under sha, then evicts if the cache is over its size limit '''
+        tmpPath = '%s.%d.tmp' % (self.entry(sha), os.getpid())
+        with open(tmpPath, 'w') as tmp:
+            json.dump(json_data, tmp)
+        os.replace(tmpPath, self.entry(sha))
+        if self.size is None:
+            self.size = sum(size for path, mtime, size in self.entries())
+        else:
+            self.size += os.path.getsize(self.entry(sha))
+        if self.size > self.maxBytes:
+            self.evict()
+        return self
+
+    def entries(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def evict(self):
+        ''' removes least recently used entries until the cache fits in maxBytes '''
+        entries = sorted(self.entries(), key=lambda entry: entry[1])
+        self.size = sum(size for path, mtime, size in entries)
+        for path, mtime, size in entries:
+            if self.size <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+        return self
+
+    def clear(self):
+        for path, mtime, size in list(self.entries()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.size = 0
+        return self
+
+    def load(self, data, sha=None):
+        '''
+        returns the json_data for some lkml content, parsing it only on a cache miss. On a miss the entry is
+        written before the parse is returned, so later edits to it are not cached either
+
+        :param data: raw file content
+        :param sha: git blob sha of data if already known (i.e. from github), computed otherwise
+        :type data: bytes
+        :type sha: str
+        :return: json_data
+        :rtype: dict
+        '''
+        sha = sha if sha else blobSha(data)
+        json_data = self.get(sha)
+        if json_data is None:
+            json_data = lkml.load(io.TextIOWrapper(io.BytesIO(data)).read())
+            self.put(sha, json_data)
+        return json_data
+
+_active = None
+
+def active():
+    '''
+    returns the parse cache configured by conf.PARSE_CACHE_DIR / conf.PARSE_CACHE_MAX_BYTES or None if caching is off
+    '''
+    global _active
+    if not conf.PARSE_CACHE_DIR:
+        return None
+    if _active is None or (_active.directory, _active.maxBytes) != (conf.PARSE_CACHE_DIR, conf.PARSE_CACHE_MAX_BYTES):
+        _active = parseCache(conf.PARSE_CACHE_DIR, conf.PARSE_CACHE_MAX_BYTES)
+    return _active
@@ -0,0 +1,88 @@
+import sys, argparse
+import lookml
+
+def viewDependents(index):
+    '''
+    the view level dependency graph of a project: view -> the views whose fields, sets or extends refer to it
+
+    :param index: an up to date reference index
+    :type index: references.referenceIndex
+    :rtype: dict
+    '''
+    dependents = {}
+    for path, entry in index.files.items():
+        defined = set(entry['views'])
+        for source, target, refType in entry['refs']:
+            view = source.split('.')[0]
+            if view in defined:
+                dependents.setdefault(target.split('.')[0], set()).add(view)
+    return dependents
+
+def impact(index, explores, includedFiles, changed, removedViews=()):
+    '''
+    the smallest set of views, explores and models a change can affect:
+    views defined in the changed files and every view depending on them (extends or references, followed transitively),
+    explores defined in the changed files or reaching an affected view through their base view or a join,
+    and models which are changed, define an affected explore or include a changed file
+
+    :param index: reference index, up to date with the change
+    :param explores: resolver.exploreResolver, up to date with the change
+    :param includedFiles: model path -> the paths it includes (i.e. project.includedFiles)
+    :param changed: paths of the added, modified and deleted files
+    :param removedViews: views the changed files defined before the change (i.e. from the base revision)
+    :type index: references.referenceIndex
+    :type explores: resolver.exploreResolver
+    :type includedFiles: callable
+    :type changed: iterable of str
+    :type removedViews: iterable of str
+    :return: {'views': [...], 'explores': [...], 'models': [...]} each sorted
+    :rtype: dict
+    '''
+    changed = set(changed)
+    views = set(removedViews)
+    for path in changed:
+        views.update(index.files.get(path, {}).get('views', ()))
+    dependents = viewDependents(index)
+    pending = list(views)
+    while pending:
+        for view in dependents.get(pending.pop(), ()):
+            if view not in views:
+                views.add(view)
+                pending.append(view)
+    hit = set(name for path in changed for name in explores.files.get(path, ()))
+    for name in explores.definitions:
+        if name not in hit and any(view in views for alias, view, source in explores.aliases(name)):
+            hit.add(name)
+    models = set()
+    for path in set(index.files) | changed:
+        if not path.endswith('.model.lkml'):
+            continue
+        if path in changed or hit.intersection(explores.files.get(path, ())) or (path in index.files and changed.intersection(includedFiles(path))):
+            models.add(path)
+    return {'views': sorted(views), 'explores': sorted(hit), 'models': sorted(models)}
+
+def main(argv=None):
+    '''
+    prints the views, explores and models affected by a change, one per line under a heading.
+    example: python -m lookml.modules.impact --git-url git@github.com:org/repo.git --base origin/master --head HEAD
+    or with the changed files listed: python -m lookml.modules.impact --git-url ... views/users.view.lkml
+    '''
+    parser = argparse.ArgumentParser(description='views, explores and models affected by changed lkml files')
+    parser.add_argument('--git-url', required=True, help='repository to clone, a local path works')
+    parser.add_argument('--project-name', default='impact', help='directory the clone is made in, under --output-path')
+    parser.add_argument('--output-path', default='.tmp')
+    parser.add_argument('--branch', default='master')
+    parser.add_argument('--base', default='', help='revision to compare from')
+    parser.add_argument('--head', default='', help='revision to compare to, the working tree when left out')
+    parser.add_argument('files', nargs='*', help='changed files from the project root, instead of --base / --head')
+    args = parser.parse_args(argv)
+    proj = lookml.Project(git_url=args.git_url, looker_project_name=args.project_name, branch=args.branch, outputPath=args.output_path)
+    found = proj.impact(changed=args.files or None, base=args.base, head=args.head)
+    for key in ('views', 'explores', 'models'):
+        print(key + ':')
+        for name in found[key]:
+            print('  ' + name)
+    return found
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
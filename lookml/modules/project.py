@@ -5,11 +5,50 @@ import github
 import base64
 import requests
 import re
+import concurrent.futures, itertools, bisect
+import lookml.modules.cache as cache
+import lookml.modules.references as references
+import lookml.modules.resolver as resolver
+import lookml.modules.validator as validator
+import lkml
 
 def mkdir_force(dir):
     if not os.path.exists(dir):
         os.mkdir(dir,0o777)
 
+#absolute include pattern -> (literal path prefix, compiled regex)
+_includePatterns = {}
+
+def includePattern(pattern, base=''):
+    '''
+    compiles a lookml include: glob, once per pattern. * matches within a directory, ** across directories
+    and a pattern without an extension (i.e. *.view) also matches the .lkml / .lookml file
+
+    :param pattern: the include value, i.e. '/views/*.view.lkml' or '*.view'
+    :param base: directory of the including file, patterns without a leading / are relative to it
+    :type pattern: str
+    :type base: str
+    :return: the literal prefix every match starts with and the compiled pattern, None for includes from another project (//)
+    :rtype: tuple
+    '''
+    if pattern.startswith('//'):
+        return None
+    pattern = pattern[1:] if pattern.startswith('/') else os.path.normpath(os.path.join(base, pattern))
+    if pattern not in _includePatterns:
+        prefix = re.split(r'[*?\[]', pattern)[0]
+        regex = ''
+        for part in re.split(r'(\*\*/|\*\*|\*)', pattern):
+            if part == '**/':
+                regex += '(?:.*/)?'
+            elif part == '**':
+                regex += '.*'
+            elif part == '*':
+                regex += '[^/]*'
+            else:
+                regex += re.escape(part)
+        _includePatterns[pattern] = (prefix, re.compile(regex + r'(?:\.lkml|\.lookml)?$'))
+    return _includePatterns[pattern]
+
 def Project(repo='',access_token='',branch="master",git_url="",commitMessage="",looker_host="",looker_project_name="",outputPath='.tmp'):
     '''
         A LookML Project at a GitHub location or location on the filesytem [Factory Function]
@@ -33,7 +72,17 @@ class project:
         self.branch = branch
         self.looker_project_name = looker_project_name
         self.commitMessage = "PyLookML Auto Updated: " + time.strftime('%h %d %Y @ %I:%M%p %Z') if not commitMessage else commitMessage
-        self.index = dict()
+        self.index = references.referenceIndex()
+        self.resolver = resolver.extendsResolver()
+        self.explores = resolver.exploreResolver(self.resolver)
+        self.symbols = validator.symbolTable(self.explores)
+        self.sql = resolver.sqlExpander.forViews(self.resolver)
+        #path -> File, filled the first time a project wide query needs every file (see loadedFiles)
+        self._loaded = None
+        #include resolution: sorted path index of the repo, path -> files its includes match, model -> include closure
+        self._includePaths = None
+        self._includeEdges = {}
+        self._includeClosures = {}
         
         #host setup
         self.looker_host = looker_host
@@ -44,27 +93,376 @@ class project:
         self.deploy_url = ""
         self.constructDeployUrl()
 
-    def buildIndex(self):
-        for f in self.files():
-            for view in f['views']:
-                for prop in view:
-                    pass
-                for field in view.fields():
-                    for prop in field:
-                        if prop.name in ('sql','html'):
-                            # print(prop.name,': ', prop.value)
-                            for ref in lookml.parseReferences(prop.value):
-                                if ref is not None:
-                                    key = ref['field'] if ref['fully_qualified_reference'] else view.name + '.' + ref['field']
-                                    location = view.name + '.' + field.name + '.' + prop.name
-                                    data = {'type':prop.name, 'file':f.path}
-                                    if key not in self.index.keys():
-                                        self.index[key] = { location: data }
-                                    else:
-                                        self.index[key].update({
-                                           location : data
-                                        })
-        print(self.index)
+    def buildIndex(self, indexPath=''):
+        '''
+        builds the project's reference index (who references a field / what a field references, see references.referenceIndex)
+        or brings it up to date: only files whose sha changed since they were indexed are parsed again.
+        With indexPath the index is read from that file first and saved back after, so repeated runs only pay for what changed
+
+        :param indexPath: optional json file to keep the index in between runs
+        :type indexPath: str
+        :return: the index, also kept as self.index
+        :rtype: references.referenceIndex
+        '''
+        if indexPath and not self.index.files:
+            self.index = references.referenceIndex.load(indexPath)
+        self.index.refresh(self._indexEntries())
+        if indexPath:
+            self.index.save(indexPath)
+        return self.index
+
+    def _lkmlBlobs(self):
+        ''' (path, blob sha) of every lkml file on the project's branch, subdirectories included, from one recursive tree read '''
+        for entry in self.repo.get_git_tree(self.branch, recursive=True).tree:
+            if entry.type == 'blob' and entry.path.endswith('.lkml'):
+                yield entry.path, entry.sha
+
+    def _indexEntries(self):
+        ''' (path, sha, load) for each lkml file, github already knows every file's sha so only changed files are downloaded '''
+        for path, sha in self._lkmlBlobs():
+            yield path, sha, (lambda path=path: self._readLkml(path)[0])
+
+    def _readLkml(self, path):
+        ''' the parsed content of the file at an index path on the project's branch, and what to build its File from '''
+        contentFile = self.repo.get_contents(path, ref=self.branch)
+        return lkml.load(base64.b64decode(contentFile.content).decode('utf-8')), contentFile
+
+    def _readText(self, path):
+        ''' the text of the file at an index path on the project's branch, and its git blob sha '''
+        contentFile = self.repo.get_contents(path, ref=self.branch)
+        return base64.b64decode(contentFile.content).decode('utf-8'), contentFile.sha
+
+    def _writeTexts(self, texts):
+        '''
+        writes a batch of changed files as a single commit through the git data api: one tree, one commit and one move of the branch.
+        Nothing is written when a file changed on the branch since it was read, and the branch is only moved forward
+        from the commit the batch was built on, so it gets the whole batch or none of it
+
+        :param texts: (path, new text, blob sha the text was read at) for each file
+        :type texts: list of tuples
+        :return: self
+        :rtype: self
+        '''
+        if not texts:
+            return self
+        head = self.repo.get_git_ref('heads/' + self.branch)
+        parent = self.repo.get_git_commit(head.object.sha)
+        current = {element.path: element.sha for element in self.repo.get_git_tree(parent.tree.sha, recursive=True).tree}
+        stale = [path for path, text, sha in texts if current.get(path) != sha]
+        if stale:
+            raise Exception('nothing written, changed on %s since they were read: %s' % (self.branch, ', '.join(stale)))
+        elements = [github.InputGitTreeElement(path, '100644', 'blob', content=text) for path, text, sha in texts]
+        tree = self.repo.create_git_tree(elements, parent.tree)
+        commit = self.repo.create_git_commit(self.commitMessage, tree, [parent])
+        head.edit(commit.sha)
+        for path, text, sha in texts:
+            self.invalidateIncludes(path)
+        return self
+
+    def rename(self, old, new, indexPath=''):
+        '''
+        renames a field or a view everywhere in the project as one batch. The reference index (see buildIndex) finds
+        the files involved and every file is rewritten in memory first: only the names and references involved change,
+        comments and layout are kept (see references.renameInText). Only files which actually changed are written, as one commit.
+        Nothing is written if any file fails to rewrite, its new text does not parse to the renamed lkml, or it changed since it was read.
+        A field rename also renames the field in views extending its view and follows references through join / explore aliases (from:).
+        A view rename covers its fields' references, extends, from, view_name, and explores / joins named after the view
+
+        :param old: view.field to rename a field, or a view name
+        :param new: the new name in the same form, a field can not move to a different view
+        :param indexPath: optional json file the reference index is kept in (see buildIndex)
+        :type old: str
+        :type new: str
+        :type indexPath: str
+        :return: the paths of the files written
+        :rtype: list of str
+        '''
+        index = self.buildIndex(indexPath=indexPath)
+        oldView, dot, oldField = old.partition('.')
+        newView, newDot, newField = new.partition('.')
+        if bool(dot) != bool(newDot) or (dot and oldView != newView):
+            raise Exception('rename a field as view.field to view.new_field, or a view as view to new_view')
+        family, aliases, paths = [], set(), set()
+        if dot:
+            #the view and every view extending it (directly or not) carry the field
+            pending = [oldView]
+            while pending:
+                view = pending.pop()
+                if view not in family:
+                    family.append(view)
+                    for r in index.whoReferences(view):
+                        if r['type'] == 'extends':
+                            pending.append(r['source'])
+                        elif r['type'] == 'from':
+                            aliases.add(r['source'].split('.')[-1])
+            for view in family:
+                paths.update(index.definedIn(view))
+            for qualifier in set(family) | aliases:
+                paths.update(r['file'] for r in index.whoReferences(qualifier + '.' + oldField))
+        else:
+            paths.update(index.definedIn(oldView))
+            paths.update(index.filesReferencingView(oldView))
+
+        #every file is rewritten before any is written
+        changed = []
+        for path in sorted(paths):
+            text, sha = self._readText(path)
+            try:
+                renamed, isChanged = references.renameInText(text, old, new, family=family[1:], aliases=aliases)
+                #the new text has to parse to exactly what the rename means for the parsed file
+                matches = not isChanged or lkml.load(renamed) == references.renameInLkml(lkml.load(text), old, new, family=family[1:], aliases=aliases)[0]
+            except Exception as e:
+                raise Exception('rename aborted, nothing written: %s could not be rewritten (%s)' % (path, e))
+            if not matches:
+                raise Exception('rename aborted, nothing written: the rewritten %s does not parse to the renamed lkml' % path)
+            if isChanged:
+                changed.append((path, renamed, sha))
+        self._writeTexts(changed)
+        self.unload()
+        self.buildIndex(indexPath=indexPath)
+        return [path for path, text, sha in changed]
+
+    def resolveView(self, name):
+        '''
+        the effective view behind a name once its extends chain and +view refinements are applied across the project's files
+        (see resolver.extendsResolver). Files changed since the last call are read again, and only the views they define,
+        refine or are extended from are resolved again, the rest come from the resolver's memo
+
+        :param name: view name
+        :type name: str
+        :return: an independent View holding every inherited and refined field
+        :rtype: View
+        '''
+        self.explores.refresh(self._indexEntries())
+        return self.resolver.view(name)
+
+    def expandedSql(self, field):
+        '''
+        a field's sql with its references expanded recursively across the project's views, extends and refinements
+        applied (see resolver.sqlExpander). Memoized, files changed since the last call are read again and only
+        expansions reading the views they affect are recomputed
+
+        :param field: view.field
+        :type field: str
+        :return: the expanded sql, None when there is no such field
+        :rtype: str
+        '''
+        self.explores.refresh(self._indexEntries())
+        view, dot, name = field.partition('.')
+        return self.sql.expand(view, name)
+
+    def expandAll(self):
+        '''
+        every field of every view in the project with its expanded sql, in one pass that expands each shared
+        subexpression once (i.e. to audit what every measure runs). Fields in circular references are reported with
+        the error message instead of sql
+
+        :return: (view.field, expanded sql) pairs
+        :rtype: generator of tuples
+        '''
+        self.explores.refresh(self._indexEntries())
+        for view in sorted(self.resolver.definitions):
+            for fieldType in references.FIELD_TYPES:
+                for field in self.resolver.resolve(view).get(fieldType, []):
+                    try:
+                        yield view + '.' + field['name'], self.sql.expand(view, field['name'])
+                    except Exception as e:
+                        yield view + '.' + field['name'], str(e)
+
+    def resolveExplore(self, name):
+        '''
+        an explore with its base_view and each join's to linked to the View they reach, resolved like resolveView
+
+        :param name: explore name
+        :type name: str
+        :rtype: Explore
+        '''
+        self.explores.refresh(self._indexEntries())
+        return self.explores.explore(name)
+
+    def exploreFields(self, name):
+        '''
+        the field universe of an explore: the fields of its base view and joins under their aliases (from: / view_name),
+        narrowed by fields: and labelled with view_label (see resolver.exploreResolver.universe).
+        Memoized, only recomputed when a file defining the explore or a view it reaches changes
+
+        :param name: explore name
+        :type name: str
+        :return: alias.field -> details of the field
+        :rtype: dict
+        '''
+        self.explores.refresh(self._indexEntries())
+        return self.explores.universe(name)
+
+    def includedFiles(self, model):
+        '''
+        the files a model pulls in through its include: globs, followed through the includes of included files.
+        Every pattern is matched against one sorted index of the repo's paths, and closures are cached per model
+        until files are added, updated or deleted through the project (or invalidateIncludes is called)
+
+        :param model: path of the model (or any lkml file) from the project root, i.e. 'thelook/thelook.model.lkml'
+        :type model: str
+        :return: paths of the included files from the project root, sorted
+        :rtype: list of str
+        '''
+        if model not in self._includeClosures:
+            seen, pending = set(), [model]
+            while pending:
+                for path in self._includes(pending.pop()):
+                    if path not in seen:
+                        seen.add(path)
+                        pending.append(path)
+            seen.discard(model)
+            self._includeClosures[model] = sorted(seen)
+        return list(self._includeClosures[model])
+
+    def _includes(self, path):
+        ''' the files matched by the include: statements of one file '''
+        if path not in self._includeEdges:
+            matched = set()
+            if path.endswith('.lkml'):
+                if self._includePaths is None:
+                    self._includePaths = sorted(self._listPaths())
+                for include in self._readLkml(path)[0].get('includes', []):
+                    compiled = includePattern(include, os.path.dirname(path))
+                    if compiled is None:
+                        continue
+                    prefix, regex = compiled
+                    #only paths sharing the pattern's literal prefix can match
+                    for i in range(bisect.bisect_left(self._includePaths, prefix), len(self._includePaths)):
+                        candidate = self._includePaths[i]
+                        if not candidate.startswith(prefix):
+                            break
+                        if regex.match(candidate):
+                            matched.add(candidate)
+            self._includeEdges[path] = matched
+        return self._includeEdges[path]
+
+    def invalidateIncludes(self, path=None):
+        '''
+        drops cached include resolution. With a path only that file's includes are read again (its content changed),
+        without one the path index is rebuilt too (files were added or removed)
+
+        :param path: path of a changed file from the project root
+        :type path: str
+        :return: self
+        '''
+        if path is None:
+            self._includePaths = None
+            self._includeEdges = {}
+        else:
+            self._includeEdges.pop(path, None)
+        self._includeClosures = {}
+        return self
+
+    def _relativePath(self, f):
+        ''' a File's (or path's) path from the project root '''
+        return f.path if isinstance(f, lookml.File) else f
+
+    def _listPaths(self):
+        ''' every file path in the repository '''
+        return [entry.path for entry in self.repo.get_git_tree(self.branch, recursive=True).tree if entry.type == 'blob']
+
+    def validate(self):
+        '''
+        checks every ${view.field}, liquid and drill_fields reference in the project's sql, sql_on, html and drill_fields
+        against a symbol table of every view and field (inherited and refined fields included), without Looker.
+        Files changed since the last call are the only ones parsed again, see validator.symbolTable
+
+        :return: one record per broken reference: file, line, reference, context (view / explore) and message
+        :rtype: list of dicts
+        '''
+        self.symbols.refresh(self._indexEntries())
+        return self.symbols.validate(self._textEntries())
+
+    def impact(self, changed=None, base='', head=''):
+        '''
+        the smallest set of views, explores and models affected by a change, so validation and content tests can
+        run on just those (see impact.impact). The change is a list of changed paths, or two git revisions
+
+        :param changed: paths from the project root of the added, modified or deleted files
+        :param base: revision to compare from, also read for the views changed files defined before
+        :param head: revision to compare to, the current files when left out
+        :type changed: list of str
+        :type base: str
+        :type head: str
+        :return: {'views': [...], 'explores': [...], 'models': [...]}
+        :rtype: dict
+        '''
+        if changed is None:
+            changed = self._changedPaths(base, head)
+        changed = [path for path in changed if path.endswith('.lkml')]
+        #views the files defined before the change, from the index as it was or the base revision
+        removedViews = set()
+        for path in changed:
+            removedViews.update(self.index.files.get(path, {}).get('views', ()))
+            if base:
+                removedViews.update(references.extractDefinitions(self._revisionLkml(base, path)))
+        self.buildIndex()
+        self.explores.refresh(self._indexEntries())
+        self.invalidateIncludes()
+        #imported here so python -m lookml.modules.impact does not find the module already loaded
+        import lookml.modules.impact as impact
+        return impact.impact(self.index, self.explores, self.includedFiles, changed, removedViews)
+
+    def _changedPaths(self, base, head):
+        ''' the paths changed between two revisions '''
+        return [f.filename for f in self.repo.compare(base, head or self.branch).files]
+
+    def _revisionLkml(self, revision, path):
+        ''' the parsed content of a file at a revision, empty if it did not exist '''
+        try:
+            return lkml.load(base64.b64decode(self.repo.get_contents(path, ref=revision).content).decode('utf-8'))
+        except github.GithubException:
+            return {}
+
+    def _textEntries(self):
+        ''' (path, text) for each lkml file on the project's branch '''
+        for path, sha in self._lkmlBlobs():
+            yield path, self._readText(path)[0]
+
+    def loadedFiles(self):
+        '''
+        returns every lkml file in the project, loaded on the first call and then kept. Project wide queries (i.e. where)
+        answer from these objects, so changes made to them are seen by later queries. Call unload() to read the project again
+
+        :return: the project's files
+        :rtype: list of File
+        '''
+        if self._loaded is None:
+            self._loaded = {f.path: f for f in self.files()}
+        return list(self._loaded.values())
+
+    def unload(self):
+        ''' forgets the files kept by loadedFiles '''
+        self._loaded = None
+        return self
+
+    def where(self, **criteria):
+        '''
+        returns the fields across the project whose properties have all the values given
+        example: project.where(type='sum', hidden='yes')
+
+        :param criteria: property name = value pairs
+        :type criteria: str
+        :return: matching fields
+        :rtype: generator of Fields
+        '''
+        for f in self.loadedFiles():
+            yield from f.where(**criteria)
+
+    def getFieldsByTag(self, tag):
+        '''
+        returns the fields with a tag across the project. Each view answers from its tag index,
+        so the cost is a lookup per view plus the size of the result
+
+        :param tag: the tag
+        :type tag: str
+        :return: tagged fields
+        :rtype: generator of Fields
+        '''
+        for f in self.loadedFiles():
+            yield from f.getFieldsByTag(tag)
 
     def __getitem__(self, key):
         return self.file(key)
@@ -81,17 +479,25 @@ class project:
         if self.deploy_url:
             requests.get(self.deploy_url)
 
-    def files(self,path=''):
+    def files(self,path='',lazy=False):
         '''
-        Iteratively returns all the lkml files at a path in the project
+        Iteratively returns all the lkml files at a path in the project, subdirectories included, read from the project's branch
 
         :param path: directory you would like to return the files from
+        :param lazy: if True files are only fetched and parsed when their contents are first accessed
         :type arg1: str
+        :type arg2: bool
         :return: generator of LookML file objects
         :rtype: generator of lookml File objects
         '''
-        for f in  self.repo.get_contents(path):
-            yield lookml.File(f)
+        #directory listings leave each file's content to be fetched on first access, which keeps lazy files lazy
+        pending = [path]
+        while pending:
+            for f in self.repo.get_contents(pending.pop(0), ref=self.branch):
+                if f.type == 'dir':
+                    pending.append(f.path)
+                elif f.path.endswith('.lkml'):
+                    yield lookml.File(f, lazy=lazy)
 
     def file(self,path):
         '''
@@ -105,7 +511,7 @@ class project:
         :return: a single lookml File
         :rtype: File
         '''
-        return lookml.File(self.repo.get_contents(path))
+        return lookml.File(self.repo.get_contents(path, ref=self.branch))
 
     def update(self,f):
         '''
@@ -117,6 +523,7 @@ class project:
         :rtype: self
         '''
         self.repo.update_file(f.path, self.commitMessage, str(f), sha=f.sha, branch=self.branch)
+        self.invalidateIncludes(self._relativePath(f))
         return self
 
     def add(self,f):
@@ -129,6 +536,7 @@ class project:
         :rtype: self
         '''
         self.repo.create_file(f.path, self.commitMessage, str(f), branch=self.branch)
+        self.invalidateIncludes()
         return self
 
     def put(self,f):
@@ -162,6 +570,7 @@ class project:
         if isinstance(f,str):
             f = self.getFile(f)
         self.repo.delete_file(f.path, self.commitMessage, sha=f.sha, branch=self.branch)
+        self.invalidateIncludes()
         return self
 
 class shellProject(project):
@@ -253,6 +662,11 @@ class shellProject(project):
         def pushRemote(self):
             return self.call(' push origin ' + self.branch + ' ')
 
+        def output(self, command):
+            ''' runs a git command in the clone and returns what it printed, raising if it fails '''
+            return subprocess.run(' '.join(self.preamble) + 'git ' + self.gitDir + ' ' + command, shell=True, env=os.environ,
+                cwd=self.absoluteOutputPath, capture_output=True, text=True, check=True).stdout
+
     def __init__(self,*args, **kwargs):
         super(shellProject, self).__init__(*args,**kwargs)
         self.type = "ssh_shell"
@@ -262,19 +676,131 @@ class shellProject(project):
         assert(kwargs['git_url'] is not None)
         self.gitControllerSession.clone(kwargs['git_url'])
 
-    def files(self,path=''):
+    def paths(self,path=''):
+        '''
+        returns the paths of all the lkml files at a path in the project, sorted so every listing and load has the same order
+
+        :param path: directory you would like to return the paths from
+        :type arg1: str
+        :return: list of file paths
+        :rtype: list of str
+        '''
+        found = []
+        for root, dirs, files in os.walk(self.gitControllerSession.absoluteOutputPath + '/' + path, topdown=False):
+            for name in files:
+                if name.endswith('.lkml'):
+                    found.append(os.path.join(root, name))
+        return sorted(found)
+
+    def _indexEntries(self):
+        return references.localEntries(self.gitControllerSession.absoluteOutputPath, self.paths())
+
+    def _textEntries(self):
+        root = self.gitControllerSession.absoluteOutputPath
+        for p in self.paths():
+            with open(p, 'r') as tmp:
+                yield os.path.relpath(p, root), tmp.read()
+
+    def _changedPaths(self, base, head):
+        changed = self.gitControllerSession.output(' diff --name-only ' + base + ' ' + head).split()
+        if not head:
+            #against the working tree new files count too
+            changed += self.gitControllerSession.output(' ls-files --others --exclude-standard').split()
+        return changed
+
+    def _revisionLkml(self, revision, path):
+        try:
+            return lkml.load(self.gitControllerSession.output(' show ' + revision + ':' + path))
+        except subprocess.CalledProcessError:
+            return {}
+
+    def _relativePath(self, f):
+        return os.path.relpath(os.path.abspath(f.path if isinstance(f, lookml.File) else f), self.gitControllerSession.absoluteOutputPath)
+
+    def _listPaths(self):
+        root = self.gitControllerSession.absoluteOutputPath
+        found = []
+        for directory, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if d != '.git']
+            found.extend(os.path.relpath(os.path.join(directory, name), root) for name in files)
+        return found
+
+    def _readLkml(self, path):
+        from lookml.lookml import _load_lkml
+        fullPath = os.path.join(self.gitControllerSession.absoluteOutputPath, path)
+        return _load_lkml(fullPath, cache.active()), fullPath
+
+    def _readText(self, path):
+        with open(os.path.join(self.gitControllerSession.absoluteOutputPath, path), 'rb') as tmp:
+            data = tmp.read()
+        return data.decode('utf-8'), cache.blobSha(data)
+
+    def _writeTexts(self, texts):
+        '''
+        writes a batch of changed files, see project._writeTexts. Each file is written next to its target and swapped into place,
+        if anything fails the files already swapped get their old bytes back, so the working tree has the whole batch or none of it.
+        The batch is committed and pushed once
+        '''
+        root = self.gitControllerSession.absoluteOutputPath
+        originals = []
+        for path, text, sha in texts:
+            with open(os.path.join(root, path), 'rb') as tmp:
+                data = tmp.read()
+            if cache.blobSha(data) != sha:
+                raise Exception('nothing written, changed since it was read: %s' % path)
+            originals.append(data)
+        swapped = []
+        try:
+            for path, text, sha in texts:
+                target = os.path.join(root, path)
+                with open(target + '.partial', 'wb') as tmp:
+                    tmp.write(text.encode('utf-8'))
+                os.replace(target + '.partial', target)
+                swapped.append(target)
+        except:
+            for target, data in zip(swapped, originals):
+                with open(target, 'wb') as tmp:
+                    tmp.write(data)
+            for path, text, sha in texts:
+                if os.path.exists(os.path.join(root, path) + '.partial'):
+                    os.remove(os.path.join(root, path) + '.partial')
+            raise
+        for path, text, sha in texts:
+            self.invalidateIncludes(path)
+        if texts:
+            self.gitControllerSession.add().commit().pushRemote()
+        return self
+
+    def files(self,path='',workers=1,lazy=False):
         '''
         Iteratively returns all the lkml files at a path in the project
 
+        if workers is more than 1 the files are parsed in a pool of that many processes, None will use one process per cpu.
+        Files are still yielded in the same order as a serial load. When using workers on windows / mac os 
+        the calling script needs the usual if __name__ == '__main__': guard
+        if lazy is True nothing is read or parsed up front (workers is ignored), listing the project only costs the directory walk
+
         :param path: directory you would like to return the files from
+        :param workers: number of processes to parse with
+        :param lazy: return lazy files which parse on first access
         :type arg1: str
+        :type arg2: int
+        :type arg3: bool
         :return: generator of LookML file objects
         :rtype: generator of lookml File objects
         '''
-        for root, dirs, files in os.walk(self.gitControllerSession.absoluteOutputPath + '/' + path, topdown=False):
-            for name in files:
-                if name.endswith('.lkml'):
-                    yield lookml.File(os.path.join(root, name))
+        paths = self.paths(path)
+        if lazy or (workers is not None and workers <= 1):
+            for p in paths:
+                yield lookml.File(p, lazy=lazy)
+        else:
+            from lookml.lookml import _load_lkml
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                #chunk the work so each worker isn't sent one tiny file at a time
+                chunksize = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 4))
+                parsed = pool.map(_load_lkml, paths, itertools.repeat(cache.active()), chunksize=chunksize)
+                for p, json_data in zip(paths, parsed):
+                    yield lookml.File(p, json_data=json_data)
 
     def file(self,path):
         '''
@@ -300,6 +826,7 @@ class shellProject(project):
         :rtype: self
         '''
         f.write()
+        self.invalidateIncludes(self._relativePath(f))
         self.gitControllerSession.add().commit().pushRemote()
         return self
 
@@ -314,6 +841,7 @@ class shellProject(project):
         '''
         f.setFolder(self.gitControllerSession.absoluteOutputPath)
         f.write()
+        self.invalidateIncludes()
         self.gitControllerSession.add().commit().pushRemote()
         return self
 
@@ -365,6 +893,7 @@ class shellProject(project):
             os.remove(f.path)
         else:
             raise Exception('Not a File Insance or path')
+        self.invalidateIncludes()
         self.gitControllerSession.add().commit().pushRemote()
         return self
 
@@ -386,7 +915,7 @@ class githubProject(project):
         '''
         def checkgithub(f0):
             try:
-                self.repo.get_contents(f0)
+                self.repo.get_contents(f0, ref=self.branch)
                 return True
             except github.GithubException as e:
                 if e._GithubException__status == 404:
@@ -0,0 +1,560 @@
+import os, re, json, copy
+import lkml
+import lookml
+import lookml.modules.cache as cache
+from lkml.keys import EXPR_BLOCK_KEYS
+
+FIELD_TYPES = ('dimensions', 'dimension_groups', 'measures', 'filters', 'parameters')
+#liquid variables that look like an unqualified field reference but are not one
+LIQUID_BUILTINS = ('value', 'rendered_value', 'filterable_value', 'link', 'linked_value', 'model', 'view', 'explore', 'field')
+
+def _qualify(view, ref):
+    return ref if '.' in ref else view + '.' + ref
+
+def _strings(value):
+    ''' every string inside a raw lkml value '''
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _strings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _strings(v)
+
+def expressionReferences(view, text):
+    '''
+    the fields referenced in a sql / html string (or several at once), qualified with view when they are not already (None leaves them as written)
+    '''
+    for raw, field, fq in lookml.findReferences(text):
+        #liquid attributes of a field, i.e. {{ field._link }} or {{ view.field._rendered_value }}
+        field = field.split('._')[0]
+        if not field or field in LIQUID_BUILTINS or field.startswith('_'):
+            continue
+        yield field if view is None else _qualify(view, field)
+
+def _listRefs(view, fields):
+    ''' references in a drill_fields / set fields list, a set is referenced by its name followed by * '''
+    for field in fields:
+        field = field.lstrip('-')
+        if field and not field.startswith('ALL_FIELDS'):
+            yield field if view is None else _qualify(view, field)
+
+def extractReferences(json_data):
+    '''
+    finds the references in one parsed lkml file
+
+    :param json_data: the output of lkml.load
+    :type json_data: dict
+    :return: (source, target, type) for every reference, i.e. ('order_items.total', 'order_items.sale_price', 'sql').
+        Fields are named view.field, sets view.set*, explores by name and joins explore.join.
+        Views are referenced by name through extends, from, view_name and the name of an explore / join without a from
+    :rtype: list of tuples
+    '''
+    found = []
+    for view in json_data.get('views', []):
+        v = view['name']
+        found.extend((v, target, 'extends') for target in view.get('extends', []))
+        for fieldType in FIELD_TYPES:
+            for field in view.get(fieldType, []):
+                source = v + '.' + field['name']
+                for key, value in field.items():
+                    if (key.startswith('sql') or key == 'html') and isinstance(value, str):
+                        found.extend((source, target, key) for target in expressionReferences(v, value))
+                    elif key in ('links', 'actions'):
+                        found.extend((source, target, key[:-1]) for target in expressionReferences(v, _strings(value)))
+                    elif key == 'drill_fields':
+                        found.extend((source, target, key) for target in _listRefs(v, value))
+        if 'drill_fields' in view:
+            found.extend((v, target, 'drill_fields') for target in _listRefs(v, view['drill_fields']))
+        for s in view.get('sets', []):
+            found.extend((v + '.' + s['name'] + '*', target, 'set') for target in _listRefs(v, s.get('fields', [])))
+    for explore in json_data.get('explores', []):
+        e = explore['name']
+        if 'from' in explore or 'view_name' in explore:
+            found.extend((e, explore[key], key) for key in ('from', 'view_name') if key in explore)
+        else:
+            found.append((e, e, 'explore'))
+        for key, value in explore.items():
+            if key.startswith('sql') and isinstance(value, str):
+                found.extend((e, target, key) for target in expressionReferences(None, value))
+        found.extend((e, target, 'fields') for target in _listRefs(None, explore.get('fields', [])))
+        for join in explore.get('joins', []):
+            j = e + '.' + join['name']
+            found.append((j, join.get('from', join['name']), 'from' if 'from' in join else 'join'))
+            for key, value in join.items():
+                if key.startswith('sql') and isinstance(value, str):
+                    found.extend((j, target, key) for target in expressionReferences(None, value))
+            found.extend((j, target, 'fields') for target in _listRefs(None, join.get('fields', [])))
+    return found
+
+def extractDefinitions(json_data):
+    ''' the names of the views defined in one parsed lkml file '''
+    return [view['name'] for view in json_data.get('views', [])]
+
+def _renamers(old, new, family=(), aliases=()):
+    '''
+    the rules of a rename (see renameInLkml): text(value, own) rewrites the references in a string, item(entry, own) one entry
+    of a drill_fields / fields list or a filter's field, own being the view the value is in (None in an explore)
+    '''
+    oldView, dot, oldField = old.partition('.')
+    newView, _, newField = new.partition('.')
+    if dot:
+        views = set(family) | {oldView}
+        qualifiers = views | set(aliases)
+        def text(value, own):
+            for qualifier in qualifiers:
+                value = lookml.renameReferences(value, qualifier + '.' + oldField, qualifier + '.' + newField, view=own)
+            return value
+        def item(entry, own):
+            prefix = '-' if entry.startswith('-') else ''
+            qualifier, qualified, name = entry[len(prefix):].rpartition('.')
+            if qualified and qualifier in qualifiers and name == oldField:
+                return prefix + qualifier + '.' + newField
+            elif not qualified and own in views and name == oldField:
+                return prefix + newField
+            return entry
+    else:
+        def text(value, own):
+            return lookml.renameReferences(value, oldView, newView)
+        def item(entry, own):
+            prefix = '-' if entry.startswith('-') else ''
+            qualifier, qualified, name = entry[len(prefix):].partition('.')
+            return prefix + newView + '.' + name if qualified and qualifier == oldView else entry
+    return text, item
+
+def renameInLkml(json_data, old, new, family=(), aliases=()):
+    '''
+    applies a rename to one parsed lkml file: the definition, references in any string (sql, html, links, actions ...),
+    drill_fields, sets, fields lists and filters. A view rename also covers extends, from, view_name and the names of
+    explores / joins that refer to the view by their own name (an explore gets a view_name, a join is renamed)
+
+    :param json_data: the output of lkml.load, left unchanged
+    :param old: view.field for a field, a bare name for a view
+    :param new: the new name in the same form, a field keeps its view
+    :param family: for a field, the views extending its view, whose copy of the field is renamed too
+    :param aliases: for a field, the join / explore aliases of those views (from:), references through them are renamed
+    :type json_data: dict
+    :type old: str
+    :type new: str
+    :return: the renamed json_data and whether anything changed
+    :rtype: tuple
+    '''
+    renamed = copy.deepcopy(json_data)
+    oldView, dot, oldField = old.partition('.')
+    newView, _, newField = new.partition('.')
+    views = set(family) | {oldView}
+    text, item = _renamers(old, new, family, aliases)
+
+    def walk(node, own):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if isinstance(value, str):
+                    #only reference syntax (${}, liquid etc.) is rewritten, so any string can go through text
+                    node[key] = item(value, own) if key == 'field' else text(value, own)
+                elif key in ('drill_fields', 'fields') and isinstance(value, list) and all(isinstance(entry, str) for entry in value):
+                    node[key] = [item(entry, own) for entry in value]
+                else:
+                    walk(value, own)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value, own)
+
+    for view in renamed.get('views', []):
+        own = view['name']
+        if dot and own in views:
+            for fieldType in FIELD_TYPES:
+                for field in view.get(fieldType, []):
+                    if field['name'] == oldField:
+                        field['name'] = newField
+        elif not dot:
+            if own == oldView:
+                view['name'] = newView
+            if 'extends' in view:
+                view['extends'] = [newView if extended == oldView else extended for extended in view['extends']]
+        walk(view, own)
+    for explore in renamed.get('explores', []):
+        if not dot:
+            if 'from' not in explore and 'view_name' not in explore and explore['name'] == oldView:
+                explore['view_name'] = newView
+            for key in ('from', 'view_name'):
+                if explore.get(key) == oldView:
+                    explore[key] = newView
+            for join in explore.get('joins', []):
+                if join.get('from') == oldView:
+                    join['from'] = newView
+                elif 'from' not in join and join['name'] == oldView:
+                    join['name'] = newView
+        walk(explore, None)
+    return renamed, renamed != json_data
+
+#keys whose value runs to ;; (the lkml lexer only takes them when the : follows straight away)
+_expressionKeyRe = re.compile('(?:' + '|'.join(sorted(EXPR_BLOCK_KEYS, key=len, reverse=True)) + '):')
+_literalRe = re.compile(r'[^ \n\t:}{,\]]+')
+_gapRe = re.compile(r'(?:[ \n\t]+|#[^\n]*)*')
+
+def _spans(text):
+    '''
+    the tokens of lkml text as lkml's lexer reads them, each with where it is: (kind, start, end). kind is one of
+    { } [ ] : , ;; literal, quoted (the span is inside the quotes) or expression (a sql / html value without its trailing space)
+    '''
+    i, n = 0, len(text)
+    while True:
+        i = _gapRe.match(text, i).end()
+        if i >= n:
+            return
+        ch = text[i]
+        if ch == ';':
+            if not text.startswith(';;', i):
+                raise SyntaxError('unexpected ; at offset %d' % i)
+            yield ';;', i, i + 2
+            i += 2
+        elif ch == '"':
+            j = i + 1
+            while j < n and text[j] != '"':
+                j += 2 if text[j] == '\\' else 1
+            yield 'quoted', i + 1, j
+            i = j + 1
+        elif ch in '{}[]:,':
+            yield ch, i, i + 1
+            i += 1
+        else:
+            match = _expressionKeyRe.match(text, i)
+            if match:
+                yield 'literal', i, match.end() - 1
+                yield ':', match.end() - 1, match.end()
+                start = _gapRe.match(text, match.end()).end()
+                end = text.find(';;', start)
+                if end < 0:
+                    raise SyntaxError('%s at offset %d is not closed with ;;' % (text[i:match.end() - 1], i))
+                yield 'expression', start, start + len(text[start:end].rstrip())
+                i = end
+            else:
+                end = _literalRe.match(text, i).end()
+                yield 'literal', i, end
+                i = end
+
+def _outline(text):
+    '''
+    the structure of lkml text with the position of every name and value, nothing else of the text is kept.
+    A block is {'key', 'name': (start, end) of its name or None, 'open': the offset after its {, 'items'} and
+    each item is ('block', key, block), ('value', key, kind, start, end) or ('list', key, [(kind, start, end) ...])
+    '''
+    tokens = list(_spans(text))
+    position = [0]
+    def token(offset=0):
+        i = position[0] + offset
+        return tokens[i] if i < len(tokens) else ('end', len(text), len(text))
+    def block(key, name, opened):
+        node = {'key': key, 'name': name, 'open': opened, 'items': []}
+        while token()[0] not in ('}', 'end'):
+            kind, start, end = token()
+            if kind != 'literal' or token(1)[0] != ':':
+                raise SyntaxError('unexpected %s at offset %d' % (text[start:end] or kind, start))
+            itemKey = text[start:end]
+            position[0] += 2
+            kind, start, end = token()
+            if kind == '{':
+                position[0] += 1
+                node['items'].append(('block', itemKey, block(itemKey, None, end)))
+            elif kind == '[':
+                position[0] += 1
+                entries = []
+                while token()[0] not in (']', 'end'):
+                    if token()[0] != ',':
+                        entries.append(token())
+                    position[0] += 1
+                position[0] += 1
+                node['items'].append(('list', itemKey, entries))
+            elif kind in ('literal', 'quoted') and token(1)[0] == '{':
+                position[0] += 2
+                node['items'].append(('block', itemKey, block(itemKey, (start, end), token(-1)[2])))
+            elif kind in ('literal', 'quoted', 'expression'):
+                position[0] += 2 if kind == 'expression' else 1
+                node['items'].append(('value', itemKey, kind, start, end))
+            else:
+                raise SyntaxError('unexpected %s at offset %d' % (kind, start))
+        if key is not None:
+            if token()[0] != '}':
+                raise SyntaxError('%s is not closed' % key)
+            position[0] += 1
+        return node
+    root = block(None, None, 0)
+    if token()[0] != 'end':
+        raise SyntaxError('unexpected } at offset %d' % token()[1])
+    return root
+
+def renameInText(text, old, new, family=(), aliases=()):
+    '''
+    applies a rename to the text of a lkml file, with the same rules as renameInLkml. Only the names and references
+    involved are rewritten, every other character (comments, layout, quoting) stays as it was.
+    An explore named after a renamed view gets a view_name on the line after its {
+
+    :param text: the lkml
+    :param old: view.field for a field, a bare name for a view
+    :param new: the new name in the same form
+    :param family: see renameInLkml
+    :param aliases: see renameInLkml
+    :type text: str
+    :type old: str
+    :type new: str
+    :return: the renamed text and whether anything changed
+    :rtype: tuple
+    '''
+    oldView, dot, oldField = old.partition('.')
+    newView, _, newField = new.partition('.')
+    views = set(family) | {oldView}
+    rename, item = _renamers(old, new, family, aliases)
+    fieldKeys = tuple(fieldType[:-1] for fieldType in FIELD_TYPES)
+    edits = []
+    def replace(start, end, value):
+        if text[start:end] != value:
+            edits.append((start, end, value))
+    def name(node):
+        return text[node['name'][0]:node['name'][1]] if node['name'] else None
+    def values(node, key):
+        return [entry for entry in node['items'] if entry[0] == 'value' and entry[1] == key]
+    def blocks(node, *keys):
+        return [entry[2] for entry in node['items'] if entry[0] == 'block' and entry[1] in keys]
+    def renameValues(node, keys, old, new):
+        for entry in node['items']:
+            if entry[0] == 'value' and entry[1] in keys and text[entry[3]:entry[4]] == old:
+                replace(entry[3], entry[4], new)
+    def walk(node, own):
+        for entry in node['items']:
+            if entry[0] == 'value':
+                kind, key, valueKind, start, end = entry
+                value = text[start:end]
+                replace(start, end, item(value, own) if key == 'field' else rename(value, own))
+            elif entry[0] == 'list':
+                if entry[1] in ('drill_fields', 'fields'):
+                    for valueKind, start, end in entry[2]:
+                        replace(start, end, item(text[start:end], own))
+            else:
+                walk(entry[2], own)
+
+    root = _outline(text)
+    for view in blocks(root, 'view'):
+        own = name(view)
+        if dot and own in views:
+            for field in blocks(view, *fieldKeys):
+                if name(field) == oldField:
+                    replace(field['name'][0], field['name'][1], newField)
+        elif not dot:
+            if own == oldView:
+                replace(view['name'][0], view['name'][1], newView)
+            for entry in view['items']:
+                if entry[0] == 'list' and entry[1] == 'extends':
+                    for valueKind, start, end in entry[2]:
+                        if text[start:end] == oldView:
+                            replace(start, end, newView)
+        walk(view, own)
+    for explore in blocks(root, 'explore'):
+        if not dot:
+            if not values(explore, 'from') and not values(explore, 'view_name') and name(explore) == oldView:
+                opened = explore['open']
+                following = re.compile(r'[^\S\n]*(?:#[^\n]*)?\n(?:[ \t]*\n)*([ \t]*)').match(text, opened)
+                if following:
+                    edits.append((opened, opened, '\n' + following.group(1) + 'view_name: ' + newView))
+                else:
+                    edits.append((opened, opened, ' view_name: ' + newView))
+            renameValues(explore, ('from', 'view_name'), oldView, newView)
+            for join in blocks(explore, 'join'):
+                if values(join, 'from'):
+                    renameValues(join, ('from',), oldView, newView)
+                elif name(join) == oldView:
+                    replace(join['name'][0], join['name'][1], newView)
+        walk(explore, None)
+    if not edits:
+        return text, False
+    pieces, last = [], 0
+    for start, end, value in sorted(edits, key=lambda edit: edit[:2]):
+        pieces.append(text[last:start])
+        pieces.append(value)
+        last = end
+    pieces.append(text[last:])
+    return ''.join(pieces), True
+
+class referenceIndex:
+    '''
+        An index of the references between fields across a project: who references a field and what a field references.
+        References are collected from sql (sql, sql_on, sql_where etc.), html, link, action, drill_fields and sets.
+        It is kept per file along with the file's git blob sha, so refresh only parses files which changed
+        and the whole index can be saved to / loaded from a json file between runs.
+    '''
+    VERSION = 2
+
+    def __init__(self):
+        self.files = {}
+        self.referencedBy = {}
+        self.referencing = {}
+        self.definitions = {}
+        #view -> (target, source, type, path) for every reference to the view or to one of its fields / sets
+        self.referencedByView = {}
+
+    def addFile(self, path, json_data, sha=''):
+        '''
+        indexes (or re-indexes) one file
+
+        :param path: the file's path in the project
+        :param json_data: the parsed file
+        :param sha: the file's git blob sha, used by refresh to skip unchanged files
+        :type path: str
+        :type json_data: dict
+        :type sha: str
+        :return: self
+        :rtype: referenceIndex
+        '''
+        return self._setFile(path, sha, extractReferences(json_data), extractDefinitions(json_data))
+
+    def _setFile(self, path, sha, refs, views):
+        self.removeFile(path)
+        self.files[path] = {'sha': sha, 'refs': refs, 'views': views}
+        for view in views:
+            self.definitions.setdefault(view, set()).add(path)
+        for source, target, refType in refs:
+            self.referencedBy.setdefault(target, set()).add((source, refType, path))
+            self.referencing.setdefault(source, set()).add((target, refType, path))
+            self.referencedByView.setdefault(target.split('.')[0], set()).add((target, source, refType, path))
+        return self
+
+    def removeFile(self, path):
+        ''' drops everything indexed from a file '''
+        entry = self.files.pop(path, None)
+        if entry is not None:
+            for view in entry['views']:
+                self._discard(self.definitions, view, path)
+            for source, target, refType in entry['refs']:
+                self._discard(self.referencedBy, target, (source, refType, path))
+                self._discard(self.referencing, source, (target, refType, path))
+                self._discard(self.referencedByView, target.split('.')[0], (target, source, refType, path))
+        return self
+
+    def _discard(self, index, key, item):
+        entry = index.get(key)
+        if entry is not None:
+            entry.discard(item)
+            if not entry:
+                del index[key]
+
+    def refresh(self, entries):
+        '''
+        brings the index up to date with a project's files
+
+        :param entries: (path, sha, load) for every lkml file in the project, load() returns the parsed file
+            and is only called when the sha differs from the indexed one
+        :type entries: iterable of tuples
+        :return: the paths which were (re)indexed or removed
+        :rtype: list of str
+        '''
+        changed, seen = [], set()
+        for path, sha, load in entries:
+            seen.add(path)
+            if path not in self.files or not sha or self.files[path]['sha'] != sha:
+                self.addFile(path, load(), sha)
+                changed.append(path)
+        for path in list(self.files.keys()):
+            if path not in seen:
+                self.removeFile(path)
+                changed.append(path)
+        return changed
+
+    def _key(self, field):
+        return field if isinstance(field, str) else field.__refr__
+
+    def _records(self, items, key, keyName, otherName):
+        return [{keyName: key, otherName: other, 'type': refType, 'file': path} for other, refType, path in sorted(items)]
+
+    def whoReferences(self, field):
+        '''
+        returns every place a field (or set / view name) is referenced
+
+        :param field: a Field in a view, or its fully qualified name i.e. 'order_items.sale_price'
+        :type field: Field or str
+        :return: [{'source': referencing location, 'target': field, 'type': property, 'file': path}]
+        :rtype: list of dict
+        '''
+        key = self._key(field)
+        return self._records(self.referencedBy.get(key, ()), key, 'target', 'source')
+
+    def referencesOf(self, field):
+        '''
+        returns everything a field (or set / explore / join) references
+
+        :param field: a Field in a view, or its fully qualified name i.e. 'order_items.total_sale_price'
+        :type field: Field or str
+        :return: [{'source': field, 'target': referenced field, 'type': property, 'file': path}]
+        :rtype: list of dict
+        '''
+        key = self._key(field)
+        return self._records(self.referencing.get(key, ()), key, 'source', 'target')
+
+    def definedIn(self, view):
+        '''
+        the files which define a view
+
+        :param view: the view's name
+        :type view: str
+        :return: file paths
+        :rtype: list of str
+        '''
+        return sorted(self.definitions.get(view, ()))
+
+    def filesReferencingView(self, view):
+        '''
+        the files with any reference to a view: by name (extends, from, view_name, explore / join names) or to one of its fields
+
+        :param view: the view's name
+        :type view: str
+        :return: file paths
+        :rtype: set of str
+        '''
+        return set(path for target, source, refType, path in self.referencedByView.get(view, ()))
+
+    def save(self, path):
+        ''' writes the index to a json file (atomically, a reader never sees a partial index) '''
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        tmpPath = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmpPath, 'w') as tmp:
+            json.dump({'version': self.VERSION, 'files': self.files}, tmp)
+        os.replace(tmpPath, path)
+        return self
+
+    @classmethod
+    def load(cls, path):
+        '''
+        reads an index written by save, an unreadable or out of date file gives an empty index
+
+        :param path: the json file
+        :type path: str
+        :return: the index
+        :rtype: referenceIndex
+        '''
+        index = cls()
+        try:
+            with open(path, 'r') as tmp:
+                saved = json.load(tmp)
+        except (OSError, ValueError):
+            return index
+        if saved.get('version') == cls.VERSION:
+            for filePath, entry in saved['files'].items():
+                index._setFile(filePath, entry['sha'], [tuple(ref) for ref in entry['refs']], entry['views'])
+        return index
+
+def localEntries(root, paths):
+    '''
+    (path, sha, load) entries for files on disk, paths are stored relative to root. Parsing goes through
+    the configured parse cache if there is one
+    '''
+    for p in paths:
+        with open(p, 'rb') as tmp:
+            data = tmp.read()
+        sha = cache.blobSha(data)
+        parseCache = cache.active()
+        if parseCache is not None:
+            load = lambda data=data, sha=sha: parseCache.load(data, sha=sha)
+        else:
+            load = lambda data=data: lkml.load(data.decode('utf-8'))
+        yield os.path.relpath(p, root), sha, load
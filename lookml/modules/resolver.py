@@ -0,0 +1,636 @@
+import copy, itertools, re
+import lookml
+import lookml.config as conf
+from lookml.modules.references import FIELD_TYPES
+
+#lists of named items which merge item by item, anything else set by an extending view or refinement replaces the inherited value
+MERGED_BY_NAME = FIELD_TYPES + ('sets', 'joins')
+#fields a duration dimension_group creates when it lists no intervals
+DURATION_INTERVALS = ['day', 'hour', 'minute', 'month', 'quarter', 'second', 'week', 'year']
+#the aggregate a measure type runs its sql through
+AGGREGATES = {'sum': 'SUM({})', 'sum_distinct': 'SUM(DISTINCT {})', 'average': 'AVG({})', 'average_distinct': 'AVG(DISTINCT {})',
+    'min': 'MIN({})', 'max': 'MAX({})', 'median': 'MEDIAN({})', 'count': 'COUNT({})', 'count_distinct': 'COUNT(DISTINCT {})'}
+#expansions which need no parentheses when substituted into another expression
+_simpleSql = re.compile(r'^[\w.`"\[\]]*$')
+#the view level references findReferences does not cover
+_tableRe = re.compile(r'\$\{(?:TABLE|(\w+)\.SQL_TABLE_NAME)\}')
+#describe how a view is extended rather than what it contains, so they are not inherited
+NOT_INHERITED = ('name', 'extends', 'extension')
+
+def mergeView(base, override, skip=()):
+    '''
+    layers one raw view over another the way lookml does for extends and refinements: fields and sets are
+    merged by name (the override's properties win per property), every other property is replaced.
+    Explore refinements are layered the same way, joins merging by name
+
+    :param base: raw view (json_data['views'] entry) being extended or refined
+    :param override: raw view layered on top
+    :param skip: keys of override to leave out
+    :type base: dict
+    :type override: dict
+    :type skip: tuple
+    :return: a new raw view, base and override are left untouched
+    :rtype: dict
+    '''
+    merged = dict(base)
+    for key, value in override.items():
+        if key in skip:
+            continue
+        if key in MERGED_BY_NAME and key in merged:
+            byName = {item['name']: item for item in merged[key]}
+            for item in value:
+                byName[item['name']] = dict(byName[item['name']], **item) if item['name'] in byName else item
+            merged[key] = list(byName.values())
+        else:
+            merged[key] = value
+    return merged
+
+class extendsResolver:
+    '''
+        Materializes the effective view behind a name: its extends chain merged in order (later parents win),
+        then the view itself, then its +view refinements in the order their files were added.
+        Views may be spread over any number of files. Every node of the extends graph is resolved once and memoized,
+        so resolving siblings reuses their common ancestors. When a file is added again or removed only the views
+        it defines or refines and the views extending them (directly or not) are resolved again
+    '''
+    def __init__(self):
+        #path -> names of the views defined / refined in the file, in the order files were first added
+        self.files = {}
+        #path -> git blob sha the file was added at (see refresh)
+        self.shas = {}
+        #path -> position of the file in refinement order
+        self.order = {}
+        self._positions = itertools.count()
+        #name -> [(path, raw)] definitions and refinements
+        self.definitions = {}
+        self.refinements = {}
+        #extends graph, name -> parents in order and name -> names extending it
+        self.parents = {}
+        self.children = {}
+        #name -> (raw view, origins)
+        self._resolved = {}
+        #called with the names dropped whenever views are invalidated, so caches built on resolved views can follow
+        self.listeners = []
+
+    def addFile(self, path, json_data):
+        '''
+        adds (or replaces) the views and refinements of one parsed lkml file
+
+        :param path: file path, a file added again replaces its previous content but keeps its place in refinement order
+        :param json_data: the output of lkml.load
+        :type path: str
+        :type json_data: dict
+        :return: the names whose memoized resolution was dropped
+        :rtype: set
+        '''
+        stale = self._drop(path)
+        names = []
+        for view in json_data.get('views', []):
+            name = view['name']
+            target = self.refinements if name.startswith('+') else self.definitions
+            name = name.lstrip('+')
+            target.setdefault(name, []).append((path, view))
+            names.append(name)
+        self.files[path] = names
+        if path not in self.order:
+            self.order[path] = next(self._positions)
+        for name in set(names):
+            self._relink(name)
+            stale |= self.invalidate(name)
+        return stale
+
+    def removeFile(self, path):
+        ''' forgets a file's views and refinements, returns the names whose memoized resolution was dropped '''
+        stale = self._drop(path)
+        self.files.pop(path, None)
+        self.shas.pop(path, None)
+        self.order.pop(path, None)
+        return stale
+
+    def _drop(self, path):
+        stale = set()
+        for name in set(self.files.get(path, ())):
+            for target in (self.definitions, self.refinements):
+                entries = [entry for entry in target.get(name, ()) if entry[0] != path]
+                if entries:
+                    target[name] = entries
+                else:
+                    target.pop(name, None)
+            stale |= self.invalidate(name)
+            self._relink(name)
+        return stale
+
+    def _layers(self, name):
+        ''' the definition(s) then the refinements of a view, refinements in file order '''
+        if name not in self.refinements:
+            return self.definitions.get(name, [])
+        return self.definitions.get(name, []) + sorted(self.refinements[name], key=lambda entry: self.order[entry[0]])
+
+    def _relink(self, name):
+        ''' recomputes the extends edges out of a view from its current definition and refinements '''
+        for parent in self.parents.pop(name, ()):
+            self.children[parent].discard(name)
+            if not self.children[parent]:
+                del self.children[parent]
+        parents = []
+        for path, raw in self._layers(name):
+            parents.extend(parent for parent in raw.get('extends', []) if parent not in parents)
+        if parents:
+            self.parents[name] = parents
+            for parent in parents:
+                self.children.setdefault(parent, set()).add(name)
+
+    def invalidate(self, name):
+        '''
+        drops the memoized resolution of a view and of every view extending it, directly or not
+
+        :param name: view name
+        :type name: str
+        :return: the names dropped (resolved or not)
+        :rtype: set
+        '''
+        stale = self._walk(name)
+        for current in stale:
+            self._resolved.pop(current, None)
+        for listener in self.listeners:
+            listener(stale)
+        return stale
+
+    def descendants(self, name):
+        ''' the names of every view extending a view, directly or not '''
+        return self._walk(name) - {name}
+
+    def _walk(self, name):
+        seen, pending = set(), [name]
+        while pending:
+            current = pending.pop()
+            if current not in seen:
+                seen.add(current)
+                pending.extend(self.children.get(current, ()))
+        return seen
+
+    def refresh(self, entries):
+        '''
+        brings the resolver up to date with a project's files, see references.referenceIndex.refresh
+
+        :param entries: (path, sha, load) for every lkml file, load() is only called when the sha changed
+        :type entries: iterable of tuples
+        :return: the names whose memoized resolution was dropped
+        :rtype: set
+        '''
+        stale, seen = set(), set()
+        for path, sha, load in entries:
+            seen.add(path)
+            if path not in self.shas or not sha or self.shas[path] != sha:
+                stale |= self.addFile(path, load())
+                self.shas[path] = sha
+        for path in list(self.files.keys()):
+            if path not in seen:
+                stale |= self.removeFile(path)
+        return stale
+
+    def _resolve(self, name, resolving=()):
+        if name in self._resolved:
+            return self._resolved[name]
+        if name in resolving:
+            raise Exception('circular extends: ' + ' -> '.join(resolving + (name,)))
+        if name not in self.definitions:
+            raise KeyError('view ' + name + ' is not defined in any added file')
+        merged, origins = {}, {}
+        for parent in self.parents.get(name, ()):
+            parentView, parentOrigins = self._resolve(parent, resolving + (name,))
+            merged = mergeView(merged, parentView, skip=NOT_INHERITED)
+            for field, chain in parentOrigins.items():
+                inherited = origins.get(field, ())
+                origins[field] = inherited + tuple(source for source in chain if source not in inherited)
+        for path, raw in self._layers(name):
+            merged = mergeView(merged, raw, skip=('name',))
+            source = raw['name']
+            for fieldType in FIELD_TYPES:
+                for field in raw.get(fieldType, []):
+                    origins[field['name']] = origins.get(field['name'], ()) + (source,)
+        merged['name'] = name
+        merged.pop('extends', None)
+        self._resolved[name] = (merged, origins)
+        return self._resolved[name]
+
+    def resolve(self, name):
+        '''
+        the effective raw view behind a name, memoized. The result is shared with the memo, copy it before changing it
+        (view() returns an independent View)
+
+        :param name: view name
+        :type name: str
+        :return: raw view with every inherited and refined field and property in place, without extends
+        :rtype: dict
+        '''
+        return self._resolve(name)[0]
+
+    def origins(self, name):
+        '''
+        where each field of a resolved view comes from
+
+        :param name: view name
+        :type name: str
+        :return: field name -> the views (and +view refinements) defining it, from the first definition to the one that wins
+        :rtype: dict
+        '''
+        return self._resolve(name)[1]
+
+    def view(self, name):
+        '''
+        the effective view as a View object, independent of the memo
+
+        :param name: view name
+        :type name: str
+        :rtype: View
+        '''
+        return lookml.View(copy.deepcopy(self.resolve(name)))
+
+def fieldNames(field, fieldType):
+    '''
+    the names a raw field can be selected by, one per timeframe / interval for a dimension_group
+
+    :param field: raw field
+    :param fieldType: the json_data key it is listed under, i.e. 'dimension_groups'
+    :type field: dict
+    :type fieldType: str
+    :rtype: list of str
+    '''
+    if fieldType != 'dimension_groups':
+        return [field['name']]
+    if field.get('type') == 'duration':
+        return [interval + 's_' + field['name'] for interval in field.get('intervals', DURATION_INTERVALS)]
+    return [field['name'] + '_' + timeframe for timeframe in field.get('timeframes', conf.TIMEFRAMES)]
+
+class exploreResolver:
+    '''
+        Computes the field universe of explores: every field of the base view and the joined views, under the alias
+        they are reached by (the explore or join name when from: sets the view, the view's own name for view_name:), narrowed by the joins' and
+        the explore's fields: and labelled with the view_label a user sees.
+        Views are resolved through an extendsResolver, so extends and refinements apply. Each universe is memoized
+        until a file defining the explore, or any view it reaches (or a view those extend), changes
+    '''
+    def __init__(self, views=None):
+        self.views = views if views is not None else extendsResolver()
+        #path -> explore names, name -> [(path, raw)] definitions / refinements
+        self.files = {}
+        self.definitions = {}
+        self.refinements = {}
+        #explore name -> universe, and view name -> explores whose universe used it
+        self._universes = {}
+        self._usedBy = {}
+
+    def addFile(self, path, json_data):
+        '''
+        adds (or replaces) the views, refinements and explores of one parsed lkml file
+
+        :param path: file path
+        :param json_data: the output of lkml.load
+        :type path: str
+        :type json_data: dict
+        :return: the explores whose memoized universe was dropped
+        :rtype: set
+        '''
+        stale = self._drop(path)
+        names = []
+        for explore in json_data.get('explores', []):
+            name = explore['name']
+            target = self.refinements if name.startswith('+') else self.definitions
+            name = name.lstrip('+')
+            target.setdefault(name, []).append((path, explore))
+            names.append(name)
+        self.files[path] = names
+        stale.update(names)
+        for view in self.views.addFile(path, json_data):
+            stale |= self._usedBy.get(view, set())
+        return self._invalidate(stale)
+
+    def removeFile(self, path):
+        ''' forgets a file's views and explores, returns the explores whose memoized universe was dropped '''
+        stale = self._drop(path)
+        self.files.pop(path, None)
+        for view in self.views.removeFile(path):
+            stale |= self._usedBy.get(view, set())
+        return self._invalidate(stale)
+
+    def refresh(self, entries):
+        '''
+        brings the resolver (and its extendsResolver) up to date with a project's files, see references.referenceIndex.refresh
+
+        :param entries: (path, sha, load) for every lkml file, load() is only called when the sha changed
+        :type entries: iterable of tuples
+        :return: the explores whose memoized universe was dropped
+        :rtype: set
+        '''
+        stale, seen = set(), set()
+        for path, sha, load in entries:
+            seen.add(path)
+            if path not in self.views.shas or not sha or self.views.shas[path] != sha:
+                stale |= self.addFile(path, load())
+                self.views.shas[path] = sha
+        for path in set(self.files) | set(self.views.files):
+            if path not in seen:
+                stale |= self.removeFile(path)
+        return stale
+
+    def _drop(self, path):
+        names = set(self.files.get(path, ()))
+        for name in names:
+            for target in (self.definitions, self.refinements):
+                entries = [entry for entry in target.get(name, ()) if entry[0] != path]
+                if entries:
+                    target[name] = entries
+                else:
+                    target.pop(name, None)
+        return names
+
+    def _invalidate(self, names):
+        for name in names:
+            self._universes.pop(name, None)
+        for view in list(self._usedBy):
+            self._usedBy[view] -= names
+            if not self._usedBy[view]:
+                del self._usedBy[view]
+        return names
+
+    def resolve(self, name):
+        '''
+        the explore behind a name with its refinements applied, in the order their files were added
+
+        :param name: explore name
+        :type name: str
+        :rtype: dict
+        '''
+        if name not in self.definitions:
+            raise KeyError('explore ' + name + ' is not defined in any added file')
+        merged = {}
+        for path, raw in self.definitions[name] + sorted(self.refinements.get(name, ()), key=lambda entry: self.views.order[entry[0]]):
+            merged = mergeView(merged, raw, skip=('name',))
+        merged['name'] = name
+        return merged
+
+    def aliases(self, name):
+        '''
+        how each view is reached in an explore
+
+        :param name: explore name
+        :type name: str
+        :return: (alias, view name, raw explore or join) for the base view, then each join
+        :rtype: list of tuples
+        '''
+        explore = self.resolve(name)
+        if 'from' in explore:
+            #from: renames the base view to the explore name
+            found = [(name, explore['from'], explore)]
+        else:
+            #view_name: keeps the view's own name
+            view = explore.get('view_name', name)
+            found = [(view, view, explore)]
+        for join in explore.get('joins', []):
+            found.append((join['name'], join.get('from', join['name']), join))
+        return found
+
+    def _setFields(self, view, setName, seen=()):
+        ''' the field names in a set of a resolved view, nested sets expanded '''
+        for s in view.get('sets', []):
+            if s['name'] == setName:
+                for field in s.get('fields', []):
+                    if field.endswith('*'):
+                        if field[:-1] not in seen:
+                            yield from self._setFields(view, field[:-1].split('.')[-1], seen + (setName,))
+                    else:
+                        yield field.split('.')[-1]
+
+    def _selected(self, names, entries, view, alias):
+        '''
+        applies a fields: list to entries (qualified name -> entry). Exclusions start from every field when
+        nothing else is listed or ALL_FIELDS* is
+        '''
+        included, excluded = set(), set()
+        for item in names:
+            target = excluded if item.startswith('-') else included
+            item = item.lstrip('-')
+            if item == 'ALL_FIELDS*':
+                target.update(entries)
+                continue
+            qualifier, dot, field = item.rpartition('.')
+            qualifier = qualifier or alias
+            if field.endswith('*'):
+                fields = self._setFields(view(qualifier), field[:-1]) if view(qualifier) else ()
+            else:
+                fields = (field,)
+            for field in fields:
+                key = qualifier + '.' + field
+                #a dimension_group can be listed by its own name
+                target.update(k for k, entry in entries.items() if k == key or (entry['group'] == field and k.startswith(qualifier + '.')))
+        if not included and excluded:
+            included = set(entries)
+        return {k: entries[k] for k in entries if k in included and k not in excluded}
+
+    def universe(self, name):
+        '''
+        every field a user can reach in an explore, memoized until something it depends on changes
+
+        :param name: explore name
+        :type name: str
+        :return: alias.field -> {'view': view name, 'field': the field's name in its view, 'type': dimension / measure etc.,
+            'group': the dimension_group it comes from or None, 'view_label': the label it is grouped under}
+        :rtype: dict
+        '''
+        if name not in self._universes:
+            entries, views, used = {}, {}, set()
+            aliases = self.aliases(name)
+            for alias, viewName, source in aliases:
+                raw = self.views.resolve(viewName)
+                views[alias] = raw
+                #a change to a view this one extends drops it from the view resolver too, so the views used directly are enough
+                used.add(viewName)
+                label = source.get('view_label', raw.get('view_label', alias))
+                joined = {}
+                for fieldType in FIELD_TYPES:
+                    for field in raw.get(fieldType, []):
+                        for fieldName in fieldNames(field, fieldType):
+                            joined[alias + '.' + fieldName] = {
+                                 'view': viewName
+                                ,'field': fieldName
+                                ,'type': fieldType[:-1]
+                                ,'group': field['name'] if fieldType == 'dimension_groups' else None
+                                ,'view_label': field.get('view_label', label)
+                            }
+                if source is not aliases[0][2] and 'fields' in source:
+                    joined = self._selected(source['fields'], joined, views.get, alias)
+                entries.update(joined)
+            explore = aliases[0][2]
+            if 'fields' in explore:
+                entries = self._selected(explore['fields'], entries, views.get, aliases[0][0])
+            self._universes[name] = entries
+            for viewName in used:
+                self._usedBy.setdefault(viewName, set()).add(name)
+        return dict(self._universes[name])
+
+    def explore(self, name):
+        '''
+        the explore as an Explore object linked to its views: base_view is the base View and each join's to is its View,
+        all resolved through extends and refinements
+
+        :param name: explore name
+        :type name: str
+        :rtype: Explore
+        '''
+        raw = copy.deepcopy(self.resolve(name))
+        e = lookml.Explore(raw)
+        aliases = self.aliases(name)
+        views = {alias: viewName for alias, viewName, source in aliases}
+        e.base_view = self.views.view(aliases[0][1])
+        for join in e.getJoins():
+            join.setTo(self.views.view(views[join.identifier]))
+        return e
+
+def tableSql(raw, name):
+    ''' what ${view.SQL_TABLE_NAME} stands for: the derived table's sql in parentheses, else sql_table_name, else the view name '''
+    derived = raw.get('derived_table')
+    if isinstance(derived, dict) and 'sql' in derived:
+        return '(' + derived['sql'].strip() + ')'
+    return raw.get('sql_table_name', name)
+
+class sqlExpander:
+    '''
+        Expands the ${} references in fields' sql recursively: ${field} and ${view.field} become the referenced field's
+        expanded sql (in parentheses unless it is a bare column), ${TABLE} the view's alias and ${view.SQL_TABLE_NAME}
+        its table or derived table. A dimension without sql is ${TABLE}.name, a timeframe of a dimension_group is the
+        group's sql and a measure is wrapped in the aggregate of its type. Liquid is left as written, and so is
+        any reference lookup can not find.
+        Every field is expanded once: shared subexpressions come from the memo, which records the views each
+        expansion read so invalidate drops exactly the expansions a changed view feeds
+    '''
+    def __init__(self, lookup, table=None):
+        '''
+        :param lookup: (view, name) -> (json_data key the field is listed under, raw field, the field's own name) or None when
+            there is no such field (the own name differs from name for a dimension_group timeframe)
+        :param table: view -> its sql_table_name / derived table sql, or None
+        :type lookup: callable
+        :type table: callable
+        '''
+        self.lookup = lookup
+        self.table = table if table is not None else (lambda view: None)
+        #(view, name) -> expanded sql, the views it read, and view -> the keys which read it
+        self.memo = {}
+        self._read = {}
+        self._readers = {}
+
+    @classmethod
+    def forViews(cls, views):
+        '''
+        an expander over the views of an extendsResolver (extends and refinements applied), kept up to date with it
+        through a listener which stays registered for the life of the resolver
+
+        :param views: the resolver
+        :type views: extendsResolver
+        :rtype: sqlExpander
+        '''
+        names = {}
+        def lookup(view, name):
+            if view not in views.definitions:
+                return None
+            if view not in names:
+                names[view] = {}
+                for fieldType in FIELD_TYPES:
+                    for field in views.resolve(view).get(fieldType, []):
+                        for fieldName in fieldNames(field, fieldType):
+                            names[view][fieldName] = (fieldType, field, field['name'])
+                        names[view].setdefault(field['name'], (fieldType, field, field['name']))
+            return names[view].get(name)
+        def table(view):
+            if view not in views.definitions:
+                return None
+            return tableSql(views.resolve(view), view)
+        expander = cls(lookup, table)
+        def invalidate(stale):
+            for view in stale:
+                names.pop(view, None)
+            expander.invalidate(stale)
+        views.listeners.append(invalidate)
+        return expander
+
+    def invalidate(self, views):
+        ''' drops every expansion which read one of the views '''
+        for view in views:
+            for key in self._readers.pop(view, ()):
+                self.memo.pop(key, None)
+                self._read.pop(key, None)
+        return self
+
+    def expand(self, view, name):
+        '''
+        the fully expanded sql of a field, raises on circular references
+
+        :param view: view name
+        :param name: field name (a dimension_group timeframe such as created_date works)
+        :type view: str
+        :type name: str
+        :return: the expanded sql, None when there is no such field
+        :rtype: str
+        '''
+        return self._expand(view, name, ())[0]
+
+    def _expand(self, view, name, resolving):
+        key = (view, name)
+        if key in self.memo:
+            return self.memo[key], self._read[key]
+        if key in resolving:
+            raise Exception('circular reference: ' + ' -> '.join(v + '.' + n for v, n in resolving[resolving.index(key):] + (key,)))
+        found = self.lookup(view, name)
+        if found is None:
+            return None, {view}
+        fieldType, field, fieldName = found
+        sql = field.get('sql')
+        if sql is None:
+            sql = '' if fieldType == 'measures' else '${TABLE}.' + fieldName
+        text, read = self._substitute(view, sql.strip(), resolving + (key,))
+        if fieldType == 'measures' and field.get('type', 'count') in AGGREGATES:
+            text = AGGREGATES[field.get('type', 'count')].format(text or '*')
+        self.memo[key] = text
+        self._read[key] = read
+        for readView in read:
+            self._readers.setdefault(readView, set()).add(key)
+        return text, read
+
+    def substitute(self, view, sql):
+        '''
+        expands the references in any sql written in a view (i.e. an sql_always_where or a draft expression)
+
+        :param view: the view the sql is in, unqualified references are to its fields
+        :param sql: the sql
+        :type view: str
+        :type sql: str
+        :rtype: str
+        '''
+        return self._substitute(view, sql, ())[0]
+
+    def _substitute(self, view, sql, resolving):
+        read = {view}
+        def table(match):
+            if match.group(1) is None:
+                #a field outside any view keeps its ${TABLE}
+                return view or match.group(0)
+            read.add(match.group(1))
+            replacement = self.table(match.group(1))
+            return match.group(0) if replacement is None else replacement
+        sql = _tableRe.sub(table, sql)
+        pieces, last = [], 0
+        for raw, reference, fq, offset in lookml.findReferences(sql, offsets=True):
+            if not raw.startswith('${'):
+                continue
+            qualifier, dot, name = reference.rpartition('.')
+            qualifier = qualifier or view
+            read.add(qualifier)
+            replacement, nested = self._expand(qualifier, name, resolving)
+            read.update(nested)
+            if replacement is not None:
+                if not _simpleSql.match(replacement) and raw != sql:
+                    replacement = '(' + replacement + ')'
+                pieces.extend((sql[last:offset], replacement))
+                last = offset + len(raw)
+        pieces.append(sql[last:])
+        return ''.join(pieces), read
@@ -0,0 +1,154 @@
+import re, bisect
+import lookml
+import lookml.modules.resolver as resolver
+from lookml.modules.references import FIELD_TYPES, LIQUID_BUILTINS
+
+#where a top level block starts, references after it and before the next one belong to it (only views / explores are checked)
+_blockRe = re.compile(r'^[ \t]*(view|explore|datagroup|access_grant|test|map_layer)[ \t]*:[ \t]*\+?(\w+)', re.M)
+#sql (sql, sql_on, sql_where, sql_trigger_value ...) and html values run to ;;
+_expressionRe = re.compile(r'\b(sql\w*|html)[ \t]*:(.*?);;', re.S)
+_drillRe = re.compile(r'\bdrill_fields[ \t]*:[ \t]*\[([^\]]*)\]')
+#a # starts a comment outside quoted strings and sql / html blocks (a # inside those is part of the value)
+_commentRe = re.compile(r'"(?:\\.|[^"\\])*"|\b(?:sql\w*|html)[ \t]*:.*?;;|(#[^\n]*)', re.S)
+#${view.SQL_TABLE_NAME} and ${TABLE} are not fields
+VIEW_ATTRIBUTES = ('SQL_TABLE_NAME', 'TABLE')
+
+def _maskComments(text):
+    ''' blanks out comments, keeping every other character where it was so offsets and line numbers still hold '''
+    return _commentRe.sub(lambda m: ' ' * len(m.group(0)) if m.group(1) else m.group(0), text)
+
+class symbolTable:
+    '''
+        Every view and field of a project, for checking references offline. Views are resolved through an
+        exploreResolver (so inherited and refined fields count) and each view's names are built once
+        and kept until the resolver drops the view. Lookups are set membership, so validating a project
+        costs one pass over its text plus a constant per reference
+    '''
+    def __init__(self, explores=None):
+        self.explores = explores if explores is not None else resolver.exploreResolver()
+        self.views = self.explores.views
+        #view -> (resolved raw view the names were built from, names)
+        self._names = {}
+
+    def addFile(self, path, json_data):
+        self.explores.addFile(path, json_data)
+        return self
+
+    def removeFile(self, path):
+        self.explores.removeFile(path)
+        return self
+
+    def refresh(self, entries):
+        ''' see resolver.exploreResolver.refresh '''
+        self.explores.refresh(entries)
+        return self
+
+    def hasView(self, name):
+        return name in self.views.definitions
+
+    def fields(self, view):
+        '''
+        the names a view's fields and sets are referenced by: fields (one per timeframe for a dimension_group) and set*
+
+        :param view: view name
+        :type view: str
+        :return: names, empty for a view which is not defined
+        :rtype: set
+        '''
+        if not self.hasView(view):
+            return set()
+        try:
+            raw = self.views.resolve(view)
+        except Exception:
+            #circular extends, the view's own fields still count
+            raw = self.views.definitions[view][0][1]
+        cached = self._names.get(view)
+        if cached is None or cached[0] is not raw:
+            names = set(s['name'] + '*' for s in raw.get('sets', []))
+            for fieldType in FIELD_TYPES:
+                for field in raw.get(fieldType, []):
+                    names.update(resolver.fieldNames(field, fieldType))
+            cached = self._names[view] = (raw, names)
+        return cached[1]
+
+    def aliases(self, explore):
+        ''' alias -> view name for the base view and joins of an explore, empty for an explore which is not defined '''
+        if explore not in self.explores.definitions:
+            return {}
+        return {alias: view for alias, view, source in self.explores.aliases(explore)}
+
+    def check(self, reference, kind, context, aliases=None):
+        '''
+        checks one reference
+
+        :param reference: the field as written, i.e. 'users.id', 'id' or 'detail*'
+        :param kind: 'view' or 'explore', what the reference sits in
+        :param context: the view / explore name
+        :param aliases: the explore's aliases when kind is explore (see aliases)
+        :type reference: str
+        :type kind: str
+        :type context: str
+        :type aliases: dict
+        :return: what is wrong with it, or None when it resolves
+        :rtype: str
+        '''
+        qualifier, dot, field = reference.rpartition('.')
+        if not dot:
+            if kind != 'view':
+                return None
+            qualifier = context
+        elif kind == 'explore':
+            if qualifier not in aliases:
+                return 'unknown view ' + qualifier + ' in explore ' + context
+            qualifier = aliases[qualifier]
+        if not self.hasView(qualifier):
+            return 'unknown view ' + qualifier
+        if field in VIEW_ATTRIBUTES or field in self.fields(qualifier):
+            return None
+        return 'unknown field ' + qualifier + '.' + field
+
+    def validate(self, files):
+        '''
+        checks every reference in the sql (sql, sql_on, sql_where ...), html and drill_fields of some lkml files
+
+        :param files: (path, text) for each file
+        :type files: iterable of tuples
+        :return: one record per broken reference, {'file': path, 'line': 1 based line number, 'reference': as written,
+            'context': the view / explore it is in, 'message': what is wrong}
+        :rtype: list of dicts
+        '''
+        problems = []
+        for path, text in files:
+            text = _maskComments(text)
+            blocks = [(m.start(), m.group(1), m.group(2)) for m in _blockRe.finditer(text)]
+            starts = [start for start, kind, name in blocks]
+            aliases, lineStarts = {}, []
+            def found(offset):
+                i = bisect.bisect_right(starts, offset) - 1
+                return blocks[i] if i >= 0 else (0, None, None)
+            def report(offset, reference, context, message):
+                if not lineStarts:
+                    lineStarts.extend(m.end() for m in re.finditer('\n', text))
+                line = bisect.bisect_right(lineStarts, offset) + 1
+                problems.append({'file': path, 'line': line, 'reference': reference, 'context': context, 'message': message})
+            def checked(offset, reference):
+                start, kind, context = found(offset)
+                if kind not in ('view', 'explore'):
+                    return
+                if kind == 'explore' and context not in aliases:
+                    aliases[context] = self.aliases(context)
+                message = self.check(reference, kind, context, aliases.get(context))
+                if message:
+                    report(offset, reference, context, message)
+            for match in _expressionRe.finditer(text):
+                for raw, field, fq, offset in lookml.findReferences(match.group(2), offsets=True):
+                    #liquid attributes of a field, i.e. {{ field._link }} or {{ view.field._rendered_value }}
+                    field = field.split('._')[0]
+                    if field and field not in LIQUID_BUILTINS and not field.startswith('_'):
+                        checked(match.start(2) + offset, field)
+            for match in _drillRe.finditer(text):
+                for item in re.finditer(r'[\w.]+\*?', match.group(1)):
+                    if not item.group(0).startswith('ALL_FIELDS'):
+                        checked(match.start(1) + item.start(), item.group(0))
+        problems.sort(key=lambda problem: (problem['file'], problem['line']))
+        return problems
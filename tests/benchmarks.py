@@ -0,0 +1,185 @@
+'''
+    Timings for the hot paths, kept out of tests.py so the unit tests never depend on how fast the machine is.
+    Each benchmark prints the old way against the new one, nothing is asserted.
+    Run from the same directory as the tests: python tests/benchmarks.py [name ...] (all of them without names)
+'''
+import sys, os, time, re, types, tempfile, tracemalloc
+import lookml, lkml
+from string import Template
+#the same fixture the unit tests use, tests.py sits next to this script
+from tests import wideView
+
+def bench(func, number=5):
+    ''' best of number runs, in seconds '''
+    best = None
+    for i in range(number):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def kitchenSink():
+    return lookml.File('lookml/tests/kitchenSink/kitchenSink.model.lkml')
+
+def file_from_view():
+    v = wideView()
+    #what File(View) used to do: render the view, parse the text and build the objects again
+    roundTrip = bench(lambda: lookml.View(lkml.load(str(v))['views'][0]))
+    direct = bench(lambda: lookml.File(v).views.wide)
+    print('File(View) with %d fields: render and reparse %.4fs, direct %.6fs' % (len(v), roundTrip, direct))
+
+def streaming_write():
+    f = lookml.File(wideView(2000)).setFolder(tempfile.mkdtemp())
+    size = len(str(f))
+    tracemalloc.start()
+    f.write()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    #rendered to a string first, the whole text would be allocated at once
+    print('File.write of %d bytes: peak %d bytes allocated' % (size, peak))
+    os.remove(f.path)
+
+def compiled_templates():
+    f = kitchenSink()
+    #the substitutions rendering kitchenSink makes, captured once so only the templating is timed
+    work = []
+    for v in f.views:
+        for field in v.fields():
+            work.append((field.token, {'message': field.getMessage(), 'identifier': field.identifier, 'token': field.token,
+                'props': lookml.stringify([str(p) for p in field.getProperties()])}))
+    def perObject():
+        for i in range(20):
+            for token, templateMap in work:
+                Template(getattr(lookml.config.TEMPLATES, token)).substitute(**templateMap)
+    def compiled():
+        for i in range(20):
+            for token, templateMap in work:
+                lookml.getRenderPlan(token).render(templateMap)
+    print('kitchenSink %d substitutions x20: Template per object %.4fs, compiled %.4fs. Full render %.4fs' % (len(work), bench(perObject), bench(compiled), bench(lambda: str(f))))
+
+def sorted_field_buckets():
+    v = wideView(1000)
+    #what measures() used to do: scan every field of the view and sort the matches
+    scan = bench(lambda: lookml.lookml.sortMe(filter(lambda f: isinstance(f, lookml.Measure), v._fields.values())), number=50)
+    bucket = bench(lambda: list(v.measures()), number=50)
+    print('measures() of a %d field view: scan and sort %.4fs, sorted bucket %.4fs' % (len(v), scan, bucket))
+
+def unslottedBuild():
+    ''' lookml.lookml built again from its own source with every __slots__ declaration taken out '''
+    module = types.ModuleType('unslotted_lookml')
+    module.__file__ = sys.modules['lookml.lookml'].__file__
+    with open(module.__file__) as source:
+        text = re.sub(r'^( +)__slots__ = .*$', r'\1pass', source.read(), flags=re.M)
+    exec(compile(text, module.__file__, 'exec'), module.__dict__)
+    return module
+
+def field_memory():
+    def perField(module):
+        wideView(10, module)
+        tracemalloc.start()
+        v = wideView(2500, module)
+        fields, _ = tracemalloc.get_traced_memory()
+        props = [p for f in v.dims() for p in f.getProperties()]
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return fields / len(v), (allocated - fields) / len(props)
+    before, after = perField(unslottedBuild()), perField(lookml)
+    print('bytes per field (including its lkml): %.1f without __slots__, %.1f with' % (before[0], after[0]))
+    print('bytes per property: %.1f without __slots__, %.1f with' % (before[1], after[1]))
+
+def cached_properties():
+    fields = list(kitchenSink().views.order_items.fields())
+    #what getProperties used to do: wrap every value again, nested lists and dicts included
+    build = bench(lambda: [lookml.lookml.Property(k, v) for fld in fields for k, v in fld.properties.schema.items() if k not in ('link', 'action')], number=300)
+    cached = bench(lambda: [p for fld in fields for p in fld.getProperties()], number=300)
+    print('properties of %d fields: new wrappers each time %.6fs, cached %.6fs' % (len(fields), build, cached))
+
+def where():
+    v = wideView(2000)
+    v.total_4.setType('count')
+    v.total_4.setProperty('hidden', 'yes')
+    scan = bench(lambda: [f for f in v.fields() if str(f.type) == 'type: count' and str(f.hidden) == 'hidden: yes'])
+    indexed = bench(lambda: list(v.where(type='count', hidden='yes')))
+    print('where on a %d field view: scan %.4fs, index %.6fs' % (len(v), scan, indexed))
+
+def bulk_rename():
+    v = wideView(500)
+    start = time.perf_counter()
+    for i in range(500):
+        v.field('dim_%d' % i).setName_safe('renamed_%d' % i)
+    print('renamed 500 of %d fields in %.4fs' % (len(v), time.perf_counter() - start))
+
+def tag_index():
+    v = wideView(2000)
+    v.dim_5.addTag('pii')
+    scan = bench(lambda: [f for f in v.fields() if 'pii' in f.tags])
+    indexed = bench(lambda: list(v.getFieldsByTag('pii')))
+    print('fields tagged in a %d field view: scan %.4fs, index %.6fs' % (len(v), scan, indexed))
+
+def extends_resolver():
+    r = lookml.modules.resolver.extendsResolver()
+    r.addFile('base.view.lkml', {'views': [{'name': 'base', 'dimensions': [{'name': 'dim_%d' % i, 'sql': '${TABLE}.dim_%d' % i} for i in range(300)]}]})
+    r.addFile('children.view.lkml', {'views': [{'name': 'child_%d' % i, 'extends': ['base'], 'dimensions': [{'name': 'dim_%d' % i, 'label': 'Child %d' % i}]} for i in range(50)]})
+    names = ['child_%d' % i for i in range(50)]
+    def fromScratch():
+        for name in names:
+            r._resolved.clear()
+            r.resolve(name)
+    fresh = bench(fromScratch)
+    memoized = bench(lambda: [r.resolve(name) for name in names])
+    print('resolving %d views extending a 300 field view: from scratch %.4fs, memoized %.6fs' % (len(names), fresh, memoized))
+
+def explore_universe():
+    r = lookml.modules.resolver.exploreResolver()
+    r.addFile('wide.view.lkml', {'views': [{'name': 'wide', 'dimensions': [{'name': 'dim_%d' % i} for i in range(300)]}, {'name': 'users', 'extends': ['wide']}]})
+    r.addFile('model.lkml', {'explores': [{'name': 'orders', 'from': 'wide', 'joins': [{'name': 'buyers', 'from': 'users'}]}]})
+    fresh = bench(lambda: (r._universes.clear(), r.views._resolved.clear(), r.universe('orders')))
+    memoized = bench(lambda: r.universe('orders'))
+    print('field universe of a %d field explore: fresh %.4fs, memoized %.6fs' % (len(r.universe('orders')), fresh, memoized))
+
+def validator():
+    #a 5000 file project: views referencing the view before them and a model joining them all
+    table = lookml.modules.validator.symbolTable()
+    files = []
+    dimension = Template('  dimension: dim_$j {\n    sql: $${id} + $${view_$previous.id} ;;\n  }\n')
+    for i in range(5000):
+        table.addFile('view_%d.view.lkml' % i, {'views': [{'name': 'view_%d' % i, 'dimensions': [{'name': 'id'}] + [{'name': 'dim_%d' % j} for j in range(10)]}]})
+        files.append(('view_%d.view.lkml' % i, 'view: view_%d {\n' % i + ''.join(dimension.substitute(j=j, previous=max(i - 1, 0)) for j in range(10)) + '}\n'))
+    explore = {'name': 'everything', 'from': 'view_0', 'joins': [{'name': 'j_%d' % i, 'from': 'view_%d' % i, 'sql_on': '${everything.id} = ${j_%d.id}' % i} for i in range(1, 5000)]}
+    table.addFile('big.model.lkml', {'explores': [explore]})
+    files.append(('big.model.lkml', lkml.dump({'explores': [explore]})))
+    print('validated %d files in %.2fs' % (len(files), bench(lambda: table.validate(files), number=1)))
+
+def expanded_sql():
+    #200 views of 100 fields sharing subexpressions within the view and from a common view
+    views = lookml.modules.resolver.extendsResolver()
+    views.addFile('common.view.lkml', {'views': [{'name': 'common', 'dimensions': [{'name': 'rate', 'sql': '(SELECT MAX(rate) FROM ${TABLE})'}]}]})
+    for i in range(200):
+        fields = [{'name': 'f_0', 'sql': '${TABLE}.c_0 * ${common.rate}'}]
+        fields += [{'name': 'f_%d' % j, 'sql': '${f_%d} + ${TABLE}.c_%d' % (j - 1, j)} for j in range(1, 10)]
+        fields += [{'name': 'f_%d' % j, 'sql': 'CASE WHEN ${f_9} > 0 THEN ${TABLE}.c_%d END' % j} for j in range(10, 100)]
+        views.addFile('view_%d.view.lkml' % i, {'views': [{'name': 'view_%d' % i, 'dimensions': fields}]})
+    expander = lookml.modules.resolver.sqlExpander.forViews(views)
+    names = [('view_%d' % i, 'f_%d' % j) for i in range(200) for j in range(100)]
+    onePass = bench(lambda: [expander.expand(view, name) for view, name in names], number=1)
+    #a fresh expander per field only reuses subexpressions within that field
+    sample = names[:1000]
+    perField = bench(lambda: [lookml.modules.resolver.sqlExpander(expander.lookup, expander.table).expand(view, name) for view, name in sample], number=1)
+    print('expanded sql of %d fields in one memoized pass %.3fs, %d fields one at a time %.3fs' % (len(names), onePass, len(sample), perField))
+
+def find_references():
+    texts = list(lookml.modules.references._strings(lkml.load(open('lookml/tests/kitchenSink/kitchenSink.model.lkml').read())))
+    found = len(lookml.findReferences(texts))
+    perString = bench(lambda: [r for text in texts for r in lookml.parseReferences(text)], number=20)
+    batch = bench(lambda: lookml.findReferences(texts), number=20)
+    print('references in %d kitchen sink strings: %d refs, %.0f refs/s per string, %.0f refs/s batched' % (len(texts), found, found / perString, found / batch))
+
+BENCHMARKS = (file_from_view, streaming_write, compiled_templates, sorted_field_buckets, field_memory, cached_properties, where,
+    bulk_rename, tag_index, extends_resolver, explore_universe, validator, expanded_sql, find_references)
+
+if __name__ == '__main__':
+    chosen = sys.argv[1:]
+    for benchmark in BENCHMARKS:
+        if not chosen or benchmark.__name__ in chosen:
+            benchmark()
@@ -1,11 +1,21 @@
-import unittest, copy
-import lookml
+import unittest, copy, os, shutil, subprocess, time, sys, base64
+import lookml, lkml
 import configparser, json
+from unittest import mock
+from string import Template
 from looker_sdk import client, models, methods
 # from looker_sdk import models, methods, init31
 config = configparser.ConfigParser()
 config.read('settings.ini')
 
+def wideView(n=400, module=lookml):
+    ''' a view with n numbered dimensions and a sum measure over each, built with module's classes '''
+    v = module.View('wide')
+    for i in range(n):
+        v + module.Dimension({'name': 'dim_%d' % i, 'type': 'number', 'sql': '${TABLE}.dim_%d' % i, 'label': 'Dim %d' % i})
+        v + module.Measure({'name': 'total_%d' % i, 'type': 'sum', 'sql': '${dim_%d}' % i})
+    return v
+
  
 class testKitchenSinkLocal(unittest.TestCase):
     '''
@@ -317,6 +327,92 @@ class whitespaceTest(unittest.TestCase):
         # refine_ex.addProperty('aggregate_table','foo')
         print(myFile)
 
+    def test_compiled_templates(self):
+        f = lookml.File('lookml/tests/kitchenSink/kitchenSink.model.lkml')
+        #every substitution rendering kitchenSink makes
+        work = []
+        for v in f.views:
+            for field in v.fields():
+                work.append((field.token, {'message': field.getMessage(), 'identifier': field.identifier, 'token': field.token, 
+                    'props': lookml.stringify([str(p) for p in field.getProperties()])}))
+        for e in f.explores:
+            for j in e.getJoins():
+                work.append((j.token, {'message': '', 'identifier': j.identifier, 'token': j.token, 
+                    'props': lookml.stringify([str(p) for p in j.getProperties()])}))
+        for token, templateMap in work:
+            self.assertEqual(Template(getattr(lookml.config.TEMPLATES, token)).substitute(**templateMap), lookml.getRenderPlan(token).render(templateMap))
+        #each template is compiled once and the plan reused
+        self.assertIs(lookml.getRenderPlan('dimension'), lookml.getRenderPlan('dimension'))
+
+    def test_render_without_deepcopy(self):
+        text = '''
+            view: ndt {
+                derived_table: {
+                    explore_source: order_items {
+                    column: order_id {field: order_items.order_id }
+                    derived_column: order_sequence_number {
+                        sql: RANK() OVER (PARTITION BY user_id ORDER BY created_at) ;;
+                    }
+                    }
+                }
+                dimension: order_id {}
+                set: detail { fields: [order_id] }
+            }
+        '''
+        raw = lkml.load(text)
+        before = json.dumps(raw)
+        with mock.patch('copy.deepcopy', side_effect=AssertionError('copy.deepcopy called while binding or rendering')):
+            f = lookml.File('lookml/tests/kitchenSink/kitchenSink.model.lkml')
+            f._bind_lkml(raw)
+            str(f)
+            self.assertIn('explore_source: order_items', str(f.views.ndt))
+        #binding reads the parsed lkml without modifying it
+        self.assertEqual(before, json.dumps(raw))
+
+    def test_single_tidy_pass(self):
+        f = lookml.File('lookml/tests/kitchenSink/kitchenSink.model.lkml')
+        order_items = f.views.order_items
+        child = lookml.View('order_items_extended')
+        child + 'extends: [order_items]'
+        child + 'dimension: extra {}'
+        order_items.children.update({child.identifier: child})
+        expected = str(order_items)
+        module = sys.modules['lookml.lookml']
+        scanned = []
+        def countingTidy(string):
+            scanned.append(len(string))
+            return lookml.tidy(string)
+        with mock.patch.object(module, 'tidy', countingTidy):
+            self.assertEqual(str(order_items), expected)
+        #every byte of the view, its fields and its child is scanned exactly once
+        self.assertEqual(sum(scanned), len(''.join(order_items._rawChunks())))
+
+    def test_streaming_write(self):
+        lookml.mkdir_force('.tmp')
+        f = lookml.File(wideView(2000)).setFolder('.tmp')
+        f.write()
+        with open(f.path, 'r') as written:
+            self.assertEqual(written.read(), str(f))
+        #the text is written as it renders, a piece at a time, so it is never all in memory at once
+        handle = mock.mock_open()
+        with mock.patch('builtins.open', handle), mock.patch('os.replace') as replace:
+            f.write()
+        handle.assert_called_once_with(f.path + '.partial', 'w')
+        replace.assert_called_once_with(f.path + '.partial', f.path)
+        written = [call.args[0] for call in handle().write.call_args_list]
+        self.assertEqual(''.join(written), str(f))
+        self.assertGreater(len(written), len(f.views.wide))
+        self.assertLess(max(len(chunk) for chunk in written), len(str(f)) / 100)
+        #a render failing partway raises and leaves the file that was there alone
+        def failing():
+            yield 'view: wide {'
+            raise ValueError('cannot render')
+        with mock.patch.object(lookml.File, 'chunks', side_effect=failing):
+            with self.assertRaises(ValueError):
+                f.write()
+        with open(f.path, 'r') as written:
+            self.assertEqual(written.read(), str(f))
+        self.assertFalse(os.path.exists(f.path + '.partial'))
 
 class testShellGitController(unittest.TestCase):
     '''
@@ -885,6 +981,20 @@ class testMicroUnits(unittest.TestCase):
         self.assertEqual(results[8]['field'],'test.nine')
         self.assertEqual(results[9]['field'],'ten10')
         self.assertEqual(results[9]['fully_qualified_reference'],False)
+        #batch form, many strings in one pass
+        self.assertEqual(lookml.findReferences(['${test.one_1} - ${two}', '{{ test.six._value }}', 'no refs']),
+            [('${test.one_1}', 'test.one_1', True), ('${two}', 'two', False), ('{{ test.six._value }}', 'test.six', True)])
+
+    def test_find_references(self):
+        #every property string in the kitchen sink project
+        texts = []
+        for root, dirs, files in os.walk('lookml/tests/kitchenSink'):
+            for name in files:
+                if name.endswith('.lkml'):
+                    with open(os.path.join(root, name), 'r') as tmp:
+                        texts.extend(lookml.modules.references._strings(lkml.load(tmp)))
+        expected = [(r['raw'], r['field'], r['fully_qualified_reference']) for text in texts for r in lookml.parseReferences(text)]
+        self.assertEqual(lookml.findReferences(texts), expected)
 
     def test_project_level_functions(self):
         self.proj = lookml.Project(
@@ -896,12 +1006,798 @@ class testMicroUnits(unittest.TestCase):
         )
         self.proj.buildIndex()
 
+    def test_sorted_field_buckets(self):
+        v = wideView(1000)
+        names = lambda fields: [f.name for f in fields]
+        self.assertEqual(names(v.measures()), sorted('total_%d' % i for i in range(1000)))
+        v.removeField('total_5')
+        v + lookml.Measure({'name': 'aaa', 'type': 'count'})
+        v.total_7.setName('zzz')
+        measures = names(v.measures())
+        self.assertEqual(measures, sorted(measures))
+        self.assertEqual((measures[0], measures[-1]), ('aaa', 'zzz'))
+        self.assertNotIn('total_5', measures)
+        self.assertEqual(len(measures), 1000)
+        #replacing a field of the same name leaves one copy in its bucket
+        v + lookml.Dimension({'name': 'dim_1', 'type': 'string'})
+        self.assertEqual(names(v.dims()).count('dim_1'), 1)
+        #the bucket is kept sorted, nothing is sorted when it is read
+        with mock.patch.object(sys.modules['lookml.lookml'], 'sortMe', side_effect=AssertionError('measures() sorted')):
+            self.assertEqual(names(v.measures()), measures)
+
+    def test_field_memory(self):
+        v = wideView(10)
+        props = [p for f in v.dims() for p in f.getProperties()]
+        #every attribute a field sets lives in a slot, so no instance dict is ever allocated
+        self.assertEqual(vars(v.dim_1), {})
+        self.assertFalse(hasattr(props[0], '__dict__'))
+        self.assertFalse(hasattr(lookml.lookml.Properties({}), '__dict__'))
+        #attributes that are not slots still work on fields
+        v.dim_1.note = 'kept'
+        self.assertEqual(v.dim_1.note, 'kept')
+        self.assertEqual(copy.copy(v.dim_1).name, 'dim_1')
+
+    def test_cached_properties(self):
+        f = lookml.File('lookml/tests/kitchenSink/kitchenSink.model.lkml')
+        order_items = f.views.order_items
+        #the same wrapper comes back until the value is replaced
+        self.assertIs(order_items.id.sql, order_items.id.sql)
+        self.assertIs(order_items.id.sql, [p for p in order_items.id.getProperties() if p.name == 'sql'][0])
+        sql = order_items.id.sql
+        order_items.id.sql = '${TABLE}.changed'
+        self.assertIsNot(order_items.id.sql, sql)
+        self.assertEqual(order_items.id.sql.value, '${TABLE}.changed')
+        #in place changes show through and a cached wrapper can be looped over again and again
+        order_items.id.addTag('x')
+        self.assertTrue('x' in order_items.id.tags)
+        self.assertTrue('x' in order_items.id.tags)
+        self.assertEqual(len(order_items.id.tags), 4)
+        #each loop gets its own iterator, so nested loops over one cached wrapper see every pair
+        tags = order_items.id.tags
+        self.assertEqual(len([(x, y) for x in tags for y in tags]), 16)
+        self.assertEqual(list(tags), list(tags))
+        #reading the properties again builds no wrappers
+        fields = list(order_items.fields())
+        first = [p for fld in fields for p in fld.getProperties()]
+        with mock.patch.object(lookml.lookml, 'Property', side_effect=AssertionError('a Property was built again')):
+            self.assertEqual([id(p) for p in first], [id(p) for fld in fields for p in fld.getProperties()])
+
+    def test_where(self):
+        v = wideView(2000)
+        v.dim_3.hide()
+        v.total_3.setProperty('hidden', 'yes')
+        v.total_4.setType('count')
+        #the index follows property changes, additions and removals
+        self.assertEqual([f.name for f in v.where(type='sum', hidden='yes')], ['total_3'])
+        self.assertEqual([f.name for f in v.where(hidden='yes')], ['dim_3', 'total_3'])
+        self.assertIn(v.total_4, list(v.where(type='count')))
+        self.assertNotIn(v.total_4, list(v.getFieldsByType('sum')))
+        #by type keeps the order the fields are declared in, where() sorts by name
+        declared = lookml.View({'name': 'declared', 'dimensions': [{'name': name, 'type': 'number'} for name in ('zip', 'amount', 'margin')] + [{'name': 'label'}]})
+        self.assertEqual([f.name for f in declared.getFieldsByType('number')], ['zip', 'amount', 'margin'])
+        v.removeField('total_3')
+        v + lookml.Measure({'name': 'total_x', 'type': 'sum', 'hidden': 'yes'})
+        self.assertEqual([f.name for f in v.where(type='sum', hidden='yes')], ['total_x'])
+        self.assertEqual(list(v.where(type='sum', hidden='no')), [])
+        #answered from the index, the fields are not scanned
+        with mock.patch.object(lookml.View, 'fields', side_effect=AssertionError('where scanned the fields')):
+            self.assertEqual([f.name for f in v.where(type='sum', hidden='yes')], ['total_x'])
+
+    def test_dependency_graph(self):
+        v = lookml.View('orders')
+        v + lookml.Dimension({'name': 'amount', 'sql': '${TABLE}.amount'})
+        v + lookml.Dimension({'name': 'tax', 'sql': '${amount} * 0.2'})
+        v + lookml.Dimension({'name': 'gross', 'sql': '${orders.amount} + ${tax}', 'html': '{{ tax._rendered_value }}'})
+        v + lookml.Measure({'name': 'total_gross', 'type': 'sum', 'sql': '${gross}'})
+        names = lambda fields: [f.name for f in fields]
+        self.assertEqual(names(v.amount.children()), ['gross', 'tax'])
+        self.assertEqual(names(v.gross.parents()), ['amount', 'tax'])
+        self.assertEqual(sorted(names(v.amount.descendants())), ['gross', 'tax', 'total_gross'])
+        self.assertEqual(names(v.total_gross.ancestors()), ['gross', 'amount', 'tax'])
+        #edits move the edges
+        v.tax.sql = '${TABLE}.tax'
+        self.assertEqual(names(v.amount.children()), ['gross'])
+        #cycles end
+        v.amount.sql = '${total_gross}'
+        self.assertEqual(sorted(names(v.amount.descendants())), ['gross', 'total_gross'])
+        #across views
+        other = lookml.View('returns')
+        other + lookml.Measure({'name': 'refunded', 'type': 'sum', 'sql': '${orders.gross} * -1'})
+        self.assertIn(other.refunded, v.tax.descendants(views=[v, other]))
+        self.assertIn(v.tax, other.refunded.ancestors(views=[v, other]))
+        #renames rewrite every form of the reference in the dependents only
+        v.tax.setName_safe('vat')
+        self.assertEqual(v.gross.sql.value, '${orders.amount} + ${vat}')
+        self.assertEqual(v.gross.html.value, '{{ vat._rendered_value }}')
+        self.assertEqual(names(v.vat.children()), ['gross'])
+
+    def test_bulk_rename(self):
+        v = wideView(500)
+        with mock.patch.object(lookml.View, 'search', side_effect=AssertionError('rename scanned the view')):
+            for i in range(500):
+                v.field('dim_%d' % i).setName_safe('renamed_%d' % i)
+        self.assertEqual(v.total_7.sql.value, '${renamed_7}')
+        self.assertEqual([f.name for f in v.renamed_7.children()], ['total_7'])
+        self.assertNotIn('dim_7', v)
+
+    def test_tag_index(self):
+        v = wideView(2000)
+        v.dim_1.addTag('pii')
+        v.dim_2.addTag('pii')
+        v.dim_2.addTag('pii')
+        v.total_9.tags = ['pii', 'finance']
+        tagged = lambda tag: [f.name for f in v.getFieldsByTag(tag)]
+        self.assertEqual(tagged('pii'), ['dim_1', 'dim_2', 'total_9'])
+        self.assertEqual(tagged('finance'), ['total_9'])
+        #every way of taking a tag off is followed
+        v.dim_1.removeTag('pii')
+        v.dim_2.tags - 'pii'
+        v.total_9.tags = ['finance']
+        self.assertEqual(tagged('pii'), [])
+        v.total_9.tags + 'pii'
+        self.assertEqual(tagged('pii'), ['total_9'])
+        v.removeField('total_9')
+        self.assertEqual(tagged('finance'), [])
+        v.dim_5.addTag('pii')
+        #tags have an index of their own
+        with mock.patch.object(lookml.View, 'fields', side_effect=AssertionError('getFieldsByTag scanned the fields')):
+            self.assertEqual(tagged('pii'), ['dim_5'])
+
+    def test_extends_resolver(self):
+        r = lookml.modules.resolver.extendsResolver()
+        base = {'name': 'base', 'extension': 'required', 'sql_table_name': 'base_table',
+            'dimensions': [{'name': 'dim_%d' % i, 'sql': '${TABLE}.dim_%d' % i, 'label': 'Dim %d' % i} for i in range(300)]}
+        r.addFile('base.view.lkml', {'views': [base]})
+        r.addFile('children.view.lkml', {'views': [{'name': 'child_%d' % i, 'extends': ['base'], 'dimensions': [{'name': 'dim_%d' % i, 'label': 'Child %d' % i}]} for i in range(50)]})
+        r.addFile('grandchild.view.lkml', {'views': [{'name': 'grandchild', 'extends': ['child_1'], 'sql_table_name': 'gc', 'measures': [{'name': 'total', 'type': 'count'}]}]})
+        r.addFile('refine.view.lkml', {'views': [{'name': '+base', 'dimensions': [{'name': 'dim_2', 'hidden': 'yes'}]}]})
+        gc = r.resolve('grandchild')
+        self.assertEqual(len(gc['dimensions']), 300)
+        self.assertEqual(gc['sql_table_name'], 'gc')
+        self.assertNotIn('extension', gc)
+        self.assertNotIn('extends', gc)
+        dims = {d['name']: d for d in gc['dimensions']}
+        #the child's override keeps the sql it inherits, the refinement of base reaches every descendant
+        self.assertEqual(dims['dim_1'], {'name': 'dim_1', 'sql': '${TABLE}.dim_1', 'label': 'Child 1'})
+        self.assertEqual(dims['dim_2']['hidden'], 'yes')
+        self.assertEqual(r.origins('grandchild')['dim_1'], ('base', 'child_1'))
+        self.assertEqual(r.origins('grandchild')['dim_2'], ('base', '+base'))
+        self.assertEqual(r.view('grandchild').total.type.value, 'count')
+        #only the changed view and what extends it are resolved again
+        for i in range(50):
+            r.resolve('child_%d' % i)
+        stale = r.addFile('grandchild.view.lkml', {'views': [{'name': 'grandchild', 'extends': ['child_1']}]})
+        self.assertEqual(stale, {'grandchild'})
+        self.assertEqual(len(r._resolved), 51)
+        self.assertLessEqual({'grandchild', 'child_1'}, r.addFile('children.view.lkml', {'views': [{'name': 'child_1', 'extends': ['base']}]}))
+        self.assertIn('base', r._resolved)
+        self.assertEqual(r.removeFile('refine.view.lkml'), {'base', 'child_1', 'grandchild'})
+        self.assertNotIn('hidden', {d['name']: d for d in r.resolve('grandchild')['dimensions']}['dim_2'])
+        r.addFile('loop.view.lkml', {'views': [{'name': 'a', 'extends': ['b']}, {'name': 'b', 'extends': ['a']}]})
+        with self.assertRaises(Exception):
+            r.resolve('a')
+        #memoized against merging every chain from scratch
+        r.addFile('children.view.lkml', {'views': [{'name': 'child_%d' % i, 'extends': ['base'], 'dimensions': [{'name': 'dim_%d' % i, 'label': 'Child %d' % i}]} for i in range(50)]})
+        names = ['child_%d' % i for i in range(50)]
+        resolved = [r.resolve(name) for name in names]
+        #resolved once, after that every view comes from the memo without merging
+        with mock.patch.object(lookml.modules.resolver, 'mergeView', side_effect=AssertionError('resolved again')):
+            self.assertEqual([id(view) for view in resolved], [id(r.resolve(name)) for name in names])
+
+    def test_explore_universe(self):
+        r = lookml.modules.resolver.exploreResolver()
+        wide = {'name': 'wide', 'view_label': 'Wide',
+            'dimensions': [{'name': 'dim_%d' % i, 'sql': '${TABLE}.dim_%d' % i} for i in range(300)],
+            'dimension_groups': [{'name': 'created', 'type': 'time', 'timeframes': ['date', 'month']}],
+            'measures': [{'name': 'count', 'type': 'count'}],
+            'sets': [{'name': 'few', 'fields': ['dim_1', 'more*']}, {'name': 'more', 'fields': ['dim_2']}]}
+        r.addFile('wide.view.lkml', {'views': [wide, {'name': 'users', 'extends': ['wide'], 'dimensions': [{'name': 'email', 'view_label': 'Contact'}]}]})
+        r.addFile('model.lkml', {'explores': [
+             {'name': 'orders', 'from': 'wide', 'fields': ['ALL_FIELDS*', '-buyers.dim_3', '-orders.created'],
+                'joins': [{'name': 'buyers', 'from': 'users', 'view_label': 'Buyers', 'fields': ['few*', 'email', 'created']}]}
+            ,{'name': 'users'}
+        ]})
+        u = r.universe('orders')
+        self.assertEqual(sorted(k for k in u if k.startswith('buyers.')), ['buyers.created_date', 'buyers.created_month', 'buyers.dim_1', 'buyers.dim_2', 'buyers.email'])
+        self.assertEqual(u['buyers.dim_1'], {'view': 'users', 'field': 'dim_1', 'type': 'dimension', 'group': None, 'view_label': 'Buyers'})
+        self.assertEqual(u['buyers.email']['view_label'], 'Contact')
+        self.assertEqual(u['orders.count']['view_label'], 'Wide')
+        self.assertNotIn('orders.created_date', u)
+        self.assertEqual(len(u), 301 + 5)
+        e = r.explore('orders')
+        self.assertEqual(e.base_view.name, 'wide')
+        self.assertEqual(len(e.buyers.to), 303)
+        #a change to a view reached through extends drops the universes using it, and only those
+        r.universe('users')
+        r.addFile('other.view.lkml', {'views': [{'name': 'other'}]})
+        self.assertEqual(set(r._universes), {'orders', 'users'})
+        self.assertEqual(r.addFile('wide.view.lkml', {'views': [wide, {'name': 'users', 'extends': ['wide']}]}), {'orders', 'users'})
+        self.assertNotIn('buyers.email', r.universe('orders'))
+        #memoized, the views are not resolved again
+        with mock.patch.object(r.views, 'resolve', side_effect=AssertionError('universe resolved a view again')):
+            self.assertEqual(r.universe('orders'), r.universe('orders'))
+
+    def test_validator(self):
+        #a 300 file project: views referencing the view before them and a model joining them all
+        table = lookml.modules.validator.symbolTable()
+        files = []
+        dimension = Template('  dimension: dim_$j {\n    sql: $${id} + $${view_$previous.id} ;;\n    html: {{ value }} {{ dim_0._rendered_value }} ;;\n  }\n')
+        for i in range(300):
+            fields = [{'name': 'id'}] + [{'name': 'dim_%d' % j} for j in range(10)]
+            table.addFile('view_%d.view.lkml' % i, {'views': [{'name': 'view_%d' % i, 'dimensions': fields, 'measures': [{'name': 'count'}]}]})
+            text = 'view: view_%d {\n  dimension: id {\n    sql: ${TABLE}.id ;;\n  }\n' % i
+            text += ''.join(dimension.substitute(j=j, previous=max(i - 1, 0)) for j in range(10))
+            text += '  measure: count {\n    type: count\n    drill_fields: [id, dim_1]\n  }\n}\n'
+            files.append(('view_%d.view.lkml' % i, text))
+        explore = {'name': 'everything', 'from': 'view_0', 'joins': [{'name': 'j_%d' % i, 'from': 'view_%d' % i, 'sql_on': '${everything.id} = ${j_%d.id}' % i} for i in range(1, 300)]}
+        table.addFile('big.model.lkml', {'explores': [explore]})
+        files.append(('big.model.lkml', lkml.dump({'explores': [explore]})))
+        self.assertEqual(table.validate(files), [])
+        #the names of each view are built once for all of its references
+        with mock.patch.object(lookml.modules.resolver, 'fieldNames', side_effect=AssertionError('names built again')):
+            self.assertEqual(table.validate(files), [])
+        #broken references are reported where they are
+        broken = files[7][1].replace('${view_6.id}', '${view_6.missing}', 1).replace('[id, dim_1]', '[id, nope]')
+        problems = table.validate([('view_7.view.lkml', broken), ('model.lkml', 'explore: everything {\n join: j_1 {\n  sql_on: ${nothing.id} ;;\n }\n}')])
+        self.assertEqual([(p['file'], p['line'], p['reference'], p['context']) for p in problems], [
+             ('model.lkml', 3, 'nothing.id', 'everything')
+            ,('view_7.view.lkml', 6, 'view_6.missing', 'view_7')
+            ,('view_7.view.lkml', 47, 'nope', 'view_7')])
+        self.assertEqual(problems[1]['message'], 'unknown field view_6.missing')
+
+    def test_expanded_sql(self):
+        v = lookml.View('orders')
+        v + 'sql_table_name: db.orders ;;'
+        v + lookml.Dimension({'name': 'price', 'sql': '${TABLE}.price'})
+        v + lookml.Dimension({'name': 'tax', 'sql': '${price} * 0.2'})
+        v + lookml.Dimension({'name': 'gross', 'sql': '${price} + ${tax} + ${users.fee}'})
+        v + lookml.DimensionGroup({'name': 'created', 'sql': '${TABLE}.created_at'})
+        v + lookml.Dimension({'name': 'source', 'sql': '${orders.SQL_TABLE_NAME} ${created_date}'})
+        v + lookml.Measure({'name': 'total', 'type': 'sum', 'sql': '${gross}'})
+        v + lookml.Measure({'name': 'count', 'type': 'count'})
+        v + lookml.Measure({'name': 'average', 'type': 'number', 'sql': '${total} / NULLIF(${count}, 0)'})
+        #other views are left as written, liquid too
+        self.assertEqual(v.gross.expandedSql(), 'orders.price + (orders.price * 0.2) + ${users.fee}')
+        self.assertEqual(v.total.expandedSql(), 'SUM(orders.price + (orders.price * 0.2) + ${users.fee})')
+        self.assertEqual(v.average.expandedSql(), '(SUM(orders.price + (orders.price * 0.2) + ${users.fee})) / NULLIF((COUNT(*)), 0)')
+        self.assertEqual(v.source.expandedSql(), 'db.orders orders.created_at')
+        #memoized until a field changes
+        v.tax.sql = '${price} * 0.3'
+        self.assertEqual(v.gross.expandedSql(), 'orders.price + (orders.price * 0.3) + ${users.fee}')
+        #a measure's aggregate follows its type
+        v.total.setType('count_distinct')
+        self.assertEqual(v.total.expandedSql(), 'COUNT(DISTINCT orders.price + (orders.price * 0.3) + ${users.fee})')
+        #and ${view.SQL_TABLE_NAME} the view's table
+        v.sql_table_name = 'db.orders_v2'
+        self.assertEqual(v.source.expandedSql(), 'db.orders_v2 orders.created_at')
+        v + 'derived_table: { sql: SELECT 1 ;; }'
+        self.assertEqual(v.source.expandedSql(), '(SELECT 1) orders.created_at')
+        v + lookml.Dimension({'name': 'a', 'sql': '${b}'})
+        v + lookml.Dimension({'name': 'b', 'sql': '${a}'})
+        with self.assertRaises(Exception):
+            v.a.expandedSql()
+        #20 views of 100 fields sharing subexpressions within the view and from a common view, expanded in one pass
+        views = lookml.modules.resolver.extendsResolver()
+        views.addFile('common.view.lkml', {'views': [{'name': 'common', 'dimensions': [{'name': 'rate', 'sql': '(SELECT MAX(rate) FROM ${TABLE})'}]}]})
+        for i in range(20):
+            fields = [{'name': 'f_0', 'sql': '${TABLE}.c_0 * ${common.rate}'}]
+            fields += [{'name': 'f_%d' % j, 'sql': '${f_%d} + ${TABLE}.c_%d' % (j - 1, j)} for j in range(1, 10)]
+            fields += [{'name': 'f_%d' % j, 'sql': 'CASE WHEN ${f_9} > 0 THEN ${TABLE}.c_%d END' % j} for j in range(10, 100)]
+            views.addFile('view_%d.view.lkml' % i, {'views': [{'name': 'view_%d' % i, 'dimensions': fields}]})
+        expander = lookml.modules.resolver.sqlExpander.forViews(views)
+        self.assertEqual(expander.expand('view_0', 'f_1'), '(view_0.c_0 * ((SELECT MAX(rate) FROM common))) + view_0.c_1')
+        #each field is looked up and expanded once, however many fields share it
+        looked = []
+        counted = lookml.modules.resolver.sqlExpander(lambda view, name: looked.append((view, name)) or expander.lookup(view, name), expander.table)
+        names = [('view_%d' % i, 'f_%d' % j) for i in range(20) for j in range(100)]
+        self.assertEqual([counted.expand(view, name) for view, name in names], [expander.expand(view, name) for view, name in names])
+        self.assertEqual(len(looked), len(set(looked)))
+        self.assertEqual(len(looked), len(names) + 1)
+        #changing a view drops only the expansions which read it
+        views.addFile('common.view.lkml', {'views': [{'name': 'common', 'dimensions': [{'name': 'rate', 'sql': '1'}]}]})
+        self.assertEqual(expander.expand('view_7', 'f_0'), 'view_7.c_0 * 1')
+        self.assertEqual(len(expander.memo), 2)
+        expander.expand('view_5', 'f_50')
+        expander.expand('view_6', 'f_50')
+        views.addFile('view_5.view.lkml', {'views': [{'name': 'view_5', 'dimensions': [{'name': 'f_0', 'sql': '${TABLE}.z'}]}]})
+        self.assertNotIn(('view_5', 'f_50'), expander.memo)
+        self.assertIn(('view_6', 'f_50'), expander.memo)
+        self.assertIsNone(expander.expand('view_5', 'f_50'))
+
  
 
 
 
 
 
+class testLazyCollections(unittest.TestCase):
+    '''
+        Objective: views and explores are only built from raw lkml when they are accessed
+    '''
+
+    def setUp(self):
+        self.f = lookml.File('lookml/tests/kitchenSink/kitchenSink.model.lkml')
+
+    def test_views_built_on_access(self):
+        self.assertIsInstance(self.f.views.views['order_items'], dict)
+        self.assertIsInstance(self.f.explores.explores['order_items'], dict)
+        order_items = self.f.views.order_items
+        self.assertIsInstance(order_items, lookml.View)
+        #memoized, the same object comes back on the next access
+        self.assertIs(order_items, self.f.views['order_items'])
+        self.assertIsInstance(self.f.explores.explores['order_items'], dict)
+
+    def test_iteration_builds_each_view(self):
+        views = list(self.f.views)
+        self.assertTrue(all(isinstance(v, lookml.View) for v in views))
+        self.assertEqual([v.name for v in views], list(self.f.views.views.keys()))
+        self.assertIs(views[0], self.f.views[views[0].name])
+
+    def test_file_from_view(self):
+        v = wideView()
+        #the view is attached as it is, never rendered and parsed again
+        with mock.patch('lkml.load', side_effect=AssertionError('File(View) parsed the view')):
+            self.assertIs(lookml.File(v).views.wide, v)
+
+class testParseCache(unittest.TestCase):
+    '''
+        Objective: a file whose content has not changed is never re-parsed when the parse cache is on
+    '''
+
+    def setUp(self):
+        lookml.config.PARSE_CACHE_DIR = '.tmp/parse_cache_test'
+        lookml.cache.active().clear()
+
+    def tearDown(self):
+        lookml.cache.active().clear()
+        lookml.config.PARSE_CACHE_DIR = ''
+
+    def test_cache_hit_skips_parse(self):
+        first = lookml.File('lookml/tests/kitchenSink/kitchenSink.model.lkml')
+        with mock.patch('lkml.load', side_effect=AssertionError('lkml.load called on a cache hit')):
+            second = lookml.File('lookml/tests/kitchenSink/kitchenSink.model.lkml')
+        self.assertEqual(str(first), str(second))
+
+    def test_edits_leave_cached_parse_alone(self):
+        path = 'lookml/tests/kitchenSink/kitchenSink.model.lkml'
+        with open(path, 'rb') as tmp:
+            data = tmp.read()
+        parsed = lkml.load(data.decode('utf-8'))
+        #bound objects keep the lists of the lkml they were built from, a miss and a hit each get their own
+        for f in (lookml.File(path), lookml.File(path)):
+            f.views.order_items.id.addTag('edited')
+            f.views.order_items.id.removeTag('a')
+        self.assertEqual(lookml.cache.active().get(lookml.cache.blobSha(data)), parsed)
+        self.assertEqual(list(lookml.File(path).views.order_items.id.tags), ['a', 'b', 'c'])
+
+    def test_blob_sha(self):
+        #matches `git hash-object`
+        self.assertEqual(lookml.cache.blobSha(b'hello\n'), 'ce013625030ba8dba906f756967f9e9ca394464a')
+
+    def test_lru_eviction(self):
+        c = lookml.cache.parseCache('.tmp/parse_cache_lru', maxBytes=60).clear()
+        c.put('a', {'x': 'a' * 20})
+        c.put('b', {'x': 'b' * 20})
+        os.utime(c.entry('a'), (1, 1))
+        os.utime(c.entry('b'), (2, 2))
+        #reading a makes it the most recently used, so b is evicted first
+        self.assertIsNotNone(c.get('a'))
+        c.put('c', {'x': 'c' * 20})
+        self.assertIsNone(c.get('b'))
+        self.assertIsNotNone(c.get('a'))
+        self.assertIsNotNone(c.get('c'))
+        c.clear()
+
+class testLocalProject(unittest.TestCase):
+    '''
+        Objective: exercise project level functions against a local git repository (no network needed)
+        Setup) copy the test lkml files into a fresh git repo and clone it as a shellProject
+    '''
+
+    def setUp(self):
+        self.src = os.path.abspath('.tmp/local_project_src')
+        if os.path.exists(self.src):
+            shutil.rmtree(self.src)
+        shutil.copytree('lookml/tests/thelook', self.src + '/thelook')
+        shutil.copytree('lookml/tests/kitchenSink', self.src + '/kitchenSink')
+        for command in (
+                 ['git', 'init', '-q', '-b', 'master']
+                ,['git', 'add', '.']
+                ,['git', '-c', 'user.name=pylookml', '-c', 'user.email=pylookml@example.com', 'commit', '-q', '-m', 'fixture']
+            ):
+            subprocess.run(command, cwd=self.src, check=True)
+        self.proj = lookml.Project(git_url=self.src, looker_project_name='local_project')
+
+    def test_parallel_files(self):
+        serial = list(self.proj.files())
+        parallel = list(self.proj.files(workers=4))
+        self.assertEqual([f.path for f in serial], [f.path for f in parallel])
+        self.assertEqual([str(f) for f in serial], [str(f) for f in parallel])
+        self.assertEqual([os.path.abspath(f.path) for f in parallel], sorted(os.path.abspath(p) for p in self.proj.paths()))
+        self.assertEqual(self.proj.paths(), sorted(self.proj.paths()))
+        self.assertIsInstance(parallel[0], lookml.File)
+
+    def test_lazy_files(self):
+        with mock.patch('lkml.load', side_effect=AssertionError('lkml.load called while listing')):
+            lazy = [f for f in self.proj.files(lazy=True) if f.name == 'kitchenSink.model.lkml']
+        self.assertEqual(len(lazy), 1)
+        kitchenSink = lazy[0]
+        self.assertFalse(kitchenSink.isLoaded())
+        self.assertEqual(kitchenSink.filetype, 'model')
+        self.assertEqual(len(kitchenSink.views.order_items), 47)
+        self.assertTrue(kitchenSink.isLoaded())
+        self.assertEqual(str(kitchenSink), str(lookml.File('lookml/tests/kitchenSink/kitchenSink.model.lkml')))
+
+    def test_project_where(self):
+        scanned = sorted(fld.name for f in self.proj.files() for v in f.views for fld in v.fields() if fld.hasProp('type') and fld.type.value == 'sum')
+        self.assertTrue(scanned)
+        self.assertEqual(sorted(f.name for f in self.proj.where(type='sum')), scanned)
+        #the project keeps its files, edits are seen by the next query
+        field = next(self.proj.where(type='sum'))
+        field.setType('average')
+        self.assertNotIn(field, list(self.proj.where(type='sum')))
+        self.assertIn(field, list(self.proj.where(type='average')))
+
+    def test_project_tags(self):
+        scanned = sorted(fld.name for f in self.proj.files() for v in f.views for fld in v.fields() if 'a' in fld.tags)
+        self.assertTrue(scanned)
+        self.assertEqual(sorted(f.name for f in self.proj.getFieldsByTag('a')), scanned)
+        field = next(self.proj.getFieldsByTag('a'))
+        field.removeTag('a')
+        field.addTag('b')
+        self.assertNotIn(field, list(self.proj.getFieldsByTag('a')))
+        self.assertIn(field, list(self.proj.getFieldsByTag('b')))
+
+    def test_reference_index(self):
+        indexPath = os.path.abspath('.tmp/reference_index.json')
+        if os.path.exists(indexPath):
+            os.remove(indexPath)
+        index = self.proj.buildIndex(indexPath=indexPath)
+        sources = lambda field: set((r['source'], r['type']) for r in index.whoReferences(field))
+        #sql, html, drill_fields, sets and joins are all indexed
+        self.assertIn(('order_items.total_sale_price', 'sql'), sources('order_items.sale_price'))
+        self.assertIn(('order_items.gross_margin', 'html'), sources('order_items.sale_price'))
+        self.assertIn(('order_items.detail*', 'set'), sources('order_items.sale_price'))
+        self.assertIn(('order_items.count', 'drill_fields'), sources('order_items.detail*'))
+        self.assertIn(('order_items.users', 'sql_on'), sources('users.id'))
+        self.assertIn('order_items.sale_price', [r['target'] for r in index.referencesOf('order_items.total_sale_price')])
+        self.assertEqual(index.whoReferences(lookml.File('lookml/tests/kitchenSink/kitchenSink.model.lkml').views.order_items.sale_price), index.whoReferences('order_items.sale_price'))
+        #a fresh project reads the saved index and parses nothing when no file has changed
+        reopened = lookml.Project(git_url=self.src, looker_project_name='local_project')
+        with mock.patch('lkml.load', side_effect=AssertionError('unchanged file parsed')):
+            again = reopened.buildIndex(indexPath=indexPath)
+        self.assertEqual(again.whoReferences('order_items.sale_price'), index.whoReferences('order_items.sale_price'))
+        #a changed file is the only one parsed again
+        kitchenSink = [p for p in reopened.paths() if p.endswith('kitchenSink.model.lkml')][0]
+        with open(kitchenSink, 'r') as tmp:
+            text = tmp.read()
+        with open(kitchenSink, 'w') as tmp:
+            tmp.write(text.replace('${sale_price} - ${inventory_items.cost}', '${inventory_items.cost}'))
+        with mock.patch('lkml.load', side_effect=lkml.load) as parse:
+            again = reopened.buildIndex(indexPath=indexPath)
+        self.assertEqual(parse.call_count, 1)
+        edited = [r['source'] for r in again.whoReferences('order_items.sale_price') if r['type'] == 'sql' and r['file'] == 'kitchenSink/kitchenSink.model.lkml']
+        self.assertIn('order_items.total_sale_price', edited)
+        self.assertNotIn('order_items.gross_margin', edited)
+
+    def test_project_resolve_view(self):
+        root = self.proj.gitControllerSession.absoluteOutputPath
+        #keep a single definition of order_items
+        shutil.rmtree(os.path.join(root, 'thelook'))
+        os.remove(os.path.join(root, 'kitchenSink/kitchenSink2.model.lkml'))
+        with open(os.path.join(root, 'kitchenSink/refine.view.lkml'), 'w') as tmp:
+            tmp.write('view: +order_items { dimension: id { hidden: yes } }')
+        with open(os.path.join(root, 'kitchenSink/sales.view.lkml'), 'w') as tmp:
+            tmp.write('view: sales { extends: [order_items] dimension: sale_price { label: "Sale" } }')
+        sales = self.proj.resolveView('sales')
+        order_items = lookml.File(os.path.join(root, 'kitchenSink/kitchenSink.model.lkml')).views.order_items
+        self.assertEqual(sorted(f.name for f in sales.fields()), sorted(f.name for f in order_items.fields()))
+        self.assertEqual(sales.sale_price.label.value, 'Sale')
+        self.assertEqual(sales.sale_price.sql.value, '${TABLE}.sale_price')
+        self.assertEqual(sales.id.hidden.value, 'yes')
+        #editing the extending view parses that file alone and keeps order_items memoized
+        with open(os.path.join(root, 'kitchenSink/sales.view.lkml'), 'w') as tmp:
+            tmp.write('view: sales { extends: [order_items] dimension: sale_price { label: "Sales" } }')
+        with mock.patch('lkml.load', side_effect=lkml.load) as parse:
+            sales = self.proj.resolveView('sales')
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(sales.sale_price.label.value, 'Sales')
+        self.assertIn('order_items', self.proj.resolver._resolved)
+
+    def test_project_explores(self):
+        root = self.proj.gitControllerSession.absoluteOutputPath
+        with open(os.path.join(root, 'thelook/shop.model.lkml'), 'w') as tmp:
+            tmp.write('explore: shop { view_name: customers join: buyers { from: customers fields: [id] } }')
+        with open(os.path.join(root, 'thelook/customers.view.lkml'), 'w') as tmp:
+            tmp.write('view: customers { dimension: id {} dimension: email {} measure: count { type: count } }')
+        self.assertEqual(sorted(self.proj.exploreFields('shop')), ['buyers.id', 'customers.count', 'customers.email', 'customers.id'])
+        shop = self.proj.resolveExplore('shop')
+        self.assertEqual(shop.base_view.name, 'customers')
+        self.assertEqual(shop.buyers.to.name, 'customers')
+        #the view file changing is picked up, the model is not parsed again
+        with open(os.path.join(root, 'thelook/customers.view.lkml'), 'w') as tmp:
+            tmp.write('view: customers { dimension: id {} }')
+        with mock.patch('lkml.load', side_effect=lkml.load) as parse:
+            self.assertEqual(sorted(self.proj.exploreFields('shop')), ['buyers.id', 'customers.id'])
+        self.assertEqual(parse.call_count, 1)
+
+    def test_validate(self):
+        root = self.proj.gitControllerSession.absoluteOutputPath
+        shutil.rmtree(os.path.join(root, 'kitchenSink'))
+        shutil.rmtree(os.path.join(root, 'thelook'))
+        os.makedirs(os.path.join(root, 'views'))
+        with open(os.path.join(root, 'views/base.view.lkml'), 'w') as tmp:
+            tmp.write('view: base {\n  dimension: id {\n    sql: ${TABLE}.id ;;\n  }\n}\n')
+        with open(os.path.join(root, 'views/child.view.lkml'), 'w') as tmp:
+            tmp.write('view: child {\n  extends: [base]\n  dimension: total {\n    sql: ${id} + ${base.id} ;;\n  }\n  dimension: broken {\n    sql: ${base.nope} ;;\n  }\n}\n')
+        self.assertEqual([(p['file'], p['line'], p['reference']) for p in self.proj.validate()], [('views/child.view.lkml', 7, 'base.nope')])
+        with open(os.path.join(root, 'views/base.view.lkml'), 'w') as tmp:
+            tmp.write('view: base {\n  dimension: id {}\n  dimension: nope {}\n}\n')
+        self.assertEqual(self.proj.validate(), [])
+        #commented out lkml is not checked, a view_name explore refers to the view by its own name
+        with open(os.path.join(root, 'views/child.view.lkml'), 'w') as tmp:
+            tmp.write('view: child {\n  extends: [base]\n  # sql: ${gone} ;;\n  dimension: total { sql: ${id} # ${gone} stays sql\n ;; }\n}\n')
+        with open(os.path.join(root, 'shop.model.lkml'), 'w') as tmp:
+            tmp.write('explore: customers {\n  view_name: base\n  join: child {\n    sql_on: ${base.id} = ${child.id} ;;\n  }\n}\n'
+                '# explore: old { join: child { sql_on: ${old.x} ;; } }\n')
+        self.assertEqual([(p['file'], p['line'], p['reference']) for p in self.proj.validate()], [('views/child.view.lkml', 4, 'gone')])
+
+    def test_impact(self):
+        root = self.proj.gitControllerSession.absoluteOutputPath
+        shutil.rmtree(os.path.join(root, 'kitchenSink'))
+        shutil.rmtree(os.path.join(root, 'thelook'))
+        os.makedirs(os.path.join(root, 'views'))
+        for path, text in (
+                 ('views/users.view.lkml', 'view: users { dimension: id {} }')
+                ,('views/users_ext.view.lkml', 'view: users_ext { extends: [users] }')
+                ,('views/orders.view.lkml', 'view: orders { dimension: user_id { sql: ${users.id} ;; } }')
+                ,('views/lonely.view.lkml', 'view: lonely { dimension: id {} }')
+                ,('a.model.lkml', 'include: "/views/*.view"\nexplore: orders { join: users { sql_on: ${orders.user_id} = ${users.id} ;; } }\nexplore: lonely {}')
+                ,('b.model.lkml', 'include: "/views/lonely.view"\nexplore: lonely_b { from: lonely }')
+            ):
+            with open(os.path.join(root, path), 'w') as tmp:
+                tmp.write(text)
+        git = lambda *args: subprocess.run(['git', '-c', 'user.name=pylookml', '-c', 'user.email=pylookml@example.com'] + list(args), cwd=root, check=True, capture_output=True)
+        git('add', '-A')
+        git('commit', '-q', '-m', 'views')
+        with open(os.path.join(root, 'views/users.view.lkml'), 'w') as tmp:
+            tmp.write('view: users { dimension: id { primary_key: yes } }')
+        self.assertEqual(self.proj.impact(base='HEAD'), {
+             'views': ['orders', 'users', 'users_ext']
+            ,'explores': ['orders']
+            ,'models': ['a.model.lkml']})
+        git('commit', '-q', '-am', 'users')
+        self.assertEqual(self.proj.impact(base='HEAD~1', head='HEAD'), self.proj.impact(changed=['views/users.view.lkml']))
+        self.assertEqual(self.proj.impact(changed=['views/lonely.view.lkml']), {
+             'views': ['lonely']
+            ,'explores': ['lonely', 'lonely_b']
+            ,'models': ['a.model.lkml', 'b.model.lkml']})
+        #a deleted view is still reported, through the base revision
+        os.remove(os.path.join(root, 'views/users_ext.view.lkml'))
+        self.assertEqual(self.proj.impact(base='HEAD')['views'], ['users_ext'])
+
+    def test_project_expanded_sql(self):
+        root = self.proj.gitControllerSession.absoluteOutputPath
+        shutil.rmtree(os.path.join(root, 'kitchenSink'))
+        shutil.rmtree(os.path.join(root, 'thelook'))
+        with open(os.path.join(root, 'users.view.lkml'), 'w') as tmp:
+            tmp.write('view: users { sql_table_name: db.users ;; dimension: fee { sql: ${TABLE}.fee ;; } }')
+        with open(os.path.join(root, 'orders.view.lkml'), 'w') as tmp:
+            tmp.write('view: base_orders { dimension: price { sql: ${TABLE}.price ;; } }\n'
+                'view: orders { extends: [base_orders] dimension: gross { sql: ${price} + ${users.fee} ;; } measure: total { type: sum sql: ${gross} ;; } '
+                'dimension: a { sql: ${b} ;; } dimension: b { sql: ${a} ;; } }')
+        self.assertEqual(self.proj.expandedSql('orders.total'), 'SUM(orders.price + users.fee)')
+        expanded = dict(self.proj.expandAll())
+        self.assertEqual(expanded['users.fee'], 'users.fee')
+        self.assertEqual(expanded['orders.gross'], 'orders.price + users.fee')
+        self.assertTrue(expanded['orders.a'].startswith('circular reference'))
+        with open(os.path.join(root, 'users.view.lkml'), 'w') as tmp:
+            tmp.write('view: users { dimension: fee { sql: COALESCE(${TABLE}.fee, 0) ;; } }')
+        self.assertEqual(self.proj.expandedSql('orders.total'), 'SUM(orders.price + (COALESCE(users.fee, 0)))')
+
+    def test_included_files(self):
+        root = self.proj.gitControllerSession.absoluteOutputPath
+        os.makedirs(os.path.join(root, 'shared/deep'))
+        with open(os.path.join(root, 'thelook/extra.view.lkml'), 'w') as tmp:
+            tmp.write('include: "/shared/**/*.view"\nview: extra { dimension: id {} }')
+        with open(os.path.join(root, 'shared/deep/common.view.lkml'), 'w') as tmp:
+            tmp.write('view: common { dimension: id {} }')
+        model = 'thelook/thelook.model.lkml'
+        self.assertEqual(self.proj.includedFiles(model), ['shared/deep/common.view.lkml', 'thelook/extra.view.lkml',
+            'thelook/order_items.view.lkml', 'thelook/order_items_extended.view.lkml'])
+        self.assertEqual(self.proj.includedFiles('kitchenSink/kitchenSink.model.lkml'), [])
+        #answered from the cache, nothing is listed or parsed again
+        with mock.patch('lkml.load', side_effect=AssertionError('parsed again')), mock.patch('os.walk', side_effect=AssertionError('listed again')):
+            self.assertIn('shared/deep/common.view.lkml', self.proj.includedFiles(model))
+        #deleting through the project drops the cached closures
+        self.proj.delete(os.path.join(root, 'shared/deep/common.view.lkml'))
+        self.assertNotIn('shared/deep/common.view.lkml', self.proj.includedFiles(model))
+        with open(os.path.join(root, 'thelook/more.view.lkml'), 'w') as tmp:
+            tmp.write('view: more {}')
+        self.assertNotIn('thelook/more.view.lkml', self.proj.includedFiles(model))
+        self.assertIn('thelook/more.view.lkml', self.proj.invalidateIncludes().includedFiles(model))
+
+    def test_project_rename(self):
+        root = self.proj.gitControllerSession.absoluteOutputPath
+        session = self.proj.gitControllerSession
+        before = {p: open(p).read() for p in self.proj.paths()}
+        with mock.patch.object(session, 'commit', wraps=session.commit) as commit:
+            written = self.proj.rename('order_items.sale_price', 'order_items.price')
+        after = {p: open(p).read() for p in self.proj.paths()}
+        #only the files which changed are written, as one commit
+        self.assertEqual(sorted(written), sorted(os.path.relpath(p, root) for p in before if before[p] != after[p]))
+        self.assertIn('kitchenSink/kitchenSink.model.lkml', written)
+        self.assertEqual(commit.call_count, 1)
+        #nothing but the names changed, comments and layout are kept
+        for p in before:
+            self.assertEqual(after[p].replace('sale_price', 'price'), before[p].replace('sale_price', 'price'))
+        order_items = lookml.File(os.path.join(root, 'kitchenSink/kitchenSink.model.lkml')).views.order_items
+        self.assertIn('price', order_items)
+        self.assertNotIn('sale_price', order_items)
+        self.assertEqual(order_items.gross_margin.sql.value, '${price} - ${inventory_items.cost}')
+        self.assertEqual(order_items.gross_margin.html.value, '{{price._value}}')
+        self.assertEqual(self.proj.index.whoReferences('order_items.sale_price'), [])
+        self.assertIn(('order_items.detail*', 'set'), [(r['source'], r['type']) for r in self.proj.index.whoReferences('order_items.price')])
+        #a view rename reaches extends, joins and qualified references, in files pylookml could not render back (always_filter) too
+        self.assertEqual(self.proj.index.filesReferencingView('users'), set(r['file'] for target in list(self.proj.index.referencedBy) if target.split('.')[0] == 'users' for r in self.proj.index.whoReferences(target)))
+        written = self.proj.rename('users', 'customers')
+        self.assertIn('thelook/thelook.model.lkml', written)
+        self.assertEqual(self.proj.index.whoReferences('users.id'), [])
+        self.assertEqual(self.proj.index.filesReferencingView('users'), set())
+        self.assertIn(('order_items.customers', 'sql_on'), [(r['source'], r['type']) for r in self.proj.index.whoReferences('customers.id')])
+
+    def test_rename_keeps_text(self):
+        root = self.proj.gitControllerSession.absoluteOutputPath
+        shutil.rmtree(os.path.join(root, 'kitchenSink'))
+        shutil.rmtree(os.path.join(root, 'thelook'))
+        view = (
+            '# owner: finance\n'
+            'view: payments {\n'
+            '  # the amount in cents\n'
+            '  dimension: amount_cents {\n'
+            '    type: number\n'
+            '    sql: ${TABLE}.amount ;;   # raw column\n'
+            '  }\n'
+            '  measure: total { type: sum  sql: ${amount_cents} / 100.0 ;; drill_fields: [amount_cents, payments.amount_cents] }\n'
+            '}\n')
+        model = 'explore: payments {\n    join: refunds { sql_on: ${payments.amount_cents} = ${refunds.amount} ;; }\n}\n'
+        with open(os.path.join(root, 'payments.view.lkml'), 'w') as tmp:
+            tmp.write(view)
+        with open(os.path.join(root, 'shop.model.lkml'), 'w') as tmp:
+            tmp.write(model)
+        self.proj.rename('payments.amount_cents', 'payments.cents')
+        with open(os.path.join(root, 'payments.view.lkml'), 'r') as tmp:
+            self.assertEqual(tmp.read(), view.replace('dimension: amount_cents', 'dimension: cents').replace('${amount_cents}', '${cents}').replace('[amount_cents, payments.amount_cents]', '[cents, payments.cents]'))
+        with open(os.path.join(root, 'shop.model.lkml'), 'r') as tmp:
+            self.assertEqual(tmp.read(), model.replace('${payments.amount_cents}', '${payments.cents}'))
+        #an explore named after a renamed view keeps reaching it through a view_name
+        self.proj.rename('payments', 'charges')
+        with open(os.path.join(root, 'shop.model.lkml'), 'r') as tmp:
+            self.assertEqual(tmp.read(), 'explore: payments {\n    view_name: charges\n    join: refunds { sql_on: ${charges.cents} = ${refunds.amount} ;; }\n}\n')
+        with open(os.path.join(root, 'payments.view.lkml'), 'r') as tmp:
+            self.assertTrue(tmp.read().startswith('# owner: finance\nview: charges {\n  # the amount in cents\n'))
+        #a file which changed since it was read stops the whole batch
+        texts = [('payments.view.lkml', 'view: x {}', 'not the sha'), ('shop.model.lkml', 'explore: x {}', self.proj._readText('shop.model.lkml')[1])]
+        with self.assertRaises(Exception):
+            self.proj._writeTexts(texts)
+        with open(os.path.join(root, 'shop.model.lkml'), 'r') as tmp:
+            self.assertIn('view_name: charges', tmp.read())
+
+    def test_github_rename_commits_once(self):
+        with mock.patch('github.Github'):
+            proj = lookml.Project(repo='org/repo', access_token='token', branch='main')
+        repo = proj.repo
+        repo.get_git_tree.return_value.tree = [mock.Mock(path='views/a.view.lkml', sha='a1'), mock.Mock(path='views/b.view.lkml', sha='b1')]
+        proj._writeTexts([('views/a.view.lkml', 'view: a {}', 'a1'), ('views/b.view.lkml', 'view: b {}', 'b1')])
+        repo.get_git_ref.assert_called_once_with('heads/main')
+        self.assertEqual(len(repo.create_git_tree.call_args[0][0]), 2)
+        repo.create_git_commit.assert_called_once()
+        repo.get_git_ref.return_value.edit.assert_called_once_with(repo.create_git_commit.return_value.sha)
+        repo.update_file.assert_not_called()
+        #a file changed on the branch since it was read: nothing is written
+        repo.reset_mock()
+        with self.assertRaises(Exception):
+            proj._writeTexts([('views/a.view.lkml', 'view: a {}', 'a1'), ('views/b.view.lkml', 'view: b {}', 'stale')])
+        repo.create_git_tree.assert_not_called()
+        repo.get_git_ref.return_value.edit.assert_not_called()
+
+class fakeGithubRepo:
+    '''
+        an in memory github repository answering the calls a github project makes. Every read has to name the
+        project's branch, a read left on the repository's default branch fails the test
+    '''
+    def __init__(self, branch, files):
+        self.branch = branch
+        self.files = dict(files)
+        self.commits = 0
+
+    def _onBranch(self, ref):
+        if ref != self.branch:
+            raise AssertionError('read %s instead of the branch %s' % (ref, self.branch))
+
+    def _blob(self, path):
+        data = self.files[path].encode('utf-8')
+        return mock.Mock(path=path, type='blob', sha=lookml.modules.cache.blobSha(data), content=base64.b64encode(data).decode('ascii'))
+
+    def get_git_tree(self, sha, recursive=False):
+        if sha != 'tree':
+            self._onBranch(sha)
+        assert recursive
+        return mock.Mock(tree=[self._blob(path) for path in sorted(self.files)])
+
+    def get_contents(self, path, ref=None):
+        self._onBranch(ref)
+        return self._blob(path)
+
+    def get_git_ref(self, name):
+        self._onBranch(name.replace('heads/', '', 1))
+        return mock.Mock(object=mock.Mock(sha='head'), edit=self._moveBranch)
+
+    def get_git_commit(self, sha):
+        return mock.Mock(tree=mock.Mock(sha='tree'))
+
+    def create_git_tree(self, elements, base):
+        self._pending = [element._identity for element in elements]
+        return mock.Mock()
+
+    def create_git_commit(self, message, tree, parents):
+        return mock.Mock(sha='commit')
+
+    def _moveBranch(self, sha):
+        for element in self._pending:
+            self.files[element['path']] = element['content']
+        self.commits += 1
+
+class testGithubProject(unittest.TestCase):
+    '''
+        Objective: exercise project level functions of a github project, against an in memory repository on a branch
+        which is not the default one, with lkml files nested in directories
+    '''
+
+    def setUp(self):
+        with mock.patch('github.Github'):
+            self.proj = lookml.Project(repo='org/repo', access_token='token', branch='dev')
+        self.proj.repo = fakeGithubRepo('dev', {
+             'views/users.view.lkml': 'view: users {\n  dimension: id {\n    sql: ${TABLE}.id ;;\n  }\n}\n'
+            ,'views/orders.view.lkml': 'view: orders {\n  dimension: user_id {\n    sql: ${users.id} ;;\n  }\n}\n'
+            ,'models/shop.model.lkml': 'include: "/views/*.view"\nexplore: orders {\n  join: users {\n    sql_on: ${orders.user_id} = ${users.id} ;;\n  }\n}\n'
+            ,'README.md': '# shop'
+        })
+
+    def test_index_nested_files(self):
+        index = self.proj.buildIndex()
+        self.assertEqual(sorted(index.files), ['models/shop.model.lkml', 'views/orders.view.lkml', 'views/users.view.lkml'])
+        self.assertEqual(sorted(set(r['file'] for r in index.whoReferences('users.id'))), ['models/shop.model.lkml', 'views/orders.view.lkml'])
+        #the tree read gives every blob sha, a changed nested file is the only one downloaded again
+        self.proj.repo.files['views/orders.view.lkml'] = 'view: orders {\n  dimension: user_id {}\n}\n'
+        with mock.patch('lkml.load', side_effect=lkml.load) as parse:
+            index = self.proj.buildIndex()
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual([r['file'] for r in index.whoReferences('users.id')], ['models/shop.model.lkml'])
+
+    def test_rename_nested_files(self):
+        written = self.proj.rename('users.id', 'users.user_id')
+        self.assertEqual(written, ['models/shop.model.lkml', 'views/orders.view.lkml', 'views/users.view.lkml'])
+        self.assertEqual(self.proj.repo.commits, 1)
+        files = self.proj.repo.files
+        self.assertIn('dimension: user_id {', files['views/users.view.lkml'])
+        self.assertIn('sql: ${users.user_id} ;;', files['views/orders.view.lkml'])
+        self.assertIn('sql_on: ${orders.user_id} = ${users.user_id} ;;', files['models/shop.model.lkml'])
+        self.assertEqual(files['README.md'], '# shop')
+        self.assertEqual(self.proj.index.whoReferences('users.id'), [])
+
+    def test_validate_nested_files(self):
+        self.assertEqual(self.proj.validate(), [])
+        self.proj.repo.files['views/orders.view.lkml'] = 'view: orders {\n  dimension: user_id {\n    sql: ${users.nope} ;;\n  }\n}\n'
+        self.assertEqual([(p['file'], p['line'], p['reference']) for p in self.proj.validate()], [('views/orders.view.lkml', 3, 'users.nope')])
+
+    def test_impact_nested_files(self):
+        self.proj.repo.files['views/lonely.view.lkml'] = 'view: lonely { dimension: id {} }'
+        self.assertEqual(self.proj.impact(changed=['views/users.view.lkml']), {
+             'views': ['orders', 'users']
+            ,'explores': ['orders']
+            ,'models': ['models/shop.model.lkml']})
+        self.assertEqual(self.proj.impact(changed=['views/lonely.view.lkml']), {'views': ['lonely'], 'explores': [], 'models': ['models/shop.model.lkml']})
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file